@@ -0,0 +1,400 @@
+"""
+In-process stand-ins for the OpenAI and Supabase clients.
+
+They implement just the surface the app uses, answer deterministically and can add
+artificial latency, so hot paths can be benchmarked without network access.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+from models.schemas import (
+    OrderExtraction,
+    ProductSearchExtraction,
+    DeriveToHumanExtraction,
+    ToolExecutor,
+    RoutingDecision,
+)
+
+EMBEDDING_DIM = 1536
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+DERIVE_PATTERN = re.compile(r"devol|reclam|dañad|comprar .*ahora|cambiar la direcci", re.IGNORECASE)
+ORDER_PATTERN = re.compile(r"pedido|orden|compra", re.IGNORECASE)
+
+
+def deterministic_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Unit-norm pseudo-random embedding derived from a hash of the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+def _last_user_message(messages: List[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+
+def _route(text: str) -> RoutingDecision:
+    """Keyword routing used to give the fake structured outputs plausible content"""
+    order_match = UUID_PATTERN.search(text)
+    if DERIVE_PATTERN.search(text):
+        tools = ["derive_to_human"]
+    elif order_match or ORDER_PATTERN.search(text):
+        tools = ["get_order_status"]
+    else:
+        tools = ["search_products"]
+    return RoutingDecision(
+        tools=tools,
+        has_order_id=order_match is not None,
+        order_id=order_match.group(0) if order_match else None,
+        needs_query="search_products" in tools,
+        query=text if "search_products" in tools else None,
+        derivation_reason="El usuario necesita ayuda humana" if "derive_to_human" in tools else None,
+    )
+
+
+def _parsed(response_format, messages: List[dict]):
+    decision = _route(_last_user_message(messages))
+    if response_format is RoutingDecision:
+        return decision
+    if response_format is ToolExecutor:
+        return ToolExecutor(tools=decision.tools)
+    if response_format is OrderExtraction:
+        return OrderExtraction(has_order_id=decision.has_order_id, order_id=decision.order_id)
+    if response_format is ProductSearchExtraction:
+        text = _last_user_message(messages)
+        return ProductSearchExtraction(needs_query=bool(text), query=text or None)
+    if response_format is DeriveToHumanExtraction:
+        return DeriveToHumanExtraction(reason=decision.derivation_reason or "El usuario necesita ayuda humana")
+    return response_format()
+
+
+def _usage(messages: List[dict], completion_tokens: int) -> SimpleNamespace:
+    prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class FakeOpenAI:
+    """
+    Fake of the synchronous OpenAI client.
+
+    `latency` seconds are slept before every call (for streams, before the first chunk, with
+    `token_latency` between chunks). Every call is appended to `calls` as (kind, model).
+    """
+
+    def __init__(self, latency: float = 0.0, token_latency: float = 0.0, dim: int = EMBEDDING_DIM,
+                 reply: str = "Claro, aquí tiene la **información** solicitada sobre su consulta."):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.dim = dim
+        self.reply = reply
+        self.calls: List[tuple] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=self._parse)))
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.models = SimpleNamespace(list=self._models)
+
+    def _sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        self.calls.append(("chat", model))
+        self._sleep(self.latency)
+        if stream:
+            return self._stream()
+        message = SimpleNamespace(content=self.reply, parsed=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, len(self.reply) // 4))
+
+    def _models(self, **kwargs):
+        self.calls.append(("models", None))
+        self._sleep(self.latency)
+        return SimpleNamespace(data=[SimpleNamespace(id=model) for model in ("gpt-4o", "text-embedding-ada-002")])
+
+    def _stream(self):
+        for token in re.findall(r"\S+\s*", self.reply):
+            self._sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+
+    def _parse(self, model: str, messages: List[dict], response_format, **kwargs):
+        self.calls.append(("parse", model))
+        self._sleep(self.latency)
+        message = SimpleNamespace(parsed=_parsed(response_format, messages), content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, 20))
+
+    def _embed(self, model: str, input, **kwargs):
+        self.calls.append(("embedding", model))
+        self._sleep(self.latency)
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(index=i, embedding=deterministic_embedding(text, self.dim)) for i, text in enumerate(texts)]
+        return SimpleNamespace(data=data, usage=SimpleNamespace(prompt_tokens=sum(len(t) for t in texts) // 4))
+
+
+class FakeAsyncOpenAI:
+    """Async counterpart of FakeOpenAI sharing its behaviour and call log"""
+
+    def __init__(self, sync: FakeOpenAI):
+        self.sync = sync
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=self._parse)))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    async def _sleep(self):
+        if self.sync.latency > 0:
+            await asyncio.sleep(self.sync.latency)
+
+    async def _create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        self.sync.calls.append(("chat", model))
+        await self._sleep()
+        if stream:
+            return self._stream()
+        message = SimpleNamespace(content=self.sync.reply, parsed=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, len(self.sync.reply) // 4))
+
+    async def _stream(self):
+        for chunk in self.sync._stream():
+            yield chunk
+
+    async def _parse(self, model: str, messages: List[dict], response_format, **kwargs):
+        self.sync.calls.append(("parse", model))
+        await self._sleep()
+        message = SimpleNamespace(parsed=_parsed(response_format, messages), content=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, 20))
+
+    async def _embed(self, model: str, input, **kwargs):
+        await self._sleep()
+        self.sync.calls.append(("embedding", model))
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(index=i, embedding=deterministic_embedding(text, self.sync.dim)) for i, text in enumerate(texts)]
+        return SimpleNamespace(data=data)
+
+
+def install_fake_openai(fake: FakeOpenAI):
+    """Point every module that imported the OpenAI clients at the fake"""
+    from utils.embedding_cache import embedding_cache
+    # Fake embeddings must never reach the on-disk cache that real runs read, nor real ones be served from it
+    embedding_cache.close()
+    embedding_cache.clear()
+    fake_async = FakeAsyncOpenAI(fake)
+    for name, module in list(sys.modules.items()):
+        if not name.split(".")[0] in ("tools", "services", "utils"):
+            continue
+        if hasattr(module, "client"):
+            module.client = fake
+        if hasattr(module, "async_client"):
+            module.async_client = fake_async
+
+
+class FakeTable:
+    """
+    Rows of one table plus an optional generator for computed columns.
+
+    `computed` maps a column name to a function of the row, used for columns such as
+    'embedding' that would be too large to keep materialized for big catalogs.
+    """
+
+    def __init__(self, rows: Optional[List[dict]] = None, computed: Optional[Dict[str, Callable[[dict], object]]] = None):
+        self.rows: List[dict] = rows or []
+        self.computed = computed or {}
+        self.by_id: Dict[str, dict] = {str(row["id"]): row for row in self.rows if "id" in row}
+
+    def add(self, row: dict) -> dict:
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        self.rows.append(row)
+        self.by_id[str(row["id"])] = row
+        return row
+
+
+class FakeQuery:
+    """Chainable query builder mirroring the subset of postgrest-py used by the app"""
+
+    def __init__(self, client: "FakeSupabase", table: FakeTable):
+        self.client = client
+        self.table = table
+        self.columns: Optional[List[str]] = None
+        self.filters: List[Callable[[dict], bool]] = []
+        self.id_lookup: Optional[List[str]] = None
+        self.order_by: Optional[str] = None
+        self.window: Optional[tuple] = None
+        self.action = "select"
+        self.payload = None
+
+    def select(self, columns: str = "*", **kwargs):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column: str, value):
+        if column == "id":
+            self.id_lookup = [str(value)]
+        else:
+            self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def in_(self, column: str, values: Iterable):
+        values = [str(v) for v in values]
+        if column == "id":
+            self.id_lookup = values
+        else:
+            allowed = set(values)
+            self.filters.append(lambda row: str(row.get(column)) in allowed)
+        return self
+
+    def ilike(self, column: str, pattern: str):
+        regex = re.compile("^" + re.escape(pattern).replace("%", ".*") + "$", re.IGNORECASE)
+        self.filters.append(lambda row: bool(regex.match(str(row.get(column) or ""))))
+        return self
+
+    def order(self, column: str, **kwargs):
+        self.order_by = column
+        return self
+
+    def range(self, start: int, end: int):
+        self.window = (start, end + 1)
+        return self
+
+    def limit(self, count: int):
+        self.window = (0, count)
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.action, self.payload = "upsert", payload
+        return self
+
+    def update(self, payload, **kwargs):
+        self.action, self.payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self.action = "delete"
+        return self
+
+    def execute(self):
+        self.client.requests += 1
+        if self.client.latency > 0:
+            time.sleep(self.client.latency)
+        if self.action in ("insert", "upsert"):
+            rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            data = []
+            for row in rows:
+                existing = self.table.by_id.get(str(row.get("id"))) if self.action == "upsert" else None
+                if existing is not None:
+                    existing.update(row)
+                    data.append(dict(existing))
+                else:
+                    data.append(dict(self.table.add(row)))
+            return self._response(data)
+
+        rows = self._matching_rows()
+        if self.action == "update":
+            for row in rows:
+                row.update(self.payload)
+            return self._response([dict(row) for row in rows])
+        if self.action == "delete":
+            doomed = {id(row) for row in rows}
+            self.table.rows = [row for row in self.table.rows if id(row) not in doomed]
+            self.table.by_id = {str(row["id"]): row for row in self.table.rows if "id" in row}
+            return self._response([])
+
+        if self.window:
+            rows = rows[self.window[0]:self.window[1]]
+        return self._response([self._project(row) for row in rows])
+
+    def _matching_rows(self) -> List[dict]:
+        if self.id_lookup is not None:
+            rows = [self.table.by_id[key] for key in self.id_lookup if key in self.table.by_id]
+        else:
+            rows = self.table.rows
+        for condition in self.filters:
+            rows = [row for row in rows if condition(row)]
+        if self.order_by:
+            # Tables are generated in id order; sorting them again would dominate large benchmarks
+            rows = rows if rows is self.table.rows else sorted(rows, key=lambda row: str(row.get(self.order_by)))
+        return rows
+
+    def _project(self, row: dict) -> dict:
+        if self.columns is None:
+            projected = dict(row)
+            for column, compute in self.table.computed.items():
+                projected[column] = compute(row)
+            return projected
+        return {
+            column: self.table.computed[column](row) if column in self.table.computed else row.get(column)
+            for column in self.columns
+        }
+
+    def _response(self, data: List[dict]) -> SimpleNamespace:
+        if self.client.count_bytes:
+            self.client.bytes_transferred += len(json.dumps(data, default=str))
+        return SimpleNamespace(data=data, count=None)
+
+
+class FakeSupabase:
+    """Fake Supabase client over in-memory tables; counts requests (and optionally response bytes)"""
+
+    def __init__(self, tables: Dict[str, FakeTable], latency: float = 0.0, count_bytes: bool = False):
+        self.tables = tables
+        self.latency = latency
+        self.count_bytes = count_bytes
+        self.requests = 0
+        self.bytes_transferred = 0
+
+    def table(self, name: str) -> FakeQuery:
+        if name not in self.tables:
+            self.tables[name] = FakeTable()
+        return FakeQuery(self, self.tables[name])
+
+
+def build_catalog(product_count: int, order_count: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> FakeSupabase:
+    """Fake database with a generated catalog whose embeddings are computed on demand"""
+    rng = np.random.default_rng(seed)
+    seed_names = ["Lámpara", "Auriculares", "Cargador", "Martillo", "Sartén", "Altavoz", "Almohada", "Rueda"]
+    products = [
+        {
+            "id": f"{i:08d}-0000-4000-8000-000000000000",
+            "name": f"{seed_names[i % len(seed_names)]} modelo {i}",
+            "description": f"Descripción del producto {i} de la categoría {seed_names[i % len(seed_names)].lower()}.",
+            "price": round(float(rng.uniform(5, 200)), 2),
+        }
+        for i in range(product_count)
+    ]
+    orders = []
+    statuses = ["Procesando", "Enviado", "Entregado", "Cancelado"]
+    for i in range(order_count):
+        picks = rng.integers(0, product_count, size=int(rng.integers(1, 5)))
+        orders.append({
+            "id": str(uuid.UUID(int=int(rng.integers(0, 2**63)) << 64 | i, version=4)),
+            "status": statuses[i % len(statuses)],
+            "estimated_delivery": "2025-01-15T00:00:00+00:00",
+            "order": [products[p]["id"] for p in picks],
+            "total_paid": 0.0,
+            "created_at": "2025-01-01T00:00:00+00:00",
+        })
+
+    embedding = lambda row: deterministic_embedding(f"{row['name']} {row['description']}", dim)
+    return FakeSupabase({
+        "products": FakeTable(products, computed={"embedding": embedding}),
+        "orders": FakeTable(orders),
+        "derivation_logs": FakeTable(),
+    })
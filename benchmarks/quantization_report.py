@@ -0,0 +1,94 @@
+"""
+Memory footprint and ranking agreement of the quantized product vector storage modes.
+
+For float32, float16 and int8 storage it reports resident bytes per product (next to what the same
+embedding costs as a Python list of floats), top-k overlap with the float32 ranking with and without
+full-precision re-ranking, and search latency. Usage:
+
+    python -m benchmarks.quantization_report --products 100000 --dim 1536
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import List, Optional
+import numpy as np
+from benchmarks.ann_recall import clustered_embeddings
+from services.ann_index import top_k
+from services.vector_store import STORAGE_MODES, VectorStore, quantize
+
+
+def python_list_bytes(dim: int) -> int:
+    """Heap cost of one embedding as returned by supabase-py: a list of `dim` float objects"""
+    return sys.getsizeof([0.0] * dim) + dim * sys.getsizeof(1.5)
+
+
+def search(vectors: VectorStore, query: np.ndarray, top_n: int, rerank_factor: int) -> np.ndarray:
+    if rerank_factor <= 1:
+        return top_k(vectors.scores(query), top_n)
+    candidates = np.sort(top_k(vectors.scores(query), top_n * rerank_factor))
+    return candidates[top_k(vectors.full_precision(candidates) @ query, top_n)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Memory and ranking agreement of float16/int8 embedding storage.")
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=1.0)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    matrix = clustered_embeddings(args.products, args.dim, args.clusters, args.spread, rng)
+    queries = matrix[rng.choice(args.products, args.queries, replace=False)]
+    queries = queries + args.spread / np.sqrt(args.dim) * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    baseline = VectorStore(matrix)
+    truth = [search(baseline, query, args.top_n, 1) for query in queries]
+    list_bytes = python_list_bytes(args.dim)
+
+    results = []
+    for storage in STORAGE_MODES:
+        vectors = VectorStore(*quantize(matrix, storage))
+        vectors.full = matrix
+        for rerank_factor in ([1] if storage == "float32" else [1, args.rerank_factor]):
+            found, timings = [], []
+            for query in queries:
+                start = time.perf_counter()
+                found.append(search(vectors, query, args.top_n, rerank_factor))
+                timings.append((time.perf_counter() - start) * 1000)
+            result = {
+                "storage": storage,
+                "rerank_factor": rerank_factor,
+                "bytes_per_product": vectors.nbytes / args.products,
+                "python_list_bytes_per_product": list_bytes,
+                "total_mb": vectors.nbytes / 2**20,
+                "overlap_at_k": statistics.fmean(len(set(a.tolist()) & set(b.tolist())) / args.top_n for a, b in zip(truth, found)),
+                "same_order": statistics.fmean(float(np.array_equal(a, b)) for a, b in zip(truth, found)),
+                "p50_ms": statistics.median(timings),
+            }
+            results.append(result)
+            print(
+                f"{storage:<8} rerank={rerank_factor} {result['bytes_per_product']:8.0f}B/product "
+                f"overlap@{args.top_n}={result['overlap_at_k']:.3f} same_order={result['same_order']:.3f} p50={result['p50_ms']:8.3f}ms",
+                file=sys.stderr,
+            )
+
+    payload = json.dumps({"meta": vars(args), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Offline benchmark suite for the chat pipeline.
+
+Runs search_products, BM25 keyword search, get_order_status, the tools/* LLM stages and a full process_turn against
+the fakes in benchmarks/fakes.py, and writes machine-readable JSON results. Usage:
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --max-regression 0.25
+"""
+import os
+
+# The real clients are created on first use; give them harmless settings in case anything reaches them
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "https://benchmark.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+import numpy as np
+from benchmarks.fakes import FakeOpenAI, build_catalog, install_fake_openai
+from services import product_index
+from services.chat_service import process_turn
+from services.order_service import get_order_status, invalidate_order_status
+from services.product_service import search_products, clear_product_cache
+from tools.tool_executor import tool_executor
+from tools.router import route_turn
+from tools.order_extractor import extract_order_id
+from tools.product_search_extractor import extract_product_query
+from tools.derivation_logger import log_derivation
+from utils.embedding_cache import embedding_cache
+
+DEFAULT_SIZES = "25,10000,1000000"
+LARGE_CATALOG = 100_000
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(name: str, fn: Callable[[int], object], iterations: int, warmup: int = 1, trace_memory: bool = True, **tags) -> dict:
+    """Time `fn(i)` over `iterations` calls, then run it once more under tracemalloc for peak memory"""
+    for i in range(warmup):
+        fn(-1 - i)
+
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    peak = 0
+    if trace_memory:
+        tracemalloc.start()
+        fn(iterations)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    result = {
+        "name": name,
+        **tags,
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": percentile(timings, 0.50),
+        "p95_ms": percentile(timings, 0.95),
+        "max_ms": max(timings),
+        "peak_alloc_kb": peak / 1024,
+    }
+    print(f"{name:<28} {str(tags):<40} p50={result['p50_ms']:9.3f}ms p95={result['p95_ms']:9.3f}ms peak={result['peak_alloc_kb']:10.1f}KB", file=sys.stderr)
+    return result
+
+
+def sample_history(text: str) -> List[dict]:
+    return [
+        {"role": "user", "content": "Hola, buenas tardes"},
+        {"role": "assistant", "content": "¡Hola! ¿En qué puedo ayudarle hoy?"},
+        {"role": "user", "content": text},
+    ]
+
+
+def bench_extractors(iterations: int) -> List[dict]:
+    order_history = sample_history("¿Dónde está mi pedido 3f2b8c1e-9a4d-4e2f-8b7a-1c2d3e4f5a6b?")
+    product_history = sample_history("Quiero iluminar mi sala con una lámpara")
+    derive_history = sample_history("Quiero devolver mi compra, llegó dañada")
+    return [
+        measure("tool_executor", lambda i: tool_executor(product_history), iterations),
+        measure("route_turn", lambda i: route_turn(order_history), iterations),
+        measure("extract_order_id", lambda i: extract_order_id(order_history), iterations),
+        measure("extract_product_query", lambda i: extract_product_query(product_history), iterations),
+        measure("log_derivation", lambda i: log_derivation(derive_history), iterations),
+    ]
+
+
+def bench_catalog(size: int, dim: int, order_count: int, iterations: int, seed: int) -> List[dict]:
+    supabase = build_catalog(size, order_count, dim=dim, seed=seed)
+    order_ids = [row["id"] for row in supabase.tables["orders"].rows]
+    rng = random.Random(seed)
+    tags = {"catalog_size": size, "dim": dim}
+    results = []
+
+    def load_index(i):
+        product_index.get_product_index(supabase, refresh=True)
+
+    # Loading is timed once; tracing allocations of a full load would take longer than the load itself
+    load = measure("product_index_load", load_index, 1, warmup=0, trace_memory=False, **tags)
+    load["index_matrix_kb"] = product_index.get_product_index(supabase).vectors.nbytes / 1024
+    results.append(load)
+
+    def search(i):
+        # Distinct queries so every call pays for an embedding, as uncached traffic would
+        embedding_cache.clear()
+        search_products(supabase, f"lámpara de escritorio {i}")
+
+    results.append(measure("search_products", search, iterations, **tags))
+
+    index = product_index.get_product_index(supabase)
+    results.append(measure("lexical_index_build", lambda i: product_index.ProductIndex(index.metadata, index.vectors).lexical, 1, warmup=0, trace_memory=False, **tags))
+    results.append(measure("lexical_search", lambda i: index.lexical_search(f"lámpara de escritorio {i}", 5), iterations, **tags))
+
+    def order_status_cold(i):
+        clear_product_cache()
+        invalidate_order_status()
+        get_order_status(supabase, rng.choice(order_ids))
+
+    def order_status_warm(i):
+        get_order_status(supabase, rng.choice(order_ids))
+
+    results.append(measure("get_order_status_cold", order_status_cold, iterations, **tags))
+    results.append(measure("get_order_status_warm", order_status_warm, iterations, **tags))
+
+    invalidate_order_status()
+
+    def turn(i):
+        history = sample_history(f"Busco auriculares inalámbricos {i}" if i % 2 else f"Estado del pedido {rng.choice(order_ids)}")
+        process_turn(supabase, history)
+
+    results.append(measure("process_turn", turn, iterations, **tags))
+    return results
+
+
+def compare(results: List[dict], baseline_path: str, max_regression: float) -> List[str]:
+    """Return a description of every benchmark whose p50 or peak memory regressed past the threshold"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def key(result):
+        return (result["name"], result.get("catalog_size"), result.get("dim"))
+
+    previous = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if not before:
+            continue
+        for metric in ("p50_ms", "peak_alloc_kb"):
+            if before[metric] > 0 and result[metric] > before[metric] * (1 + max_regression):
+                regressions.append(f"{result['name']} {key(result)[1:]} {metric}: {before[metric]:.3f} -> {result[metric]:.3f}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake OpenAI and Supabase clients.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated catalog sizes")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension for regular catalogs")
+    parser.add_argument("--large-dim", type=int, default=128, help=f"Embedding dimension for catalogs over {LARGE_CATALOG} products, to fit in memory")
+    parser.add_argument("--orders", type=int, default=10000, help="Orders in each generated catalog")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--openai-latency", type=float, default=0.0, help="Seconds of simulated latency per OpenAI call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="Previous JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative slowdown before failing")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    fake = FakeOpenAI(latency=args.openai_latency)
+    install_fake_openai(fake)
+
+    results = bench_extractors(args.iterations)
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        dim = args.large_dim if size > LARGE_CATALOG else args.dim
+        fake.dim = dim
+        results.extend(bench_catalog(size, dim, args.orders, args.iterations, args.seed))
+        product_index.invalidate_product_index()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "openai_latency": args.openai_latency,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
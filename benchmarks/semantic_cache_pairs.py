@@ -0,0 +1,102 @@
+"""
+Check of the semantic cache against paraphrases that should share an answer and near misses that must not.
+
+For every pair it reports whether the cache key (query terms) matches and, unless --terms-only, the cosine
+similarity of the real embeddings, the highest near-miss and lowest paraphrase similarity, and how many
+pairs SEMANTIC_CACHE_THRESHOLD gets wrong. Needs OPENAI_API_KEY for the embeddings. Usage:
+
+    python -m benchmarks.semantic_cache_pairs --output pairs.json
+    python -m benchmarks.semantic_cache_pairs --terms-only
+"""
+import argparse
+import json
+import logging
+import sys
+from typing import List, Optional, Tuple
+import numpy as np
+from utils.semantic_cache import normalize_message, query_terms, semantic_cache
+
+# Messages the cache may answer with each other's reply
+PARAPHRASES: List[Tuple[str, str]] = [
+    ("Busco auriculares rojos", "¿Tienen auriculares rojos?"),
+    ("Quiero una lámpara de escritorio", "lamparas de escritorio"),
+    ("Necesito un cargador inalámbrico", "¿Venden cargadores inalámbricos?"),
+    ("Hola, quisiera ver sartenes antiadherentes", "sartén antiadherente"),
+    ("auriculares con cancelación de ruido", "Busco unos auriculares con cancelación de ruido"),
+    ("¿Tienen almohadas de espuma?", "almohada de espuma"),
+]
+
+# Messages that look alike but ask for something else
+NEAR_MISSES: List[Tuple[str, str]] = [
+    ("auriculares rojos", "auriculares negros"),
+    ("lámpara de escritorio", "lámpara de pie"),
+    ("cargador con cable", "cargador sin cable"),
+    ("sartén de 24 cm", "sartén de 28 cm"),
+    ("auriculares inalámbricos", "altavoz inalámbrico"),
+    ("almohada para niños", "almohada para adultos"),
+]
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def check_pairs(pairs: List[Tuple[str, str]], same_answer: bool, embed=None) -> List[dict]:
+    results = []
+    for first, second in pairs:
+        result = {
+            "first": first,
+            "second": second,
+            "same_answer": same_answer,
+            "terms_match": query_terms(first) == query_terms(second),
+        }
+        if embed:
+            result["similarity"] = cosine(embed(normalize_message(first)), embed(normalize_message(second)))
+        results.append(result)
+        similarity = f"{result['similarity']:.4f}" if "similarity" in result else "-"
+        print(f"{'paraphrase' if same_answer else 'near miss':<10} terms_match={result['terms_match']!s:<5} sim={similarity:<6} {first!r} / {second!r}", file=sys.stderr)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Semantic cache key and threshold against paraphrases and near misses.")
+    parser.add_argument("--terms-only", action="store_true", help="Only check the query-term key, without embeddings")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    embed = None
+    if not args.terms_only:
+        from utils.openai_client import generate_query_embedding
+        embed = generate_query_embedding
+
+    results = check_pairs(PARAPHRASES, True, embed) + check_pairs(NEAR_MISSES, False, embed)
+    # A pair is handled correctly when a hit happens exactly for paraphrases
+    key_errors = [r for r in results if r["terms_match"] != r["same_answer"]]
+    summary = {"key_errors": len(key_errors)}
+    if embed:
+        threshold = semantic_cache.threshold
+        paraphrases = [r["similarity"] for r in results if r["same_answer"]]
+        near_misses = [r["similarity"] for r in results if not r["same_answer"]]
+        summary.update({
+            "threshold": threshold,
+            "min_paraphrase_similarity": min(paraphrases),
+            "max_near_miss_similarity": max(near_misses),
+            # Without the term key, near misses over the threshold would be served the wrong answer
+            "near_misses_over_threshold": sum(s >= threshold for s in near_misses),
+            "paraphrases_under_threshold": sum(s < threshold for s in paraphrases),
+        })
+    print(json.dumps(summary), file=sys.stderr)
+
+    payload = json.dumps({"summary": summary, "results": results}, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 1 if key_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Startup cost of the entry points and first-turn latency with and without background warm-up.
+
+Every measurement runs in a fresh interpreter, so nothing is already imported or cached:
+import time of main, server and the chat pipeline, import time of the packages now deferred
+until first use (openai, supabase, tiktoken) for reference, and the latency of the first
+product search turn against the offline fakes, cold and after warm_up(). Usage:
+
+    python -m benchmarks.startup --products 100000 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+ENTRY_POINTS = ["main", "server", "services.chat_service"]
+DEFERRED_PACKAGES = ["openai", "supabase", "tiktoken"]
+
+# Keep the children away from real services and on-disk caches
+CHILD_ENV = {
+    "OPENAI_API_KEY": "benchmark",
+    "SUPABASE_URL": "https://benchmark.supabase.co",
+    "SUPABASE_KEY": "benchmark",
+    "EMBEDDING_CACHE_PATH": "",
+    "ANN_INDEX_PATH": "",
+    "EMBEDDING_RERANK_PATH": "",
+    "DERIVATION_LOG_SPILL_PATH": "",
+}
+
+
+def run_child(code: str) -> float:
+    """Run `code` in a new interpreter; it must print a single number of seconds"""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env={**os.environ, **CHILD_ENV},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def import_time(module: str) -> float:
+    return run_child(f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)")
+
+
+def first_turn(products: int, latency: float, warmup: bool) -> float:
+    """Seconds for the first search turn of a fresh process; warm-up, when enabled, finishes first (the user is still typing)"""
+    code = f"""
+import time
+from benchmarks.fakes import FakeOpenAI, build_catalog, install_fake_openai
+from services.chat_service import process_turn
+from utils.chat_history import HistoryManager
+from utils.warmup import warm_up
+install_fake_openai(FakeOpenAI(latency={latency!r}))
+supabase = build_catalog({products}, 100, dim=1536, seed=0)
+if {warmup!r}:
+    warm_up(supabase)
+start = time.perf_counter()
+process_turn(supabase, [{{"role": "user", "content": "Busco una lámpara de escritorio"}}], history=HistoryManager())
+print(time.perf_counter() - start)
+"""
+    return run_child(code)
+
+
+def summarize(name: str, samples: List[float], **tags) -> dict:
+    return {
+        "name": name,
+        **tags,
+        "runs": len(samples),
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import time of the entry points and first-turn latency with and without warm-up.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--products", type=int, default=10_000, help="Offline catalog size for the first-turn measurement")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per OpenAI call")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = []
+    for module in ENTRY_POINTS:
+        results.append(summarize("import", [import_time(module) for _ in range(args.runs)], module=module))
+    for package in DEFERRED_PACKAGES:
+        try:
+            results.append(summarize("deferred_import", [import_time(package) for _ in range(args.runs)], module=package))
+        except subprocess.CalledProcessError:
+            print(f"{package} is not installed, skipping", file=sys.stderr)
+    for warmup in (False, True):
+        samples = [first_turn(args.products, args.latency, warmup) for _ in range(args.runs)]
+        results.append(summarize("first_turn", samples, warmup=warmup, catalog_size=args.products))
+
+    for result in results:
+        label = result.get("module") or ("warm" if result.get("warmup") else "cold")
+        print(f"{result['name']:<16} {label:<24} median {result['median_ms']:9.1f} ms", file=sys.stderr)
+
+    payload = json.dumps({"created_at": time.time(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
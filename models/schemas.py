@@ -13,4 +13,12 @@ class DeriveToHumanExtraction(BaseModel):
     reason: str
 
 class ToolExecutor(BaseModel):
-    tools: list[str]
\ No newline at end of file
+    tools: list[str]
+
+class RoutingDecision(BaseModel):
+    tools: list[str]
+    has_order_id: bool
+    order_id: Optional[str] = None
+    needs_query: bool
+    query: Optional[str] = None
+    derivation_reason: Optional[str] = None
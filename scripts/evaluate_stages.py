@@ -0,0 +1,187 @@
+"""
+Offline evaluation of the LLM stages per model.
+
+Runs a labeled conversation set through tool_executor, route_turn, the embedding intent
+classifier, extract_order_id, extract_product_query, log_derivation and the response generator
+with each candidate model, and reports accuracy next to p50/p95 latency, so STAGE_MODELS /
+MODEL_<STAGE> and ROUTER_MODE can be chosen with data. Each line of the input is
+{"id": "...", "messages": [...], "tools": ["get_order_status"], "order_id": "..." | null,
+ "query_terms": ["lampara"] | null}; query terms must appear (accents and case aside) in the
+extracted query. The model fallback is off unless --fallback is given, so each model is
+measured on its own.
+
+    python -m scripts.evaluate_stages --models gpt-4o-mini,gpt-4o --output stage_eval.json
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.ERROR,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+from scripts.replay_conversations import percentiles
+from services.chat_service import response_generator
+from services.lexical_index import fold
+from tools.derivation_logger import log_derivation
+from tools.intent_classifier import classify_intent
+from tools.order_extractor import extract_order_id
+from tools.product_search_extractor import extract_product_query
+from tools.router import route_turn
+from tools.tool_executor import tool_executor
+from utils import stage_models
+
+DEFAULT_INPUT = "scripts/data/stage_eval.jsonl"
+
+
+def read_examples(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def order_correct(has_order_id: bool, order_id: Optional[str], example: dict) -> bool:
+    expected = example.get("order_id")
+    if expected is None:
+        return not has_order_id
+    return has_order_id and (order_id or "").strip().lower() == expected.lower()
+
+
+def query_correct(query: Optional[str], example: dict) -> bool:
+    folded = fold(query or "")
+    return bool(folded) and all(fold(term) in folded for term in example.get("query_terms") or [])
+
+
+def classify_or_execute(messages: List[dict]) -> List[str]:
+    """Tool selection with ROUTER_MODE=embedding: the intent classifier, or the tool executor when it is unsure"""
+    decision = classify_intent(messages)
+    return decision.tools if decision is not None else tool_executor(messages)
+
+
+def route_correct(decision, example: dict) -> bool:
+    if set(decision.tools) != set(example["tools"]):
+        return False
+    if "get_order_status" in example["tools"] and not order_correct(decision.has_order_id, decision.order_id, example):
+        return False
+    return "search_products" not in example["tools"] or query_correct(decision.query, example)
+
+
+# stage -> (run on a conversation, whether an example applies, whether the result is correct; None = latency only)
+STAGES: Dict[str, tuple] = {
+    "tool_executor": (tool_executor, lambda example: True, lambda tools, example: set(tools) == set(example["tools"])),
+    "router": (route_turn, lambda example: True, route_correct),
+    "intent_classifier": (classify_or_execute, lambda example: True, lambda tools, example: set(tools) == set(example["tools"])),
+    "order_extractor": (
+        extract_order_id,
+        lambda example: "get_order_status" in example["tools"],
+        lambda result, example: order_correct(result.has_order_id, result.order_id, example),
+    ),
+    "product_search_extractor": (
+        extract_product_query,
+        lambda example: "search_products" in example["tools"],
+        lambda result, example: result.needs_query and query_correct(result.query, example),
+    ),
+    "derivation_logger": (
+        log_derivation,
+        lambda example: "derive_to_human" in example["tools"],
+        lambda result, example: bool(result.reason.strip()) and not result.reason.startswith("Error"),
+    ),
+    "response": (lambda messages: response_generator(messages, []), lambda example: True, None),
+}
+# Stages whose model is that of another stage; the intent classifier only calls the LLM through the tool executor
+MODEL_STAGES = {"intent_classifier": "tool_executor"}
+
+
+def evaluate(stage: str, model: str, examples: List[dict], runs: int) -> Optional[dict]:
+    run_stage, applies, is_correct = STAGES[stage]
+    selected = [example for example in examples if applies(example)]
+    if not selected:
+        return None
+
+    model_stage = MODEL_STAGES.get(stage, stage)
+    stage_models.STAGE_MODELS[model_stage] = model
+    fallbacks_before = stage_models.model_stats().get(model_stage, {}).get("fallbacks", 0)
+    latencies, correct, failures = [], 0, []
+    for _ in range(runs):
+        for example in selected:
+            start = time.perf_counter()
+            result = run_stage(example["messages"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            if is_correct is None:
+                continue
+            if is_correct(result, example):
+                correct += 1
+            else:
+                failures.append({"id": example["id"], "result": result})
+
+    total = len(selected) * runs
+    return {
+        "stage": stage,
+        "model": model,
+        "examples": len(selected),
+        "accuracy": correct / total if is_correct is not None else None,
+        "fallbacks": stage_models.model_stats().get(model_stage, {}).get("fallbacks", 0) - fallbacks_before,
+        "latency": percentiles(latencies),
+        "failures": failures,
+    }
+
+
+def print_table(results: List[dict]):
+    print(f"{'etapa':<26} {'modelo':<16} {'n':>4} {'precisión':>10} {'p50 ms':>9} {'p95 ms':>9} {'fallbacks':>9}", file=sys.stderr)
+    for result in results:
+        accuracy = f"{result['accuracy']:.1%}" if result["accuracy"] is not None else "-"
+        print(
+            f"{result['stage']:<26} {result['model']:<16} {result['examples']:>4} {accuracy:>10} "
+            f"{result['latency']['p50_ms']:>9.0f} {result['latency']['p95_ms']:>9.0f} {result['fallbacks']:>9}",
+            file=sys.stderr,
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Evalúa cada etapa LLM con varios modelos: precisión y latencia p50/p95.")
+    parser.add_argument("input", nargs="?", default=DEFAULT_INPUT, help="Archivo JSONL con conversaciones etiquetadas")
+    parser.add_argument("--models", default="gpt-4o-mini,gpt-4o", help="Modelos a comparar, separados por comas")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Etapas a evaluar, separadas por comas")
+    parser.add_argument("--runs", type=int, default=1, help="Repeticiones de cada conversación")
+    parser.add_argument("--fallback", action="store_true", help="Mantener el modelo de respaldo activo durante la evaluación")
+    parser.add_argument("--output", default=None, help="Archivo donde escribir el informe JSON (por defecto, la salida estándar)")
+    parser.add_argument("--offline", action="store_true", help="Usar los clientes falsos de benchmarks/ (solo para probar el script)")
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        from benchmarks.fakes import FakeOpenAI, install_fake_openai
+        install_fake_openai(FakeOpenAI())
+    if not args.fallback:
+        stage_models.FALLBACK_MODEL = ""
+
+    unknown = [stage for stage in args.stages.split(",") if stage not in STAGES]
+    if unknown:
+        parser.error(f"Etapas desconocidas: {', '.join(unknown)}")
+
+    examples = read_examples(args.input)
+    results = []
+    for stage in args.stages.split(","):
+        for model in args.models.split(","):
+            result = evaluate(stage, model.strip(), examples, args.runs)
+            if result is not None:
+                results.append(result)
+
+    print_table(results)
+    payload = json.dumps({"created_at": time.time(), "results": results}, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,22 @@
+"""
+Generate embeddings for the products whose name or description changed since the last run.
+
+Needs the embedding_hash column and the update_product_embeddings function from
+scripts/sql/update_product_embeddings.sql; run that file once in the Supabase SQL editor first.
+
+    python -m scripts.generate_embeddings --batch-size 100 --concurrency 4
+"""
+import argparse
+import hashlib
 import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict
 from openai import OpenAI
 from supabase import Client, create_client
 from dotenv import load_dotenv
 import os
+from utils.transport import call_openai, call_with_retry
 
 # Configure logging
 logging.basicConfig(
@@ -21,50 +35,108 @@ except Exception as e:
     logger.error(f"Error initializing clients: {e}")
     raise
 
-def generate_embedding(text: str) -> list[float]:
-    """Generate embedding for the given text"""
+EMBEDDING_MODEL = "text-embedding-ada-002"
+PAGE_SIZE = 1000  # PostgREST caps every response at 1000 rows by default
+SCHEMA_FILE = "scripts/sql/update_product_embeddings.sql"
+
+def product_text(product: Dict) -> str:
+    """Text that gets embedded for a product: name and description"""
+    return f"{product['name']} {product.get('description') or ''}"
+
+def content_hash(product: Dict) -> str:
+    """Hash of the embedded text, stored in products.embedding_hash to detect unchanged products"""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}:{product_text(product)}".encode("utf-8")).hexdigest()
+
+def check_schema() -> bool:
+    """Whether the embedding_hash column and update_product_embeddings function exist"""
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
-        )
-        return response.data[0].embedding
+        supabase.table("products").select("embedding_hash").limit(1).execute()
+        supabase.rpc("update_product_embeddings", {"rows": []}).execute()
+        return True
     except Exception as e:
-        logger.error(f"Error generating embedding for '{text[:30]}...': {e}")
+        logger.error(f"Falta el esquema de embeddings ({e}); ejecute {SCHEMA_FILE} en la base de datos")
+        return False
+
+def generate_embeddings(texts: List[str]) -> List[list[float]]:
+    """Generate embeddings for several texts with a single API request"""
+    try:
+        # Backs off on 429s; a whole batch is too expensive to hedge
+        response = call_openai("embedding", client.embeddings.create, hedge=False, model=EMBEDDING_MODEL, input=texts)
+        # The API may return items out of order, 'index' maps them back to the input
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    except Exception as e:
+        logger.error(f"Error generating embeddings for a batch of {len(texts)} texts: {e}")
         raise
 
+def fetch_products() -> List[Dict]:
+    """Fetch every product, paginating past the PostgREST row limit"""
+    products = []
+    start = 0
+    while True:
+        query = supabase.table("products").select("id, name, description, embedding_hash").order("id").range(start, start + PAGE_SIZE - 1)
+        page = call_with_retry("db", query.execute).data
+        products.extend(page)
+        if len(page) < PAGE_SIZE:
+            return products
+        start += PAGE_SIZE
+
+def embed_batch(batch: List[Dict]) -> int:
+    """
+    Embed a batch of products and write the results back with one bulk update.
+
+    Only embedding and embedding_hash are written, so edits made while the run is in progress are
+    never reverted; products whose text changed meanwhile are skipped. Returns the rows updated.
+    """
+    embeddings = generate_embeddings([product_text(product) for product in batch])
+    rows = [
+        {"id": str(product["id"]), "embedding": embedding, "embedding_hash": content_hash(product)}
+        for product, embedding in zip(batch, embeddings)
+    ]
+    updated = call_with_retry("db", supabase.rpc("update_product_embeddings", {"rows": rows}).execute).data
+    if updated < len(rows):
+        logger.warning(f"{len(rows) - updated} productos cambiaron durante la ejecución, se actualizarán en la próxima")
+    return updated
+
 def main():
     """Main function to generate and store embeddings"""
+    parser = argparse.ArgumentParser(description="Genera embeddings para los productos que cambiaron desde la última ejecución.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Productos por petición de embeddings")
+    parser.add_argument("--concurrency", type=int, default=4, help="Peticiones de embeddings simultáneas")
+    parser.add_argument("--force", action="store_true", help="Regenerar todos los embeddings aunque no hayan cambiado")
+    args = parser.parse_args()
+
+    if not check_schema():
+        sys.exit(1)
+
     try:
         logger.info("Iniciando generación de embeddings...")
-        
+
         # Obtener productos
-        products = supabase.table("products").select("id, name, description").execute().data
+        products = fetch_products()
         logger.info(f"Se encontraron {len(products)} productos")
-        
+
+        pending = [product for product in products if args.force or product.get("embedding_hash") != content_hash(product)]
+        skipped_count = len(products) - len(pending)
+        logger.info(f"{len(pending)} productos requieren embedding, {skipped_count} sin cambios")
+
+        batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
         success_count = 0
         error_count = 0
-        
-        for product in products:
-            try:
-                # Combine name and description for better semantic search
-                text = f"{product['name']} {product.get('description', '')}"
-                
-                # Generate embedding
-                embedding = generate_embedding(text)
-                
-                # Update product with embedding
-                supabase.table("products").update({"embedding": embedding}).eq("id", product["id"]).execute()
-                
-                success_count += 1
-                logger.info(f"Embedding generado para: {product['name']}")
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error al procesar producto {product.get('name', product.get('id'))}: {e}")
-        
-        logger.info(f"Proceso completado: {success_count} exitosos, {error_count} con errores")
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = {executor.submit(embed_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    success_count += future.result()
+                    logger.info(f"Embeddings generados: {success_count}/{len(pending)}")
+                except Exception as e:
+                    error_count += len(batch)
+                    logger.error(f"Error al procesar lote de {len(batch)} productos: {e}")
+
+        logger.info(f"Proceso completado: {success_count} exitosos, {skipped_count} sin cambios, {error_count} con errores")
     except Exception as e:
         logger.error(f"Error en el proceso principal: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,12 @@
 from supabase import create_client, Client
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from typing import List, Dict
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+import argparse
+import json
 import random
+import uuid
 import os
 import logging
 
@@ -15,10 +19,47 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Initialize the Supabase client
-supabase: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+# Hand-written catalog; larger catalogs are synthesized as variants of these products
+SEED_PRODUCTS = [
+    # Herramientas / Tools
+    {"name": "Destornillador Phillips", "description": "Destornillador de alta calidad con punta Phillips para trabajos de precisión.", "price": 8.99},
+    {"name": "Martillo de Carpintero", "description": "Martillo resistente con mango ergonómico para trabajos de construcción.", "price": 12.50},
+    {"name": "Llave Ajustable 8\"", "description": "Llave inglesa de acero inoxidable con ajuste preciso.", "price": 15.75},
+    {"name": "Set de Destornilladores (10 piezas)", "description": "Conjunto completo de destornilladores de precisión para todo tipo de proyectos.", "price": 24.99},
+    {"name": "Sierra Circular Eléctrica", "description": "Sierra potente para cortes precisos en madera y otros materiales.", "price": 89.99},
+    
+    # Accesorios para Coches / Car Accessories
+    {"name": "Rueda de Repuesto Universal", "description": "Rueda de emergencia compatible con múltiples modelos de vehículos.", "price": 45.99},
+    {"name": "Limpiaparabrisas Premium", "description": "Par de limpiaparabrisas de alta durabilidad resistentes a condiciones extremas.", "price": 22.50},
+    {"name": "Cubierta para Volante", "description": "Funda para volante de cuero sintético con diseño ergonómico.", "price": 18.25},
+    {"name": "Organizador para Maletero", "description": "Organizador plegable para mantener el maletero ordenado.", "price": 29.99},
+    {"name": "Cargador USB para Coche", "description": "Cargador rápido con dos puertos USB para dispositivos móviles.", "price": 14.50},
+    
+    # Iluminación / Lighting
+    {"name": "Lámpara de Escritorio LED", "description": "Lámpara moderna con luz ajustable y bajo consumo energético.", "price": 32.99},
+    {"name": "Lámpara de Pie Moderna", "description": "Elegante lámpara de pie con altura ajustable y luz cálida.", "price": 79.50},
+    {"name": "Tira de Luces LED 5m", "description": "Tira flexible de luces LED con control remoto y múltiples colores.", "price": 24.75},
+    {"name": "Bombilla Inteligente WiFi", "description": "Bombilla controlable desde el móvil compatible con asistentes de voz.", "price": 19.99},
+    {"name": "Lámpara Solar para Jardín", "description": "Conjunto de 4 lámparas solares para iluminación exterior.", "price": 34.50},
+    
+    # Electrónica / Electronics
+    {"name": "Auriculares Bluetooth", "description": "Auriculares inalámbricos con cancelación de ruido y gran autonomía.", "price": 59.99},
+    {"name": "Altavoz Portátil Resistente al Agua", "description": "Altavoz compacto con sonido 360° y resistencia IPX7.", "price": 45.75},
+    {"name": "Cargador Inalámbrico", "description": "Base de carga rápida compatible con todos los smartphones modernos.", "price": 29.99},
+    {"name": "Batería Externa 10000mAh", "description": "Powerbank de alta capacidad con carga rápida para múltiples dispositivos.", "price": 25.50},
+    {"name": "Adaptador HDMI a USB-C", "description": "Adaptador de alta velocidad para conectar dispositivos modernos a pantallas.", "price": 18.99},
+    
+    # Hogar / Home
+    {"name": "Set de Sartenes Antiadherentes", "description": "Conjunto de 3 sartenes de diferentes tamaños con recubrimiento premium.", "price": 64.99},
+    {"name": "Almohada Ergonómica", "description": "Almohada con espuma viscoelástica para un descanso óptimo.", "price": 39.50},
+    {"name": "Cafetera Programable", "description": "Cafetera automática con temporizador y función de mantener caliente.", "price": 55.75},
+    {"name": "Set de Cuchillos de Cocina", "description": "Conjunto profesional de 5 cuchillos con soporte de madera.", "price": 49.99},
+    {"name": "Robot Aspirador Inteligente", "description": "Aspirador automático con mapeo y control por aplicación móvil.", "price": 199.50},
+]
 
-def clear_tables():
+VARIANTS = ["Negro", "Blanco", "Gris", "Azul", "Rojo", "Compacto", "Pro", "XL", "Mini", "Eco", "Plus", "Edición 2024"]
+
+def clear_tables(supabase: Client):
     """Clear existing data from tables"""
     try:
         logger.info("Limpiando tablas existentes...")
@@ -30,145 +71,157 @@ def clear_tables():
         logger.error(f"Error al limpiar tablas: {e}")
         raise
 
-def generate_products() -> List[Dict]:
-    """Generate a diverse set of products in Spanish"""
-    return [
-        # Herramientas / Tools
-        {"name": "Destornillador Phillips", "description": "Destornillador de alta calidad con punta Phillips para trabajos de precisión.", "price": 8.99},
-        {"name": "Martillo de Carpintero", "description": "Martillo resistente con mango ergonómico para trabajos de construcción.", "price": 12.50},
-        {"name": "Llave Ajustable 8\"", "description": "Llave inglesa de acero inoxidable con ajuste preciso.", "price": 15.75},
-        {"name": "Set de Destornilladores (10 piezas)", "description": "Conjunto completo de destornilladores de precisión para todo tipo de proyectos.", "price": 24.99},
-        {"name": "Sierra Circular Eléctrica", "description": "Sierra potente para cortes precisos en madera y otros materiales.", "price": 89.99},
-        
-        # Accesorios para Coches / Car Accessories
-        {"name": "Rueda de Repuesto Universal", "description": "Rueda de emergencia compatible con múltiples modelos de vehículos.", "price": 45.99},
-        {"name": "Limpiaparabrisas Premium", "description": "Par de limpiaparabrisas de alta durabilidad resistentes a condiciones extremas.", "price": 22.50},
-        {"name": "Cubierta para Volante", "description": "Funda para volante de cuero sintético con diseño ergonómico.", "price": 18.25},
-        {"name": "Organizador para Maletero", "description": "Organizador plegable para mantener el maletero ordenado.", "price": 29.99},
-        {"name": "Cargador USB para Coche", "description": "Cargador rápido con dos puertos USB para dispositivos móviles.", "price": 14.50},
-        
-        # Iluminación / Lighting
-        {"name": "Lámpara de Escritorio LED", "description": "Lámpara moderna con luz ajustable y bajo consumo energético.", "price": 32.99},
-        {"name": "Lámpara de Pie Moderna", "description": "Elegante lámpara de pie con altura ajustable y luz cálida.", "price": 79.50},
-        {"name": "Tira de Luces LED 5m", "description": "Tira flexible de luces LED con control remoto y múltiples colores.", "price": 24.75},
-        {"name": "Bombilla Inteligente WiFi", "description": "Bombilla controlable desde el móvil compatible con asistentes de voz.", "price": 19.99},
-        {"name": "Lámpara Solar para Jardín", "description": "Conjunto de 4 lámparas solares para iluminación exterior.", "price": 34.50},
-        
-        # Electrónica / Electronics
-        {"name": "Auriculares Bluetooth", "description": "Auriculares inalámbricos con cancelación de ruido y gran autonomía.", "price": 59.99},
-        {"name": "Altavoz Portátil Resistente al Agua", "description": "Altavoz compacto con sonido 360° y resistencia IPX7.", "price": 45.75},
-        {"name": "Cargador Inalámbrico", "description": "Base de carga rápida compatible con todos los smartphones modernos.", "price": 29.99},
-        {"name": "Batería Externa 10000mAh", "description": "Powerbank de alta capacidad con carga rápida para múltiples dispositivos.", "price": 25.50},
-        {"name": "Adaptador HDMI a USB-C", "description": "Adaptador de alta velocidad para conectar dispositivos modernos a pantallas.", "price": 18.99},
-        
-        # Hogar / Home
-        {"name": "Set de Sartenes Antiadherentes", "description": "Conjunto de 3 sartenes de diferentes tamaños con recubrimiento premium.", "price": 64.99},
-        {"name": "Almohada Ergonómica", "description": "Almohada con espuma viscoelástica para un descanso óptimo.", "price": 39.50},
-        {"name": "Cafetera Programable", "description": "Cafetera automática con temporizador y función de mantener caliente.", "price": 55.75},
-        {"name": "Set de Cuchillos de Cocina", "description": "Conjunto profesional de 5 cuchillos con soporte de madera.", "price": 49.99},
-        {"name": "Robot Aspirador Inteligente", "description": "Aspirador automático con mapeo y control por aplicación móvil.", "price": 199.50},
-    ]
-
-def insert_products(products: List[Dict]) -> List[str]:
-    """Insert products into database and return their IDs"""
+def generate_products(count: int = len(SEED_PRODUCTS), rng: Optional[random.Random] = None) -> Iterator[Dict]:
+    """Generate `count` products in Spanish: the seed catalog first, then priced variants of it"""
+    rng = rng or random.Random()
+    created_at = datetime.now(timezone.utc).isoformat()
+    for i in range(count):
+        base = SEED_PRODUCTS[i % len(SEED_PRODUCTS)]
+        if i < len(SEED_PRODUCTS):
+            product = dict(base)
+        else:
+            variant = rng.choice(VARIANTS)
+            product = {
+                "name": f"{base['name']} {variant} #{i // len(SEED_PRODUCTS)}",
+                "description": f"{base['description']} Versión {variant.lower()}.",
+                "price": round(base["price"] * rng.uniform(0.7, 1.5), 2),
+            }
+        product["created_at"] = created_at
+        yield product
+
+def batched(rows: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    """Split a stream of rows into lists of at most `size` rows"""
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def insert_products(supabase: Client, products: Iterable[Dict], batch_size: int = 1000) -> Tuple[List[str], List[float]]:
+    """Insert products in batches and return their IDs and prices, in insertion order"""
     product_ids = []
-    for product in products:
-        product["created_at"] = datetime.now(timezone.utc).isoformat()
+    prices = []
+    for batch in batched(products, batch_size):
         try:
-            response = supabase.table("products").insert(product).execute()
-            if response.data:
-                product_ids.append(response.data[0]["id"])
-                logger.info(f"Producto añadido: {product['name']}")
-            else:
-                logger.error(f"Error al insertar producto: {product}")
+            response = supabase.table("products").insert(batch).execute()
+            for row in response.data:
+                product_ids.append(row["id"])
+                prices.append(row["price"])
+            logger.info(f"Productos añadidos: {len(product_ids)}")
         except Exception as e:
-            logger.error(f"Error al insertar producto {product['name']}: {e}")
+            logger.error(f"Error al insertar lote de {len(batch)} productos: {e}")
     
-    return product_ids
+    return product_ids, prices
+
+def generate_orders(product_ids: List[str], prices: List[float], count: int = 15, rng: Optional[random.Random] = None) -> Iterator[Dict]:
+    """Generate varied orders with the products, computing totals from the known prices"""
+    rng = rng or random.Random()
+    now = datetime.now(timezone.utc)
 
-def generate_orders(product_ids: List[str]) -> List[Dict]:
-    """Generate varied orders with the products"""
     # Status options
     statuses = ["Procesando", "Enviado", "Entregado", "Cancelado"]
     weights = [0.3, 0.4, 0.2, 0.1]  # Probability weights
     
-    orders = []
-    for i in range(15):  # Create 15 orders
+    for i in range(count):
         # Select random products for this order (1-4 products)
-        order_products = random.sample(product_ids, random.randint(1, 4))
-        
-        # Calculate total based on selected products
-        total = 0
-        for product_id in order_products:
-            try:
-                response = supabase.table("products").select("price").eq("id", product_id).execute()
-                if response.data:
-                    total += response.data[0]["price"]
-            except Exception as e:
-                logger.error(f"Error al obtener precio del producto {product_id}: {e}")
+        indices = rng.sample(range(len(product_ids)), min(len(product_ids), rng.randint(1, 4)))
+        order_products = [product_ids[j] for j in indices]
         
         # Add random shipping cost (5-15)
-        shipping = round(random.uniform(5, 15), 2)
-        total = round(total + shipping, 2)
+        shipping = round(rng.uniform(5, 15), 2)
+        total = round(sum(prices[j] for j in indices) + shipping, 2)
         
         # Select random status with weighted probability
-        status = random.choices(statuses, weights=weights, k=1)[0]
+        status = rng.choices(statuses, weights=weights, k=1)[0]
         
         # Set created_at date (1-30 days ago)
-        days_ago = random.randint(1, 30)
-        created_at = datetime.now(timezone.utc) - timedelta(days=days_ago)
+        days_ago = rng.randint(1, 30)
+        created_at = now - timedelta(days=days_ago)
         
         # Set estimated delivery based on status
         if status == "Procesando":
-            est_delivery = created_at + timedelta(days=random.randint(5, 10))
+            est_delivery = created_at + timedelta(days=rng.randint(5, 10))
         elif status == "Enviado":
-            est_delivery = created_at + timedelta(days=random.randint(2, 5))
+            est_delivery = created_at + timedelta(days=rng.randint(2, 5))
         elif status == "Entregado":
-            est_delivery = created_at + timedelta(days=random.randint(1, 3))
+            est_delivery = created_at + timedelta(days=rng.randint(1, 3))
             # Ensure delivery date is in the past
-            if est_delivery > datetime.now(timezone.utc):
-                est_delivery = datetime.now(timezone.utc) - timedelta(days=1)
+            if est_delivery > now:
+                est_delivery = now - timedelta(days=1)
         else:  # Canceled
             est_delivery = None
         
-        orders.append({
+        yield {
             "status": status,
             "estimated_delivery": est_delivery.isoformat() if est_delivery else None,
             "order": order_products,
             "total_paid": total,
             "created_at": created_at.isoformat()
-        })
-    
-    return orders
+        }
 
-def insert_orders(orders: List[Dict]):
-    """Insert orders into database"""
-    for i, order in enumerate(orders):
+def insert_orders(supabase: Client, orders: Iterable[Dict], batch_size: int = 1000) -> int:
+    """Insert orders into database in batches and return how many were inserted"""
+    inserted = 0
+    for batch in batched(orders, batch_size):
         try:
-            response = supabase.table("orders").insert(order).execute()
-            if response.data:
-                logger.info(f"Pedido {i+1} añadido con ID: {response.data[0]['id']}")
-            else:
-                logger.error(f"Error al insertar pedido {i+1}")
+            supabase.table("orders").insert(batch).execute()
+            inserted += len(batch)
+            logger.info(f"Pedidos añadidos: {inserted}")
         except Exception as e:
-            logger.error(f"Error al insertar pedido {i+1}: {e}")
+            logger.error(f"Error al insertar lote de {len(batch)} pedidos: {e}")
+    return inserted
+
+def write_fixture(output_dir: str, product_count: int, order_count: int, rng: random.Random) -> Tuple[int, int]:
+    """Write products.jsonl and orders.jsonl to `output_dir` instead of inserting into Supabase"""
+    os.makedirs(output_dir, exist_ok=True)
+    product_ids = []
+    prices = []
+    with open(os.path.join(output_dir, "products.jsonl"), "w", encoding="utf-8") as f:
+        for product in generate_products(product_count, rng):
+            product["id"] = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            product_ids.append(product["id"])
+            prices.append(product["price"])
+            f.write(json.dumps(product, ensure_ascii=False) + "\n")
+
+    orders_written = 0
+    with open(os.path.join(output_dir, "orders.jsonl"), "w", encoding="utf-8") as f:
+        for order in generate_orders(product_ids, prices, order_count, rng):
+            order["id"] = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            f.write(json.dumps(order, ensure_ascii=False) + "\n")
+            orders_written += 1
+    return len(product_ids), orders_written
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera productos y pedidos de prueba en Supabase o en un fixture local.")
+    parser.add_argument("--products", type=int, default=len(SEED_PRODUCTS), help="Número de productos a generar")
+    parser.add_argument("--orders", type=int, default=15, help="Número de pedidos a generar")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla para obtener datos reproducibles")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Filas por petición de inserción")
+    parser.add_argument("--output", default=None, help="Directorio donde escribir products.jsonl y orders.jsonl en lugar de Supabase")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
     try:
-        # Clear existing data
-        clear_tables()
-        
-        # Generate and insert products
-        products = generate_products()
-        product_ids = insert_products(products)
-        
-        if product_ids:
-            # Generate and insert orders
-            orders = generate_orders(product_ids)
-            insert_orders(orders)
-            
-            logger.info(f"\nBase de datos poblada exitosamente con {len(products)} productos y {len(orders)} pedidos!")
+        if args.output:
+            product_count, order_count = write_fixture(args.output, args.products, args.orders, rng)
+            logger.info(f"Fixture escrito en {args.output} con {product_count} productos y {order_count} pedidos")
         else:
-            logger.error("No se pudieron insertar productos. Proceso abortado.")
+            # Initialize the Supabase client
+            supabase: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+
+            # Clear existing data
+            clear_tables(supabase)
+            
+            # Generate and insert products
+            product_ids, prices = insert_products(supabase, generate_products(args.products, rng), args.batch_size)
+            
+            if product_ids:
+                # Generate and insert orders
+                order_count = insert_orders(supabase, generate_orders(product_ids, prices, args.orders, rng), args.batch_size)
+                
+                logger.info(f"\nBase de datos poblada exitosamente con {len(product_ids)} productos y {order_count} pedidos!")
+            else:
+                logger.error("No se pudieron insertar productos. Proceso abortado.")
     except Exception as e:
-        logger.error(f"Error durante la ejecución: {e}")
\ No newline at end of file
+        logger.error(f"Error durante la ejecución: {e}")
@@ -0,0 +1,313 @@
+"""
+Replay recorded conversations through the chat pipeline in bulk.
+
+Reads conversations from a JSONL file, one per line, either in chat format
+{"id": "...", "messages": [{"role": "user", "content": "..."}, ...]} or as
+{"id": "...", "turns": ["mensaje 1", "mensaje 2"]}. Every user message runs through the same
+aprocess_turn used by the server (tool selection, tools and response generation) with the
+conversation's generated replies as history. Conversations run concurrently; turns within a
+conversation run in order. Results are appended to the output JSONL as each turn finishes.
+Handoffs to a human are counted but not written to derivation_logs unless --write-derivations
+is given, so regression runs don't fill the handoff table with replayed cases.
+
+    python -m scripts.replay_conversations conversations.jsonl --output replay.jsonl --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+from services.chat_service import aprocess_turn, ERROR_RESPONSE
+from services.derivation_log_writer import set_derivation_log_writer
+from tools.fast_router import fast_router_stats
+from tools.intent_classifier import intent_classifier_stats
+from utils.chat_history import HistoryManager
+from utils.embedding_cache import embedding_cache
+from utils.semantic_cache import semantic_cache
+from utils.single_flight import single_flight_stats
+from utils.supabase_client import create_supabase_client
+from utils import tracing
+
+HISTORY_WINDOWING = os.getenv("HISTORY_WINDOWING", "true").lower() in ("1", "true", "yes")
+# Exception names that mean the provider is throttling us
+RATE_LIMIT_ERRORS = {"RateLimitError", "APITimeoutError", "InternalServerError"}
+
+
+def read_conversations(path: str) -> Iterator[Tuple[str, List[str], List[Optional[str]]]]:
+    """Yield (conversation id, user messages, recorded assistant replies) without loading the whole file"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Línea {line_number} inválida: {e}")
+                continue
+
+            conversation_id = str(record.get("id") or record.get("conversation_id") or line_number)
+            if "turns" in record:
+                yield conversation_id, [str(turn) for turn in record["turns"]], [None] * len(record["turns"])
+                continue
+
+            users, expected = [], []
+            for message in record.get("messages", []):
+                if message.get("role") == "user":
+                    users.append(message.get("content") or "")
+                    expected.append(None)
+                elif message.get("role") == "assistant" and expected and expected[-1] is None:
+                    expected[-1] = message.get("content")
+            yield conversation_id, users, expected
+
+
+class RateLimitGate:
+    """
+    Shared back-off for every worker.
+
+    When a turn hits a throttling error the gate closes for an exponentially growing, jittered
+    delay; workers wait on it before starting a turn, so the whole run slows down instead of
+    hammering the API. A successful turn resets the delay. An optional minimum interval between
+    turn starts paces the run below a known quota.
+    """
+
+    def __init__(self, min_interval: float = 0.0, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.min_interval = min_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._open_at = 0.0
+        self._next_start = 0.0
+        self._delay = base_delay
+        self.throttled = 0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            ready_at = max(self._open_at, self._next_start)
+            if now >= ready_at:
+                self._next_start = now + self.min_interval
+                return
+            await asyncio.sleep(ready_at - now)
+
+    def throttle(self):
+        self.throttled += 1
+        delay = self._delay * (0.5 + random.random() / 2)
+        self._open_at = max(self._open_at, asyncio.get_running_loop().time() + delay)
+        self._delay = min(self._delay * 2, self.max_delay)
+        logger.warning(f"Límite de peticiones alcanzado, pausando {delay:.1f}s")
+
+    def success(self):
+        self._delay = self.base_delay
+
+
+class StageCollector:
+    """Tracing listener grouping finished spans by trace, so each turn gets its own stage timings"""
+
+    def __init__(self):
+        self.by_trace = defaultdict(list)
+        self.durations = defaultdict(list)
+
+    def __call__(self, record: dict):
+        self.by_trace[record["trace_id"]].append(record)
+        self.durations[record["name"]].append(record["duration_ms"])
+
+    def pop(self, trace_id: str) -> List[dict]:
+        return self.by_trace.pop(trace_id, [])
+
+
+class DiscardingDerivationLog:
+    """Takes the derivation log writer's place during a replay: counts handoffs, writes nothing"""
+
+    def __init__(self):
+        self.logged = 0
+
+    def log(self, reason: str, conversation_id: Optional[str] = None) -> str:
+        self.logged += 1
+        return conversation_id or str(uuid.uuid4())
+
+    def close(self, timeout: float = 10.0):
+        pass
+
+    def stats(self) -> dict:
+        return {"queued": 0, "written": 0, "spilled": 0, "discarded": self.logged}
+
+
+def percentiles(values: List[float]) -> dict:
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": ordered[-1],
+    }
+
+
+async def replay_conversation(supabase, conversation, gate: RateLimitGate, collector: StageCollector, output, retries: int, totals: dict):
+    conversation_id, messages, expected = conversation
+    chat_history = []
+    history = HistoryManager() if HISTORY_WINDOWING else None
+    for turn_index, message in enumerate(messages):
+        chat_history.append({"role": "user", "content": message})
+        for attempt in range(retries + 1):
+            await gate.wait()
+            start = time.perf_counter()
+            with tracing.span("replay.turn", conversation_id=conversation_id, turn=turn_index) as root:
+                response, tool_results = await aprocess_turn(supabase, chat_history, history=history)
+            latency_ms = (time.perf_counter() - start) * 1000
+            spans = collector.pop(root.trace_id)
+            errors = sorted({record["error"] for record in spans if "error" in record})
+            # Only throttling backs off; other failures are recorded as errors without slowing the replay
+            throttled = RATE_LIMIT_ERRORS.intersection(errors)
+            if throttled and attempt < retries:
+                gate.throttle()
+                continue
+            gate.success()
+            break
+
+        chat_history.append({"role": "assistant", "content": response})
+        stages = defaultdict(float)
+        for record in spans:
+            if record["name"] != "replay.turn":
+                stages[record["name"]] += record["duration_ms"]
+        totals["turns"] += 1
+        totals["errors"] += 1 if response == ERROR_RESPONSE or errors else 0
+        totals["retries"] += attempt
+        output.write(json.dumps({
+            "conversation_id": conversation_id,
+            "turn": turn_index,
+            "user": message,
+            "tools": [tool_result["tool"] for tool_result in tool_results],
+            "response": response,
+            "expected": expected[turn_index],
+            "latency_ms": round(latency_ms, 3),
+            "stages": {name: round(ms, 3) for name, ms in stages.items()},
+            "errors": errors,
+            "retries": attempt,
+        }, ensure_ascii=False, default=str) + "\n")
+        output.flush()
+    totals["conversations"] += 1
+
+
+async def run(args) -> dict:
+    loop = asyncio.get_running_loop()
+    # Database calls run in threads via asyncio.to_thread; give every worker one
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency))
+
+    if args.offline:
+        from benchmarks.fakes import FakeOpenAI, build_catalog, install_fake_openai
+        install_fake_openai(FakeOpenAI(latency=args.offline_latency))
+        supabase = build_catalog(args.offline_products, args.offline_orders, dim=1536, seed=0)
+    else:
+        supabase = create_supabase_client()
+    derivations = None
+    if not args.write_derivations:
+        derivations = DiscardingDerivationLog()
+        set_derivation_log_writer(derivations)
+
+    # Spans are only needed in memory here, for per-turn stages and throttling detection
+    tracing.set_tracing(True, trace_file="")
+    collector = StageCollector()
+    tracing.add_listener(collector)
+    gate = RateLimitGate(min_interval=60.0 / args.max_turns_per_minute if args.max_turns_per_minute else 0.0)
+    totals = {"conversations": 0, "turns": 0, "errors": 0, "retries": 0}
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+
+    async def worker():
+        while True:
+            conversation = await queue.get()
+            if conversation is None:
+                return
+            try:
+                await replay_conversation(supabase, conversation, gate, collector, output, args.retries, totals)
+            except Exception as e:
+                logger.error(f"Error en la conversación {conversation[0]}: {e}")
+
+    start = time.perf_counter()
+    with open(args.output, "a" if args.append else "w", encoding="utf-8") as output:
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        for queued, conversation in enumerate(read_conversations(args.input)):
+            if args.limit and queued >= args.limit:
+                break
+            await queue.put(conversation)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - start
+    tracing.remove_listener(collector)
+
+    return {
+        **totals,
+        "elapsed_s": elapsed,
+        "turns_per_s": totals["turns"] / elapsed if elapsed else 0.0,
+        "conversations_per_s": totals["conversations"] / elapsed if elapsed else 0.0,
+        "throttled": gate.throttled,
+        "stages": {name: percentiles(values) for name, values in sorted(collector.durations.items())},
+        "fast_router": fast_router_stats(),
+        "intent_classifier": intent_classifier_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "single_flight": single_flight_stats(),
+        "derivations_discarded": derivations.logged if derivations else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reproduce conversaciones grabadas a través del pipeline y mide su rendimiento.")
+    parser.add_argument("input", help="Archivo JSONL con una conversación por línea")
+    parser.add_argument("--output", default="replay.jsonl", help="Archivo JSONL donde escribir un resultado por turno")
+    parser.add_argument("--append", action="store_true", help="Añadir al archivo de salida en lugar de sobrescribirlo")
+    parser.add_argument("--report", default=None, help="Archivo donde escribir el informe JSON (por defecto, la salida estándar)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversaciones procesadas a la vez")
+    parser.add_argument("--max-turns-per-minute", type=float, default=0, help="Ritmo máximo de turnos, 0 para no limitar")
+    parser.add_argument("--retries", type=int, default=3, help="Reintentos de un turno que alcanzó el límite de peticiones")
+    parser.add_argument("--limit", type=int, default=0, help="Número máximo de conversaciones, 0 para todas")
+    parser.add_argument("--write-derivations", action="store_true", help="Registrar las derivaciones en derivation_logs como en producción")
+    parser.add_argument("--offline", action="store_true", help="Usar los clientes falsos de benchmarks/ en lugar de OpenAI y Supabase")
+    parser.add_argument("--offline-latency", type=float, default=0.0, help="Latencia simulada por llamada a OpenAI en modo offline")
+    parser.add_argument("--offline-products", type=int, default=1000)
+    parser.add_argument("--offline-orders", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    print(
+        f"{report['turns']} turnos en {report['elapsed_s']:.1f}s ({report['turns_per_s']:.2f} turnos/s), "
+        f"{report['errors']} con errores, {report['retries']} reintentos",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+-- Schema required by scripts/generate_embeddings.py; run it once in the Supabase SQL editor (or psql)
+-- before the first run. It is idempotent, so it can be re-run after changing EMBEDDING_MODEL.
+
+-- Hash of the embedded text, so incremental runs skip unchanged products
+alter table products add column if not exists embedding_hash text;
+
+-- Bulk update that only touches the embedding columns
+create or replace function update_product_embeddings(rows jsonb) returns integer
+language sql as $$
+  with updated as (
+    update products p
+    set embedding = (r->>'embedding')::vector, embedding_hash = r->>'embedding_hash'
+    from jsonb_array_elements(rows) r
+    where p.id::text = r->>'id'
+      -- products renamed while the run was embedding them keep their old hash and are redone next run;
+      -- the text hashed here must match content_hash in generate_embeddings.py, model prefix included
+      and encode(sha256(convert_to('text-embedding-ada-002:' || p.name || ' ' || coalesce(p.description, ''), 'UTF8')), 'hex')
+          = r->>'embedding_hash'
+    returning 1
+  )
+  select count(*)::integer from updated
+$$;
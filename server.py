@@ -0,0 +1,216 @@
+from dotenv import load_dotenv
+from aiohttp import web, WSMsgType
+import asyncio
+import hmac
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Before the app imports: their settings are read from the environment at import time
+load_dotenv()
+
+from services.chat_service import aprocess_turn
+from services.derivation_log_writer import shutdown_derivation_log_writer
+from services.order_service import invalidate_order_status
+from services.product_index import refresh_product_index
+from services.session_store import SessionStore
+from utils.supabase_client import create_supabase_client
+from tools.fast_router import fast_router_stats
+from tools.intent_classifier import intent_classifier_stats
+from utils.embedding_cache import embedding_cache
+from utils.semantic_cache import semantic_cache
+from utils.tracing import span_stats
+from utils.single_flight import single_flight_stats
+from utils.stage_models import model_stats
+from utils.transport import transport_stats
+from utils.warmup import STARTUP_WARMUP, warm_up
+
+# Configure logging
+logging.basicConfig(
+    level=logging.ERROR,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Maximum number of turns processed at the same time across all sessions
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "100"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+HISTORY_WINDOWING = os.getenv("HISTORY_WINDOWING", "true").lower() in ("1", "true", "yes")
+# Shared secret expected in the X-Webhook-Secret header; the order webhook is disabled while unset
+ORDER_WEBHOOK_SECRET = os.getenv("ORDER_WEBHOOK_SECRET", "")
+# Same for the product webhook, which reloads the product index after catalog changes
+PRODUCT_WEBHOOK_SECRET = os.getenv("PRODUCT_WEBHOOK_SECRET", ORDER_WEBHOOK_SECRET)
+
+
+def _display_results(tool_results):
+    return [
+        {"tool": tool_result["tool"], "display_data": tool_result.get("display_data")}
+        for tool_result in tool_results
+        if tool_result["tool"] != "derive_to_human"
+    ]
+
+
+async def run_turn(app: web.Application, session_id, message: str, on_token=None) -> dict:
+    """Append the user message to the session, run the pipeline and store the reply"""
+    session = app["sessions"].get_or_create(session_id)
+    # Take the session lock first so a queued turn doesn't hold an in-flight slot while it waits
+    async with session.lock, app["in_flight"]:
+        turn_start = len(session.chat_history)
+        session.chat_history.append({"role": "user", "content": message})
+        try:
+            response, tool_results = await aprocess_turn(
+                app["supabase"], session.chat_history, on_token=on_token, history=session.history
+            )
+        except BaseException:
+            # A failed, cancelled or disconnected turn must not leave an unanswered message in the history
+            del session.chat_history[turn_start:]
+            raise
+        session.chat_history.append({"role": "assistant", "content": response})
+    return {"session_id": session.id, "response": response, "tool_results": _display_results(tool_results)}
+
+
+async def handle_chat(request: web.Request) -> web.Response:
+    try:
+        payload = await request.json()
+    except Exception:
+        return web.json_response({"error": "El cuerpo de la petición debe ser JSON."}, status=400)
+
+    message = (payload.get("message") or "").strip()
+    if not message:
+        return web.json_response({"error": "Se requiere un mensaje."}, status=400)
+
+    try:
+        result = await run_turn(request.app, payload.get("session_id"), message)
+        return web.json_response(result)
+    except Exception as e:
+        logger.error(f"Error processing chat request: {str(e)}")
+        return web.json_response({"error": "Lo siento, ocurrió un error. Por favor, inténtelo de nuevo."}, status=500)
+
+
+async def handle_websocket(request: web.Request) -> web.WebSocketResponse:
+    """Stream replies over a WebSocket; each client message is {"message": ..., "session_id": ...}"""
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    session_id = request.query.get("session_id")
+
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        try:
+            payload = msg.json()
+            message = (payload.get("message") or "").strip()
+            if not message:
+                await ws.send_json({"type": "error", "error": "Se requiere un mensaje."})
+                continue
+            session_id = payload.get("session_id") or session_id
+
+            async def send_token(token: str):
+                await ws.send_json({"type": "token", "content": token})
+
+            result = await run_turn(request.app, session_id, message, on_token=send_token)
+            session_id = result["session_id"]
+            await ws.send_json({"type": "done", **result})
+        except Exception as e:
+            logger.error(f"Error processing websocket message: {str(e)}")
+            await ws.send_json({"type": "error", "error": "Lo siento, ocurrió un error. Por favor, inténtelo de nuevo."})
+    return ws
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "sessions": len(request.app["sessions"])})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Per-stage aggregates of the tracing spans (empty unless TRACING_ENABLED is set), embedding and answer cache, fast router and intent classifier hit rates, retry/hedge and coalesced call counts and model fallbacks"""
+    return web.json_response({
+        "spans": span_stats(),
+        "fast_router": fast_router_stats(),
+        "intent_classifier": intent_classifier_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "transport": transport_stats(),
+        "single_flight": single_flight_stats(),
+        "models": model_stats(),
+    })
+
+
+def _reject_webhook(request: web.Request, secret: str):
+    """Return an error response unless the webhook is enabled and the request carries its secret"""
+    if not secret:
+        return web.json_response({"error": "Webhook deshabilitado."}, status=404)
+    if not hmac.compare_digest(request.headers.get("X-Webhook-Secret", ""), secret):
+        return web.json_response({"error": "No autorizado."}, status=401)
+    return None
+
+
+async def handle_order_webhook(request: web.Request) -> web.Response:
+    """
+    Invalidate cached order statuses after an order changes.
+
+    Accepts {"order_id": "..."} or a Supabase database webhook payload ({"record": {"id": ...}, ...}).
+    """
+    rejection = _reject_webhook(request, ORDER_WEBHOOK_SECRET)
+    if rejection:
+        return rejection
+    try:
+        payload = await request.json()
+    except Exception:
+        return web.json_response({"error": "El cuerpo de la petición debe ser JSON."}, status=400)
+
+    record = payload.get("record") or payload.get("old_record") or {}
+    order_id = payload.get("order_id") or record.get("id")
+    if not order_id:
+        return web.json_response({"error": "Se requiere order_id."}, status=400)
+    invalidate_order_status(str(order_id))
+    return web.json_response({"invalidated": str(order_id)})
+
+
+async def handle_product_webhook(request: web.Request) -> web.Response:
+    """
+    Reload the product index after the catalog changes; the payload is ignored.
+
+    The reload runs in the background and searches keep using the current index until it finishes.
+    """
+    rejection = _reject_webhook(request, PRODUCT_WEBHOOK_SECRET)
+    if rejection:
+        return rejection
+    started = refresh_product_index(request.app["supabase"])
+    return web.json_response({"refreshing": True, "started": started}, status=202)
+
+
+async def _configure_executor(app: web.Application):
+    # Blocking database calls run through asyncio.to_thread; size the pool to the in-flight bound
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT))
+
+
+async def _warm_up(app: web.Application):
+    # In the background, so the server starts accepting connections right away
+    if STARTUP_WARMUP:
+        app["warmup"] = asyncio.get_running_loop().run_in_executor(None, warm_up, app["supabase"])
+
+
+async def _flush_derivation_logs(app: web.Application):
+    await asyncio.to_thread(shutdown_derivation_log_writer)
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app["supabase"] = create_supabase_client()
+    app["sessions"] = SessionStore(max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, history_windowing=HISTORY_WINDOWING)
+    app["in_flight"] = asyncio.Semaphore(MAX_IN_FLIGHT)
+    app.on_startup.append(_configure_executor)
+    app.on_startup.append(_warm_up)
+    app.on_cleanup.append(_flush_derivation_logs)
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_get("/ws", handle_websocket)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_post("/webhooks/orders", handle_order_webhook)
+    app.router.add_post("/webhooks/products", handle_product_webhook)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=os.getenv("SERVER_HOST", "0.0.0.0"), port=int(os.getenv("SERVER_PORT", "8080")))
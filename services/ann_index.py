@@ -0,0 +1,180 @@
+import hashlib
+import logging
+import os
+from typing import Optional, Sequence
+import numpy as np
+from services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# "exact" scans every product; "ivf" probes the closest k-means clusters only
+ANN_BACKEND = os.getenv("ANN_BACKEND", "exact")
+# Catalogs smaller than this are always scanned exactly, the scan is already sub-millisecond
+ANN_MIN_PRODUCTS = int(os.getenv("ANN_MIN_PRODUCTS", "50000"))
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0"))  # 0 picks 4 * sqrt(n)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Built IVF indexes are saved here and reused while the catalog is unchanged; empty disables it
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "product_ivf.npz")
+
+ASSIGN_CHUNK = 65536  # rows scored against the centroids at a time, bounds temporary memory
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def catalog_fingerprint(ids: Sequence, vectors: VectorStore) -> str:
+    """
+    Identify a catalog by its product ids and stored vectors, so a stale saved index is never reused.
+
+    The vectors are part of it because re-embedded products keep their ids but move between clusters.
+    """
+    digest = hashlib.sha256(f"{len(ids)}x{vectors.dim}".encode("utf-8"))
+    for product_id in ids:
+        digest.update(str(product_id).encode("utf-8"))
+        digest.update(b"\0")
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        digest.update(np.ascontiguousarray(vectors.data[start:start + ASSIGN_CHUNK]))
+    if vectors.scales is not None:
+        digest.update(np.ascontiguousarray(vectors.scales))
+    return digest.hexdigest()
+
+
+class ExactSearch:
+    """Brute-force cosine search over every stored vector"""
+
+    name = "exact"
+
+    def search(self, vectors: VectorStore, query: np.ndarray, top_n: int) -> np.ndarray:
+        return top_k(vectors.scores(query), top_n)
+
+
+class IVFIndex:
+    """
+    Inverted file index with spherical k-means coarse quantization.
+
+    Products are grouped into `n_lists` clusters; a search scores the query against the centroids
+    and then scans only the `nprobe` closest clusters. Raising nprobe trades latency for recall.
+    The index stores row positions into the product vectors, not the vectors themselves.
+    """
+
+    name = "ivf"
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray, fingerprint: str = "", nprobe: int = IVF_NPROBE):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.fingerprint = fingerprint
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int = IVF_LISTS,
+        iterations: int = 10,
+        sample_size: Optional[int] = None,
+        seed: int = 0,
+        fingerprint: str = "",
+        nprobe: int = IVF_NPROBE,
+    ) -> "IVFIndex":
+        """Train centroids on a sample of the normalized matrix and assign every row to its closest one"""
+        n = len(matrix)
+        if n_lists <= 0:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, sample_size or 256 * n_lists)
+        sample = matrix[np.sort(rng.choice(n, sample_size, replace=False))] if sample_size < n else matrix
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                # Restart empty clusters from random sample points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assignment = cls._assign(matrix, centroids)
+        order = np.argsort(assignment, kind="stable").astype(np.int32)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=offsets[1:])
+        logger.info(f"Built IVF index with {n_lists} lists over {n} products")
+        return cls(centroids, order, offsets, fingerprint, nprobe)
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assignment = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), ASSIGN_CHUNK):
+            block = matrix[start:start + ASSIGN_CHUNK]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignment
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row positions in the clusters closest to the query"""
+        probes = top_k(self.centroids @ query, min(nprobe or self.nprobe, self.n_lists))
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+
+    def search(self, vectors: VectorStore, query: np.ndarray, top_n: int, nprobe: Optional[int] = None) -> np.ndarray:
+        rows = np.sort(self.candidates(query, nprobe))
+        return rows[top_k(vectors.scores(query, rows), top_n)]
+
+    def save(self, path: str):
+        # Write through a temporary file so a concurrent reader never sees a partial index
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, order=self.order, offsets=self.offsets, fingerprint=np.array(self.fingerprint))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = IVF_NPROBE) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"], str(data["fingerprint"]), nprobe)
+
+
+def build_backend(ids: Sequence, vectors: VectorStore, backend: str = ANN_BACKEND, path: str = ANN_INDEX_PATH):
+    """
+    Create the search backend configured for a catalog.
+
+    An IVF index is loaded from `path` when its fingerprint matches the catalog, otherwise it is
+    built and saved there. Small catalogs and unknown backends fall back to the exact scan.
+    """
+    if backend != "ivf" or len(ids) < ANN_MIN_PRODUCTS:
+        if backend not in ("exact", "ivf"):
+            logger.warning(f"Unknown ANN_BACKEND '{backend}', using exact search")
+        return ExactSearch()
+
+    fingerprint = catalog_fingerprint(ids, vectors)
+    if path and os.path.exists(path):
+        try:
+            index = IVFIndex.load(path)
+            if index.fingerprint == fingerprint:
+                logger.info(f"Loaded IVF index from {path}")
+                return index
+            logger.info("Saved IVF index belongs to a different catalog, rebuilding")
+        except Exception as e:
+            logger.error(f"Error loading IVF index from {path}: {str(e)}")
+
+    # k-means trains on full precision: the memmapped copy, or a temporary dequantized matrix
+    index = IVFIndex.build(vectors.full_precision(), fingerprint=fingerprint)
+    if path:
+        try:
+            index.save(path)
+        except Exception as e:
+            logger.error(f"Error saving IVF index to {path}: {str(e)}")
+    return index
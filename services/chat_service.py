@@ -0,0 +1,563 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional
+from models.schemas import OrderExtraction, ProductSearchExtraction, DeriveToHumanExtraction, RoutingDecision
+from tools.tool_executor import tool_executor, atool_executor
+from tools.router import route_turn, aroute_turn
+from tools.order_extractor import extract_order_id, aextract_order_id
+from tools.product_search_extractor import extract_product_query, aextract_product_query
+from tools.derivation_logger import log_derivation, alog_derivation
+from tools.fast_router import fast_route, find_order_id, strip_accents
+from tools.intent_classifier import EmbeddingRoutingDecision, classify_intent, aclassify_intent
+from services.derivation_log_writer import get_derivation_log_writer
+from services.order_service import get_order_status, order_cache_ttl
+from services.product_service import search_products, asearch_products
+from utils.openai_client import client, async_client, generate_query_embedding, agenerate_query_embedding
+from utils.concurrency import run_concurrently, TOOL_TIMEOUT
+from utils.chat_history import HistoryManager, stage_history
+from utils.semantic_cache import SEMANTIC_CACHE_ENABLED, normalize_message, query_terms, semantic_cache
+from utils.tracing import span
+from utils.stage_models import model_for
+from utils.transport import call_openai, acall_openai
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+# "multi" runs tool selection and each argument extractor as separate calls,
+# "single" asks the router for tools and arguments in one structured call,
+# "embedding" classifies the message against labeled prototypes and only asks the LLM when unsure
+ROUTER_MODE = os.getenv("ROUTER_MODE", "multi")
+# Rule-based routing for unambiguous messages (bare order IDs, greetings, returns) before asking the LLM
+FAST_ROUTER = os.getenv("FAST_ROUTER", "true").lower() in ("1", "true", "yes")
+
+def format_products(products):
+    """Format product data for better display"""
+    if isinstance(products, str):
+        return products
+    
+    if not products:
+        return "No se encontraron productos."
+    
+    result = f"Encontré {len(products)} productos que podrían interesarte:\n"
+    
+    for i, product in enumerate(products, 1):
+        result += f"• {product['name']} - {product['price']}€\n"
+        result += f"  {product['description']}\n"
+    
+    return result
+
+def format_order_status(order_data):
+    """Format order status data for better display"""
+    if isinstance(order_data, str):
+        return order_data
+    
+    result = f"Información del Pedido:\n"
+    result += f"Estado: {order_data.get('status', 'Desconocido')}\n"
+    
+    if order_data.get("estimated_delivery"):
+        # Format the date more nicely
+        est_delivery = order_data["estimated_delivery"].split("T")[0]
+        result += f"Entrega estimada: {est_delivery}\n"
+    
+    if order_data.get("products"):
+        result += f"Productos:\n"
+        for product in order_data["products"]:
+            result += f"• {product.get('name', 'Producto')}\n"
+    
+    return result
+
+DERIVATION_RESPONSE = "Para ayudarlo mejor, su conversación será transferida a un representante humano. Aguarde un momento."
+ERROR_RESPONSE = "Lo siento, estoy experimentando problemas técnicos. Por favor, inténtelo de nuevo más tarde."
+MISSING_ORDER_ID_MESSAGE = "Comunicale al usuario, que necesitamos un número de pedido para ayudarlo."
+TOOL_ERROR_MESSAGE = "Error al ejecutar la herramienta."
+
+def build_response_messages(chat_history: List[dict], tool_results: List[dict]) -> Optional[List[dict]]:
+    """Build the prompt for the response model, or return None when the turn is handed to a human"""
+    context = ""
+    for tool_result in tool_results:
+        # Format the data based on the tool type
+        if tool_result["tool"] == "search_products" and not isinstance(tool_result["data"], str):
+            formatted_data = f"Productos encontrados: {len(tool_result['data'])} productos"
+        elif tool_result["tool"] == "get_order_status" and not isinstance(tool_result["data"], str):
+            formatted_data = f"Estado del pedido: {tool_result['data'].get('status', 'Desconocido')}"
+        else:
+            formatted_data = tool_result["data"]
+            
+        context += f"{tool_result['tool']}: {formatted_data}\n"
+
+    logger.info(f"Context: {context}")
+
+    if "derive_to_human" in [tool_result["tool"] for tool_result in tool_results]:
+        return None
+    
+    return [
+        {"role": "system", "content": f"""
+            Eres un asistente virtual especializado en comercio electrónico llamado "VolantiBot". Tu personalidad es amigable, eficiente y ligeramente entusiasta sin ser abrumador.
+
+            CAPACIDADES:
+            - Informar sobre el estado de pedidos cuando el cliente proporciona un ID
+            - Buscar y recomendar productos del catálogo
+            - Responder preguntas generales sobre la tienda
+
+            LIMITACIONES:
+            - No puedes procesar compras
+            - No puedes modificar pedidos existentes
+            - No puedes gestionar devoluciones o reclamos sin ayuda humana
+            - No puedes proporcionar información técnica detallada sobre productos que no esten en el contexto proporcionado
+
+            INSTRUCCIONES ESPECÍFICAS:
+            - Si el usuario quiere saber el estado de un pedido, solicita el ID del pedido
+            - Al recomendar productos, destaca sus características principales
+            - Mantén un tono conversacional y cálido
+            - Usa un español formal pero accesible
+            - Sé conciso pero completo en tus respuestas
+            - Si el cliente pregunta algo fuera de tus capacidades, indícale que eso requiere asistencia humana
+            - Puedes usar formato markdown como **negrita** para enfatizar elementos importantes
+
+            CONTEXTO DISPONIBLE:
+            {context}
+        """}
+    ] + chat_history
+
+def response_generator(
+    chat_history: List[dict],
+    tool_results: List[dict],
+    on_token: Optional[Callable[[str], None]] = None,
+    timings: Optional[dict] = None,
+) -> str:
+    """
+    Generate the assistant's reply for this turn.
+
+    When `on_token` is given the completion is streamed and each text delta is passed to it
+    as it arrives; the full text is returned either way. If `timings` is given it is filled
+    with the time to first token and the total latency, in seconds.
+    """
+    start = time.perf_counter()
+    streamed = []
+    try:
+        messages = build_response_messages(chat_history, tool_results)
+        if messages is None:
+            if on_token:
+                on_token(DERIVATION_RESPONSE)
+            return DERIVATION_RESPONSE
+        
+        if not on_token:
+            completion = call_openai("response", client.chat.completions.create, model=model_for("response"), messages=messages)
+            _record_response_timings(timings, start, None, getattr(completion, "usage", None))
+            return completion.choices[0].message.content
+
+        first_token_at = None
+        usage = None
+        # Only opening the stream is retried; once tokens were shown a failure ends the reply
+        stream = call_openai(
+            "response",
+            client.chat.completions.create,
+            model=model_for("response"),
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            # With include_usage the last chunk carries token usage and no choices
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                streamed.append(delta)
+                on_token(delta)
+        _record_response_timings(timings, start, first_token_at, usage)
+        return "".join(streamed)
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        if timings is not None:
+            # Swallowed here, so the span would not record it; callers such as the replay throttle on it
+            timings["error"] = type(e).__name__
+        if streamed:
+            # Part of the answer was already shown, keep history consistent with what the user saw
+            return "".join(streamed)
+        if on_token:
+            on_token(ERROR_RESPONSE)
+        return ERROR_RESPONSE
+
+async def aresponse_generator(
+    chat_history: List[dict],
+    tool_results: List[dict],
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    timings: Optional[dict] = None,
+) -> str:
+    """Async variant of response_generator; `on_token` is awaited for each streamed delta"""
+    start = time.perf_counter()
+    streamed = []
+    try:
+        messages = build_response_messages(chat_history, tool_results)
+        if messages is None:
+            if on_token:
+                await on_token(DERIVATION_RESPONSE)
+            return DERIVATION_RESPONSE
+
+        if not on_token:
+            completion = await acall_openai("response", async_client.chat.completions.create, model=model_for("response"), messages=messages)
+            _record_response_timings(timings, start, None, getattr(completion, "usage", None))
+            return completion.choices[0].message.content
+
+        first_token_at = None
+        usage = None
+        stream = await acall_openai(
+            "response",
+            async_client.chat.completions.create,
+            model=model_for("response"),
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                streamed.append(delta)
+                await on_token(delta)
+        _record_response_timings(timings, start, first_token_at, usage)
+        return "".join(streamed)
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        if timings is not None:
+            timings["error"] = type(e).__name__
+        if streamed:
+            return "".join(streamed)
+        if on_token:
+            await on_token(ERROR_RESPONSE)
+        return ERROR_RESPONSE
+
+def _record_response_timings(timings: Optional[dict], start: float, first_token_at: Optional[float], usage=None):
+    total = time.perf_counter() - start
+    ttft = first_token_at - start if first_token_at is not None else None
+    logger.info(f"Response generated in {total:.3f}s (time to first token: {f'{ttft:.3f}s' if ttft is not None else 'n/a'})")
+    if timings is not None:
+        timings["time_to_first_token"] = ttft
+        timings["total"] = total
+        if usage is not None:
+            timings["prompt_tokens"] = getattr(usage, "prompt_tokens", 0)
+            timings["completion_tokens"] = getattr(usage, "completion_tokens", 0)
+
+def select_tools(chat_history: List[dict], history: Optional[HistoryManager] = None) -> tuple[list[str], Optional[RoutingDecision]]:
+    """
+    Pick the tools for this turn.
+
+    Returns the routing decision with the tool arguments when the fast router matched or
+    ROUTER_MODE is 'single'; otherwise the extractors run per tool.
+    """
+    start = time.perf_counter()
+    routing = fast_route(chat_history) if FAST_ROUTER else None
+    if routing is not None:
+        logger.info(f"Tool selection (fast) took {time.perf_counter() - start:.3f}s: {routing.tools}")
+        return routing.tools, routing
+    if ROUTER_MODE == "embedding":
+        routing = classify_intent(chat_history)
+        if routing is not None:
+            logger.info(f"Tool selection (embedding) took {time.perf_counter() - start:.3f}s: {routing.tools}")
+            return routing.tools, routing
+        # Below the confidence margin the LLM tool executor decides
+    if ROUTER_MODE == "single":
+        routing = route_turn(stage_history(chat_history, history, "router"))
+        tools = routing.tools
+    else:
+        routing = None
+        tools = tool_executor(stage_history(chat_history, history, "tool_executor"))
+    logger.info(f"Tool selection ({ROUTER_MODE}) took {time.perf_counter() - start:.3f}s: {tools}")
+    return tools, routing
+
+async def aselect_tools(chat_history: List[dict], history: Optional[HistoryManager] = None) -> tuple[list[str], Optional[RoutingDecision]]:
+    """Async variant of select_tools"""
+    start = time.perf_counter()
+    routing = fast_route(chat_history) if FAST_ROUTER else None
+    if routing is not None:
+        logger.info(f"Tool selection (fast) took {time.perf_counter() - start:.3f}s: {routing.tools}")
+        return routing.tools, routing
+    if ROUTER_MODE == "embedding":
+        routing = await aclassify_intent(chat_history)
+        if routing is not None:
+            logger.info(f"Tool selection (embedding) took {time.perf_counter() - start:.3f}s: {routing.tools}")
+            return routing.tools, routing
+        # Below the confidence margin the LLM tool executor decides
+    if ROUTER_MODE == "single":
+        routing = await aroute_turn(stage_history(chat_history, history, "router"))
+        tools = routing.tools
+    else:
+        routing = None
+        tools = await atool_executor(stage_history(chat_history, history, "tool_executor"))
+    logger.info(f"Tool selection ({ROUTER_MODE}) took {time.perf_counter() - start:.3f}s: {tools}")
+    return tools, routing
+
+def _routed_embedding(routing: Optional[RoutingDecision], query: str) -> Optional[list]:
+    """The embedding computed while routing, when it is the embedding of this exact query"""
+    if isinstance(routing, EmbeddingRoutingDecision) and routing.query == query:
+        return routing.query_embedding
+    return None
+
+def _order_status_result(order_status) -> dict:
+    display_data = format_order_status(order_status) if not isinstance(order_status, str) else order_status
+    return {"tool": "get_order_status", "data": order_status, "display_data": display_data}
+
+def _products_result(products) -> dict:
+    return {"tool": "search_products", "data": products, "display_data": format_products(products)}
+
+def execute_tool(
+    supabase: Client,
+    tool: str,
+    chat_history: List[dict],
+    routing: Optional[RoutingDecision] = None,
+    history: Optional[HistoryManager] = None,
+) -> Optional[dict]:
+    """Run a single tool, reusing the arguments from the routing decision when available"""
+    try:
+        if tool == "get_order_status":
+            if routing:
+                order_info = OrderExtraction(has_order_id=routing.has_order_id, order_id=routing.order_id)
+            else:
+                order_info = extract_order_id(stage_history(chat_history, history, "order_extractor"))
+            if order_info.has_order_id:
+                return _order_status_result(get_order_status(supabase, order_info.order_id))
+            return {"tool": "get_order_status", "data": MISSING_ORDER_ID_MESSAGE}
+
+        elif tool == "search_products":
+            if routing:
+                product_query = ProductSearchExtraction(needs_query=routing.needs_query, query=routing.query)
+            else:
+                product_query = extract_product_query(stage_history(chat_history, history, "product_query"))
+            if product_query.needs_query and product_query.query:
+                products = search_products(supabase, product_query.query, _routed_embedding(routing, product_query.query))
+            else:
+                products = search_products(supabase, None)
+            return _products_result(products)
+
+        elif tool == "derive_to_human":
+            if routing and routing.derivation_reason:
+                derivation_info = DeriveToHumanExtraction(reason=routing.derivation_reason)
+            else:
+                derivation_info = log_derivation(stage_history(chat_history, history, "derivation"))
+            get_derivation_log_writer(supabase).log(derivation_info.reason)
+            return {"tool": "derive_to_human", "data": derivation_info.reason}
+
+        logger.warning(f"Unknown tool requested: {tool}")
+        return None
+    except Exception as e:
+        logger.error(f"Error executing tool {tool}: {str(e)}")
+        return {"tool": tool, "data": TOOL_ERROR_MESSAGE}
+
+async def aexecute_tool(
+    supabase: Client,
+    tool: str,
+    chat_history: List[dict],
+    routing: Optional[RoutingDecision] = None,
+    history: Optional[HistoryManager] = None,
+) -> Optional[dict]:
+    """Async variant of execute_tool; blocking database calls run in worker threads"""
+    try:
+        if tool == "get_order_status":
+            if routing:
+                order_info = OrderExtraction(has_order_id=routing.has_order_id, order_id=routing.order_id)
+            else:
+                order_info = await aextract_order_id(stage_history(chat_history, history, "order_extractor"))
+            if order_info.has_order_id:
+                return _order_status_result(await asyncio.to_thread(get_order_status, supabase, order_info.order_id))
+            return {"tool": "get_order_status", "data": MISSING_ORDER_ID_MESSAGE}
+
+        elif tool == "search_products":
+            if routing:
+                product_query = ProductSearchExtraction(needs_query=routing.needs_query, query=routing.query)
+            else:
+                product_query = await aextract_product_query(stage_history(chat_history, history, "product_query"))
+            if product_query.needs_query and product_query.query:
+                products = await asearch_products(supabase, product_query.query, _routed_embedding(routing, product_query.query))
+            else:
+                products = await asearch_products(supabase, None)
+            return _products_result(products)
+
+        elif tool == "derive_to_human":
+            if routing and routing.derivation_reason:
+                derivation_info = DeriveToHumanExtraction(reason=routing.derivation_reason)
+            else:
+                derivation_info = await alog_derivation(stage_history(chat_history, history, "derivation"))
+            get_derivation_log_writer(supabase).log(derivation_info.reason)
+            return {"tool": "derive_to_human", "data": derivation_info.reason}
+
+        logger.warning(f"Unknown tool requested: {tool}")
+        return None
+    except Exception as e:
+        logger.error(f"Error executing tool {tool}: {str(e)}")
+        return {"tool": tool, "data": TOOL_ERROR_MESSAGE}
+
+def _traced_tool(supabase: Client, tool: str, chat_history: List[dict], routing: Optional[RoutingDecision], history: Optional[HistoryManager]) -> Optional[dict]:
+    with span(f"tool.{tool}"):
+        return execute_tool(supabase, tool, chat_history, routing, history)
+
+def execute_tools(
+    supabase: Client,
+    tools: List[str],
+    chat_history: List[dict],
+    routing: Optional[RoutingDecision] = None,
+    history: Optional[HistoryManager] = None,
+) -> List[dict]:
+    """Run the selected tools concurrently, keeping results in the order the tools were selected"""
+    start = time.perf_counter()
+    results = run_concurrently(
+        [lambda tool=tool: _traced_tool(supabase, tool, chat_history, routing, history) for tool in tools],
+        fallback=lambda i: {"tool": tools[i], "data": TOOL_ERROR_MESSAGE},
+    )
+    logger.info(f"Executed {len(tools)} tools in {time.perf_counter() - start:.3f}s")
+    return [result for result in results if result]
+
+async def aexecute_tools(
+    supabase: Client,
+    tools: List[str],
+    chat_history: List[dict],
+    routing: Optional[RoutingDecision] = None,
+    history: Optional[HistoryManager] = None,
+) -> List[dict]:
+    """Async variant of execute_tools, each tool bounded by TOOL_TIMEOUT"""
+    async def run(tool: str) -> Optional[dict]:
+        try:
+            with span(f"tool.{tool}"):
+                return await asyncio.wait_for(aexecute_tool(supabase, tool, chat_history, routing, history), TOOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Tool {tool} timed out after {TOOL_TIMEOUT}s")
+            return {"tool": tool, "data": TOOL_ERROR_MESSAGE}
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run(tool) for tool in tools))
+    logger.info(f"Executed {len(tools)} tools in {time.perf_counter() - start:.3f}s")
+    return [result for result in results if result]
+
+def process_turn(
+    supabase: Client,
+    chat_history: List[dict],
+    on_token: Optional[Callable[[str], None]] = None,
+    history: Optional[HistoryManager] = None,
+) -> tuple[str, List[dict]]:
+    """
+    Run one conversation turn for the last user message in `chat_history`.
+
+    Returns the assistant's reply and the tool results; the caller owns `chat_history`
+    and decides when to append the reply to it. With a HistoryManager, every LLM stage
+    receives its own token-budgeted window of the conversation. With SEMANTIC_CACHE_ENABLED,
+    a near-duplicate of an earlier question is answered from the cache without chat completions.
+    """
+    with span("turn", router_mode=ROUTER_MODE, messages=len(chat_history)):
+        cache_key = None
+        if SEMANTIC_CACHE_ENABLED:
+            with span("semantic_cache.lookup") as stage:
+                cache_key, context, order_id = _semantic_cache_key(chat_history)
+                cached = semantic_cache.lookup(generate_query_embedding(cache_key), context) if cache_key else None
+                stage.set("hit", cached is not None)
+            if cached:
+                if on_token:
+                    on_token(cached["response"])
+                return cached["response"], cached["tool_results"]
+        if history:
+            with span("history.compact"):
+                history.compact(chat_history)
+        with span("select_tools") as stage:
+            tools_to_execute, routing = select_tools(chat_history, history)
+            stage.set("tools", tools_to_execute)
+        with span("execute_tools"):
+            tool_results = execute_tools(supabase, tools_to_execute, chat_history, routing, history)
+        with span("response_generator", streaming=on_token is not None, model=model_for("response")) as stage:
+            timings = {}
+            response = response_generator(stage_history(chat_history, history, "response"), tool_results, on_token=on_token, timings=timings)
+            _record_response_span(stage, timings)
+        if cache_key and _is_cacheable(tools_to_execute, tool_results, order_id, timings):
+            # The lookup embedding is served from the embedding cache
+            semantic_cache.store(generate_query_embedding(cache_key), context, tools_to_execute, response, tool_results, order_id, _answer_ttl(tool_results))
+    return response, tool_results
+
+async def aprocess_turn(
+    supabase: Client,
+    chat_history: List[dict],
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    history: Optional[HistoryManager] = None,
+) -> tuple[str, List[dict]]:
+    """Async variant of process_turn"""
+    with span("turn", router_mode=ROUTER_MODE, messages=len(chat_history)):
+        cache_key = None
+        if SEMANTIC_CACHE_ENABLED:
+            with span("semantic_cache.lookup") as stage:
+                cache_key, context, order_id = _semantic_cache_key(chat_history)
+                cached = semantic_cache.lookup(await agenerate_query_embedding(cache_key), context) if cache_key else None
+                stage.set("hit", cached is not None)
+            if cached:
+                if on_token:
+                    await on_token(cached["response"])
+                return cached["response"], cached["tool_results"]
+        if history:
+            with span("history.compact"):
+                await history.acompact(chat_history)
+        with span("select_tools") as stage:
+            tools_to_execute, routing = await aselect_tools(chat_history, history)
+            stage.set("tools", tools_to_execute)
+        with span("execute_tools"):
+            tool_results = await aexecute_tools(supabase, tools_to_execute, chat_history, routing, history)
+        with span("response_generator", streaming=on_token is not None, model=model_for("response")) as stage:
+            timings = {}
+            response = await aresponse_generator(stage_history(chat_history, history, "response"), tool_results, on_token=on_token, timings=timings)
+            _record_response_span(stage, timings)
+        if cache_key and _is_cacheable(tools_to_execute, tool_results, order_id, timings):
+            semantic_cache.store(await agenerate_query_embedding(cache_key), context, tools_to_execute, response, tool_results, order_id, _answer_ttl(tool_results))
+    return response, tool_results
+
+def _semantic_cache_key(chat_history: List[dict]) -> tuple[Optional[str], tuple, Optional[str]]:
+    """
+    Normalized last user message, the context that must match exactly on a hit, and the order ID it mentions.
+
+    The context is the order ID, the message's query terms and a digest of the earlier user messages,
+    so "auriculares negros" never reuses the answer for "auriculares rojos", and a follow-up such as
+    "¿Tienen otras más baratas?" or "gracias" is only answered from a conversation that led up to it
+    the same way, never from another customer's.
+    """
+    user_messages = [m.get("content") or "" for m in chat_history if m.get("role") == "user"]
+    message = user_messages[-1] if user_messages else ""
+    order_id = find_order_id(strip_accents(message))
+    earlier = hashlib.sha256("\n".join(map(normalize_message, user_messages[:-1])).encode("utf-8")).hexdigest()
+    return normalize_message(message) or None, (order_id, query_terms(message), earlier), order_id
+
+def _is_cacheable(tools: List[str], tool_results: List[dict], order_id: Optional[str], timings: dict) -> bool:
+    """Only complete answers that the message alone determines are reused"""
+    # Responses that failed midway never record their total time
+    if "derive_to_human" in tools or "total" not in timings:
+        return False
+    for tool_result in tool_results:
+        if tool_result["data"] == TOOL_ERROR_MESSAGE:
+            return False
+        if tool_result["tool"] == "get_order_status":
+            # The order must be the one named in the message, not one recalled from earlier turns
+            data = tool_result["data"]
+            if not order_id or isinstance(data, str) or str(data.get("id")) != order_id:
+                return False
+    return True
+
+def _answer_ttl(tool_results: List[dict]) -> Optional[float]:
+    """An order status answer is reused no longer than the order itself is cached"""
+    ttls = [order_cache_ttl(tool_result["data"]) for tool_result in tool_results if tool_result["tool"] == "get_order_status"]
+    return min(ttls) if ttls else None
+
+def _record_response_span(stage, timings: dict):
+    if "error" in timings:
+        stage.set("error", timings["error"])
+    if timings.get("time_to_first_token") is not None:
+        stage.set("time_to_first_token_ms", round(timings["time_to_first_token"] * 1000, 3))
+    for key in ("prompt_tokens", "completion_tokens"):
+        if key in timings:
+            stage.add(key, timings[key])
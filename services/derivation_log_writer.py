@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, List, Optional
+from utils.tracing import span
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+DERIVATION_LOG_BATCH_SIZE = int(os.getenv("DERIVATION_LOG_BATCH_SIZE", "50"))
+DERIVATION_LOG_FLUSH_INTERVAL = float(os.getenv("DERIVATION_LOG_FLUSH_INTERVAL", "2.0"))
+DERIVATION_LOG_MAX_RETRIES = int(os.getenv("DERIVATION_LOG_MAX_RETRIES", "5"))
+# Entries that could not be written are appended here and re-sent once the database answers again
+DERIVATION_LOG_SPILL_PATH = os.getenv("DERIVATION_LOG_SPILL_PATH", "derivation_logs.spill.jsonl")
+
+_STOP = object()
+
+
+class DerivationLogWriter:
+    """
+    Background writer for the derivation_logs table.
+
+    `log()` only enqueues the entry, so handing a conversation to a human never waits on the
+    database. A worker thread inserts entries in batches of `batch_size` or every `flush_interval`
+    seconds, retrying failed inserts with jittered exponential backoff. Batches that still fail,
+    or entries arriving while the queue is full, are spilled to a JSONL file and re-sent after the
+    next successful insert. `close()` drains the queue before returning; once it is called failed
+    inserts are spilled instead of retried, and whatever the worker has not written when the
+    timeout expires is spilled by `close()` itself.
+    """
+
+    def __init__(
+        self,
+        supabase: Client,
+        batch_size: int = DERIVATION_LOG_BATCH_SIZE,
+        flush_interval: float = DERIVATION_LOG_FLUSH_INTERVAL,
+        max_retries: int = DERIVATION_LOG_MAX_RETRIES,
+        spill_path: Optional[str] = DERIVATION_LOG_SPILL_PATH,
+        max_queue: int = 10000,
+        base_delay: float = 0.5,
+    ):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self.base_delay = base_delay
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Entries the worker took off the queue (or the spill file) and has neither written nor spilled
+        self._held: List[dict] = []
+        self._held_lock = threading.Lock()
+        self._abandoned = False
+        self.written = 0
+        self.spilled = 0
+        self._thread = threading.Thread(target=self._run, name="derivation-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, reason: str, conversation_id: Optional[str] = None) -> str:
+        """Queue a derivation entry and return its conversation id"""
+        conversation_id = conversation_id or str(uuid.uuid4())
+        entry = {"reason": reason, "conversation_id": conversation_id}
+        try:
+            self._queue.put_nowait(entry)
+            logger.info(f"Derivation queued with ID: {conversation_id}, reason: {reason}")
+        except queue.Full:
+            logger.warning("Derivation log queue is full, spilling entry to disk")
+            self._spill([entry])
+        return conversation_id
+
+    def close(self, timeout: float = 10.0):
+        """Flush queued entries and stop the worker"""
+        if not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # The worker is stuck on the database and dies with the process; keep its entries on disk
+            logger.error("Derivation log writer did not finish flushing before the timeout, spilling pending entries")
+            with self._held_lock:
+                self._abandoned = True
+                pending, self._held = self._held, []
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not _STOP:
+                    pending.append(entry)
+            if pending:
+                self._spill(pending)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "spilled": self.spilled}
+
+    def _run(self):
+        self._resend_spilled()
+        while True:
+            batch = []
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                self._hold([entry])
+                batch.append(entry)
+
+            if batch and self._write(batch):
+                self._release(batch)
+                self._resend_spilled()
+            elif batch:
+                self._give_up(batch)
+
+            if stopping:
+                # Entries queued after the stop request are flushed as well
+                remaining = []
+                while not self._queue.empty():
+                    entry = self._queue.get_nowait()
+                    if entry is not _STOP:
+                        remaining.append(entry)
+                self._hold(remaining)
+                for start in range(0, len(remaining), self.batch_size):
+                    chunk = remaining[start:start + self.batch_size]
+                    if not self._write(chunk):
+                        # The database is down; spill the rest rather than wait on it chunk by chunk
+                        self._give_up(remaining[start:])
+                        break
+                    self._release(chunk)
+                return
+
+    def _write(self, batch: List[dict]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("db.derivation_logs", rows=len(batch), attempt=attempt):
+                    self.supabase.table("derivation_logs").insert(batch).execute()
+                self.written += len(batch)
+                logger.info(f"Wrote {len(batch)} derivation log entries")
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or self._stopping.is_set():
+                    logger.error(f"Failed to write {len(batch)} derivation log entries: {str(e)}")
+                    return False
+                delay = self.base_delay * (2 ** attempt) * (0.5 + random.random() / 2)
+                logger.warning(f"Error writing derivation logs (attempt {attempt + 1}), retrying in {delay:.1f}s: {str(e)}")
+                # close() cuts the backoff short; the batch is spilled instead of retried
+                if self._stopping.wait(delay):
+                    logger.error(f"Failed to write {len(batch)} derivation log entries before shutdown: {str(e)}")
+                    return False
+        return False
+
+    def _hold(self, entries: List[dict]):
+        with self._held_lock:
+            self._held.extend(entries)
+
+    def _release(self, entries: List[dict]):
+        """Forget entries that were written"""
+        written = {id(entry) for entry in entries}
+        with self._held_lock:
+            if self._abandoned:
+                logger.warning(f"{len(entries)} derivation log entries were written after close() spilled them; they will be sent again")
+            self._held = [entry for entry in self._held if id(entry) not in written]
+
+    def _give_up(self, entries: List[dict]):
+        """Spill entries that could not be written, unless close() already spilled everything held"""
+        failed = {id(entry) for entry in entries}
+        with self._held_lock:
+            if self._abandoned:
+                return
+            self._held = [entry for entry in self._held if id(entry) not in failed]
+        self._spill(entries)
+
+    def _spill(self, entries: List[dict]):
+        if not self.spill_path:
+            logger.error(f"Lost {len(entries)} derivation log entries: {entries}")
+            return
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self.spilled += len(entries)
+                logger.warning(f"Spilled {len(entries)} derivation log entries to {self.spill_path}")
+            except Exception as e:
+                logger.error(f"Lost {len(entries)} derivation log entries, spilling failed: {str(e)}")
+
+    def _resend_spilled(self):
+        """Send entries spilled by this or a previous process; entries that fail again stay in the file"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, encoding="utf-8") as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+                os.remove(self.spill_path)
+            except Exception as e:
+                logger.error(f"Error reading spilled derivation logs: {str(e)}")
+                return
+            self._hold(entries)
+        if entries:
+            logger.info(f"Re-sending {len(entries)} spilled derivation log entries")
+        for start in range(0, len(entries), self.batch_size):
+            chunk = entries[start:start + self.batch_size]
+            if not self._write(chunk):
+                self._give_up(entries[start:])
+                return
+            self._release(chunk)
+
+
+_writer: Optional[DerivationLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_derivation_log_writer(supabase: Client) -> DerivationLogWriter:
+    """Return the process-wide writer, starting it on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = DerivationLogWriter(supabase)
+                atexit.register(shutdown_derivation_log_writer)
+    return _writer
+
+
+def set_derivation_log_writer(writer) -> Optional[DerivationLogWriter]:
+    """Replace the process-wide writer, e.g. with one that discards entries during a replay; returns the previous one"""
+    global _writer
+    with _writer_lock:
+        previous, _writer = _writer, writer
+    return previous
+
+
+def shutdown_derivation_log_writer(timeout: float = 10.0):
+    """Flush pending derivation logs; call on shutdown (also registered with atexit)"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close(timeout)
@@ -0,0 +1,117 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Iterable, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset(
+    "a al algo algun alguna algunas alguno algunos ante con contra cual de del desde donde el ella ellas ellos en entre "
+    "era es esa esas ese eso esos esta estas este esto estos la las le les lo los me mi mis muy no nos o otra otro para "
+    "pero por que quiero busco sin sobre su sus tambien te tiene tu tus un una unas uno unos y ya yo".split()
+)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so 'Lámpara' and 'lampara' index the same"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """
+    Light Spanish stemmer (Savoy): strip plural endings, then a final gender vowel.
+
+    'lámparas', 'lámpara' -> 'lampar'; 'inalámbricos' -> 'inalambric'. Short words are left alone.
+    """
+    if len(word) <= 4:
+        return word
+    if word.endswith("ces"):
+        word = word[:-3] + "z"
+    elif word.endswith(("eses", "ones", "ores", "ares", "ales", "eres")):
+        word = word[:-2]
+    elif word.endswith("s") and word[-2] in "aeiou":
+        word = word[:-1]
+    if len(word) > 4 and word[-1] in "aoe":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Folded, stemmed terms; SKU-like tokens ('RTX-4090') are kept whole and also split into parts"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(fold(text or "")):
+        parts = token.split("-")
+        if len(parts) > 1 or any(c.isdigit() for c in token):
+            terms.append(token.replace("-", ""))
+            terms.extend(part for part in parts if len(parts) > 1 and part not in STOPWORDS)
+            continue
+        if token not in STOPWORDS:
+            terms.append(stem(token))
+    return terms
+
+
+class BM25Index:
+    """
+    Inverted index over product text scored with Okapi BM25.
+
+    Each term maps to arrays of document positions and their precomputed BM25 term weights
+    (everything but the IDF), so a query is a handful of vectorized scatter-adds.
+    """
+
+    def __init__(self, documents: Iterable[str], k1: float = 1.2, b: float = 0.75):
+        postings = defaultdict(lambda: defaultdict(int))
+        lengths = []
+        for position, text in enumerate(documents):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term in terms:
+                postings[term][position] += 1
+
+        self.size = len(lengths)
+        doc_lengths = np.asarray(lengths, dtype=np.float32)
+        average = float(doc_lengths.mean()) if self.size and doc_lengths.mean() > 0 else 1.0
+        self.postings = {}
+        self.idf = {}
+        for term, counts in postings.items():
+            docs = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            norm = k1 * (1 - b + b * doc_lengths[docs] / average)
+            self.postings[term] = (docs, tf * (k1 + 1) / (tf + norm))
+            self.idf[term] = math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+        logger.info(f"BM25 index built with {len(self.postings)} terms over {self.size} products")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                docs, weights = posting
+                scores[docs] += self.idf[term] * weights
+        return scores
+
+    def search(self, query: str, top_n: int) -> np.ndarray:
+        """Positions of the best matching documents, best first; documents without any query term are excluded"""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0 or top_n <= 0:
+            return matched[:0]
+        k = min(top_n, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], top_n: int, k: int = 60) -> List[int]:
+    """Merge ranked position lists by summing 1 / (k + rank) for each list a position appears in"""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, position in enumerate(ranking.tolist()):
+            fused[position] += 1.0 / (k + rank + 1)
+    return sorted(fused, key=lambda position: -fused[position])[:top_n]
@@ -1,44 +1,152 @@
+from __future__ import annotations
+
+import copy
 import logging
-from supabase import Client
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+from services.product_service import get_products_by_ids
+from utils.semantic_cache import semantic_cache
+from utils.single_flight import SingleFlight
+from utils.tracing import span
+from utils.transport import call_with_retry
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
-def get_order_status(supabase: Client, order_id: str):
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "5000"))
+# Seconds an order status is reused; orders still in progress change far more often than finished ones
+ORDER_CACHE_TTL_ACTIVE = float(os.getenv("ORDER_CACHE_TTL_ACTIVE", "60"))
+ORDER_CACHE_TTL_FINAL = float(os.getenv("ORDER_CACHE_TTL_FINAL", "3600"))
+ORDER_CACHE_TTLS = {
+    "Procesando": ORDER_CACHE_TTL_ACTIVE,
+    "Enviado": ORDER_CACHE_TTL_ACTIVE,
+    "Entregado": ORDER_CACHE_TTL_FINAL,
+    "Cancelado": ORDER_CACHE_TTL_FINAL,
+}
+
+# order id -> (expires_at, order)
+_order_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_order_cache_lock = threading.Lock()
+_order_fetches = SingleFlight("order_status")
+# Bumped by invalidate_order_status; a fetch started before an invalidation must not cache what it read.
+# The epoch covers invalidating every order, and lets the per-order counters be dropped when they pile up.
+_order_generations: "dict[str, int]" = {}
+_order_epoch = 0
+
+def get_order_status(supabase: Client, order_id: str, use_product_cache: bool = True, use_cache: bool = True):
     try:
         if not order_id:
             logger.warning("Attempted to get order status with empty order_id")
             return "Se requiere un número de pedido válido."
-            
-        response = supabase.table("orders").select("*").eq("id", order_id).execute()
-        order = response.data
 
-        if order:
+        if use_cache:
+            cached = _cached_order(str(order_id))
+            if cached is not None:
+                logger.info(f"Order {order_id} served from cache")
+                return cached
+
+        # A customer and a support agent checking the same order at once share one database read;
+        # lookups after an invalidation start a new one rather than joining a read of the old status
+        generation = _order_generation(str(order_id))
+        order = _order_fetches.do(
+            (str(order_id), use_product_cache, use_cache, generation),
+            lambda: _fetch_order(supabase, order_id, use_product_cache, use_cache, generation),
+        )
+        # Coalesced callers get the same object; each needs its own copy to annotate
+        return copy.deepcopy(order) if isinstance(order, dict) else order
+    except Exception as e:
+        logger.error(f"Database error when fetching order {order_id}: {str(e)}")
+        return "Error al buscar el pedido. Por favor, intente nuevamente más tarde."
+
+def _fetch_order(supabase: Client, order_id: str, use_product_cache: bool, use_cache: bool, generation: tuple):
+    with span("db.orders", order_id=order_id) as stage:
+        response = call_with_retry("db", supabase.table("orders").select("*").eq("id", order_id).execute)
+        stage.record_rows(response.data)
+    order = response.data
+
+    if order:
+        try:
+            order_products = order[0]["order"]
+            products_fetched = True
             try:
-                order_products = order[0]["order"]
-                product_details = []
-                for product_id in order_products:
-                    try:
-                        product_response = supabase.table("products").select("*").eq("id", product_id).execute()
-                        if product_response.data:
-                            product_details.append(product_response.data[0])
-                        else:
-                            logger.warning(f"Product not found: {product_id}")
-                    except Exception as e:
-                        logger.error(f"Error fetching product {product_id}: {str(e)}")
-                
-                # Attach product details to order avoiding 'embedding', 'created_at', 'id' and 'price' fields
-                order[0]["products"] = [{k: v for k, v in product.items() if k not in ['embedding', 'created_at', 'id', 'price']} for product in product_details]
-                logger.info(f"Order {order_id} retrieved successfully with {len(product_details)} products")
-                return order[0] 
-            except KeyError as e:
-                logger.error(f"Key error while processing order {order_id}: {str(e)}")
-                return "Error al procesar los datos del pedido."
+                product_details = get_products_by_ids(supabase, order_products, use_cache=use_product_cache)
             except Exception as e:
-                logger.error(f"Unexpected error processing order {order_id}: {str(e)}")
-                return "Error al procesar el pedido."
+                logger.error(f"Error fetching products for order {order_id}: {str(e)}")
+                product_details = []
+                products_fetched = False
+
+            # Attach product details to order avoiding the 'id' field
+            order[0]["products"] = [{k: v for k, v in product.items() if k != 'id'} for product in product_details]
+            logger.info(f"Order {order_id} retrieved successfully with {len(product_details)} products")
+            # An order missing its products is still answered, but not kept for the whole TTL
+            if use_cache and products_fetched:
+                _cache_order(str(order_id), order[0], generation)
+            return order[0]
+        except KeyError as e:
+            logger.error(f"Key error while processing order {order_id}: {str(e)}")
+            return "Error al procesar los datos del pedido."
+        except Exception as e:
+            logger.error(f"Unexpected error processing order {order_id}: {str(e)}")
+            return "Error al procesar el pedido."
+    else:
+        logger.info(f"Order not found: {order_id}")
+        return "No se encontró un pedido con el ID proporcionado."
+
+def _cached_order(order_id: str) -> Optional[dict]:
+    with _order_cache_lock:
+        entry = _order_cache.get(order_id)
+        if entry is None:
+            return None
+        expires_at, order = entry
+        if time.time() > expires_at:
+            del _order_cache[order_id]
+            return None
+        _order_cache.move_to_end(order_id)
+    # Callers may annotate the order they get back; never hand out the cached object itself
+    return copy.deepcopy(order)
+
+def order_cache_ttl(order: dict) -> float:
+    """Seconds an order's status may be reused, by how likely it is to change"""
+    return ORDER_CACHE_TTLS.get(order.get("status"), ORDER_CACHE_TTL_ACTIVE)
+
+def _order_generation(order_id: str) -> tuple:
+    with _order_cache_lock:
+        return _order_epoch, _order_generations.get(order_id, 0)
+
+def _cache_order(order_id: str, order: dict, generation: tuple):
+    ttl = order_cache_ttl(order)
+    with _order_cache_lock:
+        if generation != (_order_epoch, _order_generations.get(order_id, 0)):
+            logger.info(f"Order {order_id} changed while it was read; not caching it")
+            return
+        _order_cache[order_id] = (time.time() + ttl, copy.deepcopy(order))
+        _order_cache.move_to_end(order_id)
+        while len(_order_cache) > ORDER_CACHE_SIZE:
+            _order_cache.popitem(last=False)
+
+def invalidate_order_status(order_id: Optional[str] = None):
+    """
+    Drop the cached status of `order_id`, or of every order when omitted.
+
+    Call this when an order changes (the server exposes it as POST /webhooks/orders) so the next
+    lookup reads the database instead of waiting for the TTL. Cached answers about the order are dropped too.
+    """
+    global _order_epoch
+    with _order_cache_lock:
+        if order_id is None or len(_order_generations) >= ORDER_CACHE_SIZE:
+            _order_epoch += 1
+            _order_generations.clear()
+        if order_id is None:
+            _order_cache.clear()
         else:
-            logger.info(f"Order not found: {order_id}")
-            return "No se encontró un pedido con el ID proporcionado."
-    except Exception as e:
-        logger.error(f"Database error when fetching order {order_id}: {str(e)}")
-        return "Error al buscar el pedido. Por favor, intente nuevamente más tarde."
\ No newline at end of file
+            _order_generations[str(order_id)] = _order_generations.get(str(order_id), 0) + 1
+            _order_cache.pop(str(order_id), None)
+    if order_id is None:
+        semantic_cache.invalidate(tool="get_order_status")
+    else:
+        semantic_cache.invalidate(order_id=str(order_id))
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence
+import numpy as np
+from services.ann_index import ExactSearch, build_backend, catalog_fingerprint, top_k
+from services.lexical_index import BM25Index, reciprocal_rank_fusion
+from services.vector_store import STORAGE_MODES, VectorStore, quantize
+from utils.semantic_cache import semantic_cache
+from utils.single_flight import SingleFlight
+from utils.tracing import span
+from utils.transport import call_with_retry
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+METADATA_COLUMNS = ["id", "name", "description", "price"]
+PAGE_SIZE = 1000  # PostgREST caps every response at 1000 rows by default
+
+# float32, float16 (half the memory) or int8 with a per-product scale (a quarter)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32")
+# Quantized indexes keep a float32 copy here, memory-mapped, to re-rank their top candidates; empty disables re-ranking
+EMBEDDING_RERANK_PATH = os.getenv("EMBEDDING_RERANK_PATH", "product_vectors.f32")
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))  # candidates re-ranked per requested result
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))  # results taken from each ranking before fusion
+# Seconds before the index is reloaded in the background to pick up catalog changes; 0 disables it
+PRODUCT_INDEX_TTL = float(os.getenv("PRODUCT_INDEX_TTL", "900"))
+
+
+class ProductIndex:
+    """
+    In-memory index of product embeddings.
+
+    Holds pre-normalized embeddings (see services/vector_store.py) alongside the metadata of each
+    product. By default a search is a single matrix-vector product followed by an argpartition top-k;
+    `backend` can be swapped for an approximate index (see services/ann_index.py) on large catalogs.
+    Quantized vectors with a full-precision copy re-rank RERANK_FACTOR times more candidates in float32.
+    """
+
+    def __init__(self, metadata: List[dict], vectors, backend=None):
+        self.metadata = metadata
+        self.ids = [product["id"] for product in metadata]
+        self.vectors = vectors if isinstance(vectors, VectorStore) else VectorStore(vectors)
+        self.backend = backend or ExactSearch()
+        self._lexical: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The embeddings as a float32 matrix (reconstructed, and therefore a copy, for quantized storage)"""
+        return self.vectors.full_precision()
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[dict], storage: str = "float32", rerank_path: str = "") -> "ProductIndex":
+        """Build the index from product rows that include an 'embedding' field"""
+        return cls.from_pages([rows], storage, rerank_path)
+
+    @classmethod
+    def from_pages(cls, pages: Iterable[Sequence[dict]], storage: str = "float32", rerank_path: str = "") -> "ProductIndex":
+        """
+        Build the index from pages of product rows.
+
+        Each page is normalized and converted to `storage` as soon as it arrives, so peak memory holds
+        one page of Python float lists rather than the whole catalog's. With quantized storage and a
+        `rerank_path`, the float32 rows are streamed to that file and memory-mapped for re-ranking.
+        """
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown embedding storage '{storage}', expected one of {STORAGE_MODES}")
+        metadata = []
+        blocks = []
+        full_file = None
+        if storage != "float32" and rerank_path:
+            full_file = open(f"{rerank_path}.tmp", "wb")
+        for rows in pages:
+            vectors = []
+            for row in rows:
+                embedding = row.get("embedding")
+                if not embedding:
+                    logger.warning(f"Product {row.get('id')} has no embedding")
+                    continue
+                if isinstance(embedding, str):
+                    # pgvector columns are returned as their text representation
+                    embedding = json.loads(embedding)
+                vectors.append(embedding)
+                metadata.append({k: row.get(k) for k in METADATA_COLUMNS})
+            if vectors:
+                block = np.asarray(vectors, dtype=np.float32)
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                block /= norms
+                if full_file is not None:
+                    block.tofile(full_file)
+                blocks.append(quantize(block, storage))
+
+        store = VectorStore.from_blocks(blocks)
+        if full_file is not None:
+            full_file.close()
+            if len(store):
+                # Replacing the file leaves memmaps of a previous index valid until they are dropped
+                os.replace(f"{rerank_path}.tmp", rerank_path)
+                store.full = np.memmap(rerank_path, dtype=np.float32, mode="r", shape=(len(store), store.dim))
+            else:
+                os.remove(f"{rerank_path}.tmp")
+        return cls(metadata, store)
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def lexical(self) -> BM25Index:
+        """BM25 index over name and description, built on first use"""
+        if self._lexical is None:
+            with self._lexical_lock:
+                if self._lexical is None:
+                    with span("index.lexical_build", products=len(self)):
+                        self._lexical = BM25Index(f"{p.get('name') or ''} {p.get('description') or ''}" for p in self.metadata)
+        return self._lexical
+
+    def search(self, query_embedding: Sequence[float], top_n: int = 5) -> List[dict]:
+        """Return copies of the metadata of the top_n products most similar to the query"""
+        if len(self) == 0 or top_n <= 0:
+            return []
+
+        top = self.rank(query_embedding, top_n)
+        if top is None:
+            logger.warning("Query embedding has zero norm, returning unranked products")
+            return [dict(product) for product in self.metadata[:top_n]]
+        return [dict(self.metadata[i]) for i in top]
+
+    def rank(self, query_embedding: Sequence[float], top_n: int) -> Optional[np.ndarray]:
+        """Positions of the top_n most similar products, best first, or None for a zero-norm query"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+
+        query = query / norm
+        if self.vectors.full is None:
+            return self.backend.search(self.vectors, query, top_n)
+        candidates = np.sort(self.backend.search(self.vectors, query, top_n * RERANK_FACTOR))
+        return candidates[top_k(self.vectors.full_precision(candidates) @ query, top_n)]
+
+    def lexical_search(self, query: str, top_n: int = 5) -> List[dict]:
+        """Keyword search with BM25; products matching none of the query terms are not returned"""
+        if len(self) == 0 or top_n <= 0:
+            return []
+        return [dict(self.metadata[i]) for i in self.lexical.search(query, top_n)]
+
+    def hybrid_search(self, query: str, query_embedding: Sequence[float], top_n: int = 5) -> List[dict]:
+        """Fuse the vector and BM25 rankings with reciprocal rank fusion"""
+        if len(self) == 0 or top_n <= 0:
+            return []
+        rankings = [self.lexical.search(query, HYBRID_CANDIDATES)]
+        vector_ranking = self.rank(query_embedding, HYBRID_CANDIDATES)
+        if vector_ranking is not None:
+            rankings.append(vector_ranking)
+        return [dict(self.metadata[i]) for i in reciprocal_rank_fusion(rankings, top_n)]
+
+
+def iter_product_pages(supabase: Client, columns: str, page_size: int = PAGE_SIZE) -> Iterator[List[dict]]:
+    """Yield every product row page by page, paginating past the PostgREST row limit"""
+    start = 0
+    while True:
+        with span("db.products_page", offset=start) as stage:
+            query = supabase.table("products").select(columns).order("id").range(start, start + page_size - 1)
+            page = call_with_retry("db", query.execute).data
+            stage.record_rows(page)
+        yield page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+_index: Optional[ProductIndex] = None
+_index_lock = threading.Lock()
+_index_loads = SingleFlight("product_index")
+_index_fingerprint = ""
+_loaded_at = 0.0
+_refreshing = False
+_refresh_lock = threading.Lock()
+
+
+def get_product_index(supabase: Client, refresh: bool = False) -> ProductIndex:
+    """
+    Return the process-wide product index, loading it from the database on first use.
+
+    Once the index is older than PRODUCT_INDEX_TTL it is reloaded in the background while
+    searches keep using the current one.
+    """
+    if _index is not None and not refresh:
+        if PRODUCT_INDEX_TTL > 0 and time.monotonic() - _loaded_at > PRODUCT_INDEX_TTL:
+            refresh_product_index(supabase)
+        return _index
+    # Concurrent first searches (or refreshes) share a single load
+    return _index_loads.do("products", lambda: _load_product_index(supabase, refresh))
+
+
+def refresh_product_index(supabase: Client) -> bool:
+    """Reload the index in a daemon thread; False when a reload is already running"""
+    global _refreshing, _loaded_at
+    with _refresh_lock:
+        if _refreshing:
+            return False
+        _refreshing = True
+        # A failed reload is retried after another TTL, not on every search
+        _loaded_at = time.monotonic()
+
+    def reload():
+        global _refreshing
+        try:
+            get_product_index(supabase, refresh=True)
+        except Exception as e:
+            logger.error(f"Error refreshing product index: {str(e)}")
+        finally:
+            with _refresh_lock:
+                _refreshing = False
+
+    threading.Thread(target=reload, name="product-index-refresh", daemon=True).start()
+    return True
+
+
+def catalog_digest(index: ProductIndex) -> str:
+    """Fingerprint of the ids, vectors and displayed columns; it changes with anything a cached answer shows"""
+    digest = hashlib.sha256(catalog_fingerprint(index.ids, index.vectors).encode("utf-8"))
+    digest.update(json.dumps(index.metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_product_index(supabase: Client, refresh: bool) -> ProductIndex:
+    global _index, _index_fingerprint, _loaded_at
+    with _index_lock:
+        if _index is None or refresh:
+            with span("index.load") as stage:
+                index = ProductIndex.from_pages(
+                    iter_product_pages(supabase, ", ".join(METADATA_COLUMNS + ["embedding"])),
+                    EMBEDDING_STORAGE,
+                    EMBEDDING_RERANK_PATH,
+                )
+                if len(index):
+                    index.backend = build_backend(index.ids, index.vectors)
+                stage.set("products", len(index))
+                stage.set("backend", index.backend.name)
+                stage.set("storage", index.vectors.storage)
+                stage.set("vector_bytes", index.vectors.nbytes)
+                fingerprint = catalog_digest(index)
+                if _index is not None and fingerprint != _index_fingerprint:
+                    # Cached answers may recommend products that changed
+                    dropped = semantic_cache.invalidate(tool="search_products")
+                    logger.info(f"Catalog changed, dropped {dropped} cached product answers")
+                _index, _index_fingerprint, _loaded_at = index, fingerprint, time.monotonic()
+            logger.info(f"Product index loaded with {len(_index)} products")
+        return _index
+
+
+def invalidate_product_index():
+    """Drop the cached index so the next search reloads it (e.g. after regenerating embeddings)"""
+    global _index, _index_fingerprint
+    with _index_lock:
+        _index, _index_fingerprint = None, ""
+    semantic_cache.invalidate(tool="search_products")
@@ -1,78 +1,131 @@
+from __future__ import annotations
+
+import asyncio
 import logging
-from supabase import Client
-from typing import List, Dict, Optional
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Optional
 import numpy as np
-from utils.openai_client import generate_query_embedding
+from utils.openai_client import generate_query_embedding, agenerate_query_embedding
+from services.product_index import get_product_index
+from utils.tracing import span
+from utils.single_flight import SingleFlight
+from utils.transport import call_with_retry
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
-def cosine_similarity(a: list[float], b: list[float]) -> float:
-    try:
-        a = np.array(a)
-        b = np.array(b)
-        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
-    except Exception as e:
-        logger.error(f"Error calculating similarity: {str(e)}")
-        return 0.0
+# Columns shown to the user when listing the products of an order
+PRODUCT_DISPLAY_COLUMNS = "id, name, description"
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "10000"))
+# "vector" ranks by embedding similarity, "lexical" by BM25 keywords, "hybrid" fuses both;
+# lexical is always used when the query embedding could not be generated
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+
+_product_cache: "OrderedDict[str, dict]" = OrderedDict()
+_product_cache_lock = threading.Lock()
+_product_list_fetches = SingleFlight("product_list")
 
-def search_products(supabase: Client, query: Optional[str]):
+def search_products(supabase: Client, query: Optional[str], query_embedding: Optional[list[float]] = None):
     try:
         if not query:
             logger.info("No query provided, returning all products")
             try:
-                products = supabase.table("products").select("id, name, description, price").execute().data
+                query_builder = supabase.table("products").select("id, name, description, price").limit(5)
+                products = _product_list_fetches.do("first_page", lambda: call_with_retry("db", query_builder.execute).data)
                 return products[:5]  # Return top 5 products
             except Exception as e:
                 logger.error(f"Error fetching all products: {str(e)}")
                 return "Error al buscar productos."
         
-        try:
-            query_embedding = generate_query_embedding(query)
-            logger.info(f"Generated embedding for query: {query}")
-        except Exception as e:
-            logger.error(f"Error generating embedding for query '{query}': {str(e)}")
-            # Fallback to simple search if embedding fails
+        embedding_failed = False
+        if SEARCH_MODE != "lexical":
             try:
-                products = supabase.table("products").select("id, name, description, price").ilike("name", f"%{query}%").execute().data
-                logger.info(f"Fallback search for '{query}' returned {len(products)} products")
-                return products[:5]
+                if query_embedding is None:
+                    query_embedding = generate_query_embedding(query)
+                    logger.info(f"Generated embedding for query: {query}")
+                # generate_query_embedding falls back to a zero vector when the API call fails
+                embedding_failed = not np.any(query_embedding)
             except Exception as e:
-                logger.error(f"Error in fallback search: {str(e)}")
-                return "Error al buscar productos."
-        
+                logger.error(f"Error generating embedding for query '{query}': {str(e)}")
+                embedding_failed = True
+
         top_n = 5
         try:
-            products = supabase.table("products").select("id, name, description, price, embedding").execute().data
-            logger.info(f"Fetched {len(products)} products for similarity search")
+            index = get_product_index(supabase)
+            logger.info(f"Searching {len(index)} indexed products")
         except Exception as e:
-            logger.error(f"Error fetching products for similarity search: {str(e)}")
+            logger.error(f"Error loading product index for similarity search: {str(e)}")
             return "Error al buscar productos."
-            
-        similarities = []
-        for product in products:
-            try:
-                product_embedding = product.get("embedding")
-                if not product_embedding:
-                    logger.warning(f"Product {product.get('id')} has no embedding")
-                    continue
-                    
-                similarity = cosine_similarity(query_embedding, product_embedding)
-                similarities.append((product, similarity))
-            except Exception as e:
-                logger.error(f"Error processing product {product.get('id')}: {str(e)}")
-                continue
-                
-        # Ordenar por similitud descendente
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        top_products = [prod for prod, sim in similarities[:top_n]]
 
-        # Return top products without the embeddings
-        for product in top_products:
-            if "embedding" in product:
-                del product["embedding"]
+        mode = "lexical" if embedding_failed else SEARCH_MODE
+        with span("index.search", index_size=len(index), backend=index.backend.name, mode=mode):
+            if mode == "lexical":
+                # Keyword search over name and description, no database round trip
+                top_products = index.lexical_search(query, top_n)
+            elif mode == "hybrid":
+                top_products = index.hybrid_search(query, query_embedding, top_n)
+            else:
+                top_products = index.search(query_embedding, top_n)
 
         logger.info(f"Returning {len(top_products)} products for query '{query}'")
         return top_products
     except Exception as e:
         logger.error(f"Unexpected error in search_products: {str(e)}")
-        return "Error al buscar productos. Por favor, intente nuevamente."
\ No newline at end of file
+        return "Error al buscar productos. Por favor, intente nuevamente."
+
+async def asearch_products(supabase: Client, query: Optional[str], query_embedding: Optional[list[float]] = None):
+    """Async variant of search_products: awaits the embedding and runs the search off the event loop"""
+    if query_embedding is None and query and SEARCH_MODE != "lexical":
+        query_embedding = await agenerate_query_embedding(query)
+    return await asyncio.to_thread(search_products, supabase, query, query_embedding)
+
+def get_products_by_ids(supabase: Client, product_ids: List[str], use_cache: bool = True) -> List[dict]:
+    """
+    Fetch the display columns of several products with a single query.
+
+    Results follow the order of `product_ids` (duplicates included) and skip unknown ids.
+    With `use_cache`, products already seen are served from a shared in-process cache.
+    """
+    # Keys are compared as strings so integer and uuid primary keys both match the ids stored in orders
+    keys = [str(product_id) for product_id in product_ids]
+    found: Dict[str, dict] = {}
+    if use_cache:
+        with _product_cache_lock:
+            for key in keys:
+                product = _product_cache.get(key)
+                if product is not None:
+                    _product_cache.move_to_end(key)
+                    found[key] = product
+
+    missing = list(dict.fromkeys(key for key in keys if key not in found))
+    if missing:
+        with span("db.products_by_ids", requested=len(missing)) as stage:
+            rows = call_with_retry("db", supabase.table("products").select(PRODUCT_DISPLAY_COLUMNS).in_("id", missing).execute).data
+            stage.record_rows(rows)
+        for row in rows:
+            found[str(row["id"])] = row
+        if use_cache:
+            with _product_cache_lock:
+                for row in rows:
+                    _product_cache[str(row["id"])] = row
+                    _product_cache.move_to_end(str(row["id"]))
+                while len(_product_cache) > PRODUCT_CACHE_SIZE:
+                    _product_cache.popitem(last=False)
+
+    products = []
+    for key in keys:
+        product = found.get(key)
+        if product is None:
+            logger.warning(f"Product not found: {key}")
+            continue
+        products.append(dict(product))
+    return products
+
+def clear_product_cache():
+    """Forget cached product metadata (e.g. after products are renamed)"""
+    with _product_cache_lock:
+        _product_cache.clear()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+from utils.chat_history import HistoryManager
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """Conversation state of a single customer"""
+
+    def __init__(self, session_id: str, history: Optional[HistoryManager] = None):
+        self.id = session_id
+        self.chat_history: List[dict] = []
+        self.history = history
+        # Turns of the same session run one at a time so the history stays ordered
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+
+class SessionStore:
+    """
+    In-memory registry of chat sessions.
+
+    Sessions idle for longer than `ttl` seconds are dropped, and the least recently
+    active ones are evicted once `max_sessions` is reached.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600, history_windowing: bool = True):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_windowing = history_windowing
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """
+        Return the session with `session_id`, or a new one.
+
+        New sessions always get a server-generated ID: an unknown or expired ID sent by a client is
+        never adopted, so nobody can pick (or guess into) another customer's conversation.
+        """
+        self._evict_expired()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            if session_id:
+                logger.info("Unknown session ID, starting a new session")
+            session = Session(str(uuid.uuid4()), HistoryManager() if self.history_windowing else None)
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                logger.warning(f"Evicted session {evicted_id}, store is full")
+        session.last_active = time.monotonic()
+        self._sessions.move_to_end(session.id)
+        return session
+
+    def remove(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        # Sessions are kept in activity order, so expired ones are always at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_active <= self.ttl or session.lock.locked():
+                break
+            del self._sessions[session_id]
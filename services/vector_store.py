@@ -0,0 +1,95 @@
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ("float32", "float16", "int8")
+# Rows converted to float32 at a time while scoring quantized vectors (about 16 MB per chunk)
+CHUNK_VALUES = 1 << 22
+
+
+def quantize(block: np.ndarray, storage: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert a normalized float32 block to `storage`, returning the codes and per-row scales (int8 only)"""
+    if storage == "float32":
+        return block, None
+    if storage == "float16":
+        return block.astype(np.float16), None
+    if storage == "int8":
+        scales = np.abs(block).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(block / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown embedding storage '{storage}', expected one of {STORAGE_MODES}")
+
+
+class VectorStore:
+    """
+    Product embeddings in float32, float16 or int8 with a per-row scale.
+
+    Scores are computed directly from the stored codes, converting a bounded chunk of rows to
+    float32 at a time. `full` optionally points at full-precision rows (typically a read-only
+    memmap on disk) used to re-rank the top candidates of a quantized search.
+    """
+
+    def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None, full: Optional[np.ndarray] = None):
+        self.data = data
+        self.scales = scales
+        self.full = full
+
+    @classmethod
+    def from_blocks(cls, blocks: List[Tuple[np.ndarray, Optional[np.ndarray]]], dim: int = 0) -> "VectorStore":
+        if not blocks:
+            return cls(np.zeros((0, dim), dtype=np.float32))
+        data = np.concatenate([codes for codes, _ in blocks]) if len(blocks) > 1 else blocks[0][0]
+        scales = None
+        if blocks[0][1] is not None:
+            scales = np.concatenate([s for _, s in blocks]) if len(blocks) > 1 else blocks[0][1]
+        return cls(data, scales)
+
+    @property
+    def storage(self) -> str:
+        if self.scales is not None:
+            return "int8"
+        return "float16" if self.data.dtype == np.float16 else "float32"
+
+    @property
+    def nbytes(self) -> int:
+        """Resident bytes of the stored codes and scales (the on-disk full-precision copy is excluded)"""
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def dim(self) -> int:
+        return self.data.shape[1] if self.data.ndim == 2 else 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine scores of a normalized float32 query against all rows, or only `rows`"""
+        data = self.data if rows is None else self.data[rows]
+        if self.storage == "float32":
+            return data @ query
+
+        scores = np.empty(len(data), dtype=np.float32)
+        chunk = max(1, CHUNK_VALUES // max(1, self.dim))
+        for start in range(0, len(data), chunk):
+            scores[start:start + chunk] = data[start:start + chunk].astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def dequantize(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        data = self.data if rows is None else self.data[rows]
+        matrix = data.astype(np.float32)
+        if self.scales is not None:
+            matrix *= (self.scales if rows is None else self.scales[rows])[:, None]
+        return matrix
+
+    def full_precision(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """float32 rows, read from `full` when available and reconstructed from the codes otherwise"""
+        if self.storage == "float32":
+            return self.data if rows is None else self.data[rows]
+        if self.full is not None:
+            return self.full if rows is None else np.asarray(self.full[rows])
+        return self.dequantize(rows)
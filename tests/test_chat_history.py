@@ -0,0 +1,74 @@
+import pytest
+from benchmarks.fakes import FakeOpenAI
+from utils import chat_history
+from utils.chat_history import STAGE_BUDGETS, HistoryManager, count_message_tokens
+
+
+def conversation(turns: int):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Mensaje {turn}: mi pedido es ABC{turn}23, ¿dónde está?"})
+        messages.append({"role": "assistant", "content": f"Respuesta {turn}: " + "su pedido está en camino. " * 8})
+    messages.append({"role": "user", "content": "¿Y cuándo llega?"})
+    return messages
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    fake = FakeOpenAI(reply="El cliente pregunta por sus pedidos ABC023 y ABC123.")
+    monkeypatch.setattr(chat_history, "client", fake)
+    return fake
+
+
+def test_every_stage_window_fits_its_budget(summarizer):
+    messages = conversation(7)
+    history = HistoryManager()
+    history.compact(messages)
+
+    sizes = {}
+    for stage, budget in STAGE_BUDGETS.items():
+        window = history.window(messages, stage)
+        tokens = count_message_tokens(window)
+        assert tokens <= budget["tokens"]
+        assert tokens == history.last_window_tokens[stage]
+        # The summary comes on top of the verbatim messages
+        assert len(window) <= budget["messages"] + 1
+        assert window[-1] is messages[-1]
+        sizes[stage] = tokens
+
+    assert sizes["order_extractor"] < sizes["response"]
+    assert sizes["product_query"] < sizes["tool_executor"]
+
+
+def test_every_stage_gets_the_unsummarized_tail(summarizer):
+    messages = conversation(7)
+    history = HistoryManager()
+    history.compact(messages)
+    tail = messages[history.summarized_count:]
+
+    for stage in STAGE_BUDGETS:
+        window = history.window(messages, stage)
+        assert window[0]["content"].endswith(history.summary)
+        assert window[-len(tail):] == tail
+
+
+def test_short_conversations_are_not_summarized(summarizer):
+    messages = conversation(1)
+    history = HistoryManager()
+    history.compact(messages)
+
+    assert summarizer.calls == []
+    assert history.window(messages, "order_extractor") == messages
+
+
+def test_failed_summary_keeps_every_message(monkeypatch):
+    def fail(**kwargs):
+        raise RuntimeError("summary unavailable")
+
+    monkeypatch.setattr(chat_history, "client", FakeOpenAI())
+    monkeypatch.setattr(chat_history.client.chat.completions, "create", fail)
+    messages = conversation(3)
+    history = HistoryManager()
+    history.compact(messages)
+
+    assert history.window(messages, "order_extractor") == messages
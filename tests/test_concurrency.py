@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils import concurrency
+from utils.concurrency import run_concurrently
+
+
+@pytest.fixture
+def one_worker(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(concurrency, "_executor", executor)
+    yield
+    executor.shutdown(wait=True)
+
+
+def sleeper(seconds: float, result: str):
+    def call():
+        time.sleep(seconds)
+        return result
+    return call
+
+
+def test_time_spent_queued_does_not_count_against_the_timeout(one_worker):
+    results = run_concurrently([sleeper(0.25, "first"), sleeper(0.1, "second")], timeout=0.3)
+    assert results == ["first", "second"]
+
+
+def test_calls_that_never_start_are_cancelled(one_worker):
+    results = run_concurrently([sleeper(0.5, "slow"), sleeper(0, "queued")], timeout=0.1, fallback=lambda i: f"fallback {i}")
+    assert results == ["fallback 0", "fallback 1"]
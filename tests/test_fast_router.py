@@ -0,0 +1,59 @@
+import pytest
+from tools.fast_router import _classify, find_order_id
+
+
+def route(message: str):
+    return _classify([{"role": "user", "content": message}])
+
+
+@pytest.mark.parametrize("message, order_id", [
+    ("Estado del pedido ABC123", "ABC123"),
+    ("pedido 123", "123"),
+    ("¿Dónde está mi pedido 123?", "123"),
+    ("pedido #123 no llega", "123"),
+    ("pedido nro. 4521", "4521"),
+])
+def test_order_ids_take_the_fast_path(message, order_id):
+    result = route(message)
+    assert result is not None
+    assert result[0] == "order_with_id"
+    assert result[1].order_id == order_id
+
+
+@pytest.mark.parametrize("message", [
+    "quiero hacer un pedido 2 lamparas",
+    "orden 2 auriculares",
+    "necesito 2 lamparas para mi pedido 3 de la oficina",
+])
+def test_quantities_are_not_order_ids(message):
+    assert find_order_id(message) is None
+    assert route(message) is None
+
+
+@pytest.mark.parametrize("message, rule", [
+    ("quiero devolverlo", "derive"),
+    ("Quiero devolver mi compra", "derive"),
+    ("Mi producto llegó roto, quiero un reembolso", "derive"),
+    ("Hola, ¿dónde está mi pedido ABC123?", "order_with_id"),
+    ("Mi pedido ABC123, ¿cuándo llega?", "order_with_id"),
+    ("¿Dónde está mi pedido?", "order_without_id"),
+])
+def test_whole_message_rules(message, rule):
+    result = route(message)
+    assert result is not None
+    assert result[0] == rule
+
+
+@pytest.mark.parametrize("message", [
+    # A complaint is not an order status lookup
+    "mi compra está rota",
+    # Mixed intents: the handoff or the product request must not be dropped
+    "mi pedido esta demorado, quiero devolverlo",
+    "mi envio no llega ¿dónde está? necesito una lampara también",
+    "Llegó roto, ¿tienen otra lámpara?",
+    # Product questions that mention shipping or placing an order
+    "¿Cuánto cuesta el envío de esta lámpara?",
+    "Quiero hacer un pedido de auriculares, ¿cuándo llegaría?",
+])
+def test_partial_matches_go_to_the_llm(message):
+    assert route(message) is None
@@ -0,0 +1,36 @@
+import pytest
+from benchmarks.fakes import build_catalog
+from services import order_service
+from services.order_service import get_order_status, invalidate_order_status
+
+
+@pytest.fixture
+def catalog():
+    invalidate_order_status()
+    yield build_catalog(20, 4, dim=16)
+    invalidate_order_status()
+
+
+def test_status_read_before_an_invalidation_is_not_cached(catalog, monkeypatch):
+    order = catalog.tables["orders"].rows[0]
+    get_products = order_service.get_products_by_ids
+
+    def update_during_read(supabase, ids, use_cache=True):
+        # The order changes (and the webhook fires) after its row was read
+        order["status"] = "Entregado"
+        invalidate_order_status(order["id"])
+        return get_products(supabase, ids, use_cache=use_cache)
+
+    monkeypatch.setattr(order_service, "get_products_by_ids", update_during_read)
+    assert get_order_status(catalog, order["id"])["status"] == "Procesando"
+
+    monkeypatch.setattr(order_service, "get_products_by_ids", get_products)
+    assert get_order_status(catalog, order["id"])["status"] == "Entregado"
+
+
+def test_status_is_cached_without_invalidations(catalog):
+    order_id = catalog.tables["orders"].rows[0]["id"]
+    get_order_status(catalog, order_id)
+    requests = catalog.requests
+    get_order_status(catalog, order_id)
+    assert catalog.requests == requests
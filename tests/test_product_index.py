@@ -0,0 +1,44 @@
+import time
+import pytest
+from benchmarks.fakes import build_catalog
+from services import product_index
+from utils.semantic_cache import semantic_cache
+
+
+@pytest.fixture
+def catalog():
+    product_index.invalidate_product_index()
+    semantic_cache.clear()
+    yield build_catalog(20, 5, dim=16)
+    product_index.invalidate_product_index()
+    semantic_cache.clear()
+
+
+def cache_product_answer():
+    semantic_cache.store([1.0] + [0.0] * 15, None, ["search_products"], "Le recomiendo la lámpara.", [])
+
+
+def test_reload_keeps_cached_answers_while_the_catalog_is_unchanged(catalog):
+    product_index.get_product_index(catalog)
+    cache_product_answer()
+
+    product_index.get_product_index(catalog, refresh=True)
+    assert semantic_cache.stats()["entries"] == 1
+
+    catalog.tables["products"].rows[0]["price"] = 1.0
+    product_index.get_product_index(catalog, refresh=True)
+    assert semantic_cache.stats()["entries"] == 0
+
+
+def test_stale_index_is_reloaded_in_the_background(catalog, monkeypatch):
+    first = product_index.get_product_index(catalog)
+    catalog.tables["products"].add({"id": "new", "name": "Lámpara nueva", "description": "Recién llegada.", "price": 10.0})
+    monkeypatch.setattr(product_index, "PRODUCT_INDEX_TTL", 0.01)
+    time.sleep(0.02)
+
+    # The stale index is still served while the reload runs
+    assert product_index.get_product_index(catalog) is first
+    deadline = time.monotonic() + 5
+    while product_index.get_product_index(catalog) is first and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "new" in product_index.get_product_index(catalog).ids
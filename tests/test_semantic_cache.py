@@ -0,0 +1,25 @@
+import pytest
+from benchmarks.semantic_cache_pairs import NEAR_MISSES, PARAPHRASES
+from services.chat_service import _semantic_cache_key
+from utils.semantic_cache import SemanticCache, query_terms
+
+
+@pytest.mark.parametrize("first, second", PARAPHRASES)
+def test_paraphrases_share_query_terms(first, second):
+    assert query_terms(first) == query_terms(second)
+
+
+@pytest.mark.parametrize("first, second", NEAR_MISSES)
+def test_near_misses_have_different_query_terms(first, second):
+    assert query_terms(first) != query_terms(second)
+
+
+def test_near_miss_never_hits_even_with_identical_embeddings():
+    cache = SemanticCache(threshold=0.95)
+    embedding = [1.0, 0.0, 0.0]
+    _, red, _ = _semantic_cache_key([{"role": "user", "content": "auriculares rojos"}])
+    _, black, _ = _semantic_cache_key([{"role": "user", "content": "auriculares negros"}])
+    cache.store(embedding, red, ["search_products"], "Tenemos estos auriculares rojos.", [])
+
+    assert cache.lookup(embedding, black) is None
+    assert cache.lookup(embedding, red)["response"] == "Tenemos estos auriculares rojos."
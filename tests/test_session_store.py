@@ -0,0 +1,15 @@
+from services.session_store import SessionStore
+
+
+def test_unknown_session_ids_are_replaced_by_server_ids():
+    store = SessionStore()
+    session = store.get_or_create("chosen-by-the-client")
+
+    assert session.id != "chosen-by-the-client"
+    assert store.get_or_create(session.id) is session
+    assert len(store) == 1
+
+
+def test_new_sessions_get_distinct_ids():
+    store = SessionStore()
+    assert store.get_or_create().id != store.get_or_create().id
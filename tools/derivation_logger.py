@@ -1,16 +1,11 @@
 import logging
-from utils.openai_client import client
 from models.schemas import DeriveToHumanExtraction
 from typing import List
+from utils.stage_models import parse_structured, aparse_structured
 
 logger = logging.getLogger(__name__)
 
-def log_derivation(chat_history: List[dict]) -> DeriveToHumanExtraction:
-    try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": """
+DERIVATION_LOGGER_PROMPT = """
                     You are the derivation logger. Your task is to log the reason for deriving the user's request to a human representative. 
                  
                     You should provide a reason for the derivation based on the conversation.
@@ -18,14 +13,39 @@ def log_derivation(chat_history: List[dict]) -> DeriveToHumanExtraction:
                     For example, if the conversation is "Quiero comprar esto ahora", the reason could be "El usuario quiere realizar una compra".
                  
                     The reason should be concise and clear to help the human representative understand the context of the conversation. And it should be in Spanish.
-                """}
-            ] + chat_history,
-            response_format=DeriveToHumanExtraction,
+                """
+
+def _is_plausible(result: DeriveToHumanExtraction) -> bool:
+    return bool(result.reason.strip())
+
+def log_derivation(chat_history: List[dict]) -> DeriveToHumanExtraction:
+    try:
+        result = parse_structured(
+            "derivation_logger",
+            "llm.log_derivation",
+            [{"role": "system", "content": DERIVATION_LOGGER_PROMPT}] + chat_history,
+            DeriveToHumanExtraction,
+            is_confident=_is_plausible,
         )
-        result = completion.choices[0].message.parsed
         logger.info(f"Derivation reason: {result.reason}")
         return result
     except Exception as e:
         logger.error(f"Error logging derivation: {str(e)}")
         # Return a default reason to prevent crashes
+        return DeriveToHumanExtraction(reason="Error determining reason for derivation")
+
+async def alog_derivation(chat_history: List[dict]) -> DeriveToHumanExtraction:
+    """Async variant of log_derivation for the concurrent chat server"""
+    try:
+        result = await aparse_structured(
+            "derivation_logger",
+            "llm.log_derivation",
+            [{"role": "system", "content": DERIVATION_LOGGER_PROMPT}] + chat_history,
+            DeriveToHumanExtraction,
+            is_confident=_is_plausible,
+        )
+        logger.info(f"Derivation reason: {result.reason}")
+        return result
+    except Exception as e:
+        logger.error(f"Error logging derivation: {str(e)}")
         return DeriveToHumanExtraction(reason="Error determining reason for derivation")
\ No newline at end of file
@@ -0,0 +1,162 @@
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import List, Optional
+from models.schemas import RoutingDecision
+
+logger = logging.getLogger(__name__)
+
+UUID_PATTERN = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+# Numeric or alphanumeric IDs are only trusted right after an order keyword ("pedido 123", "orden #AB123")
+KEYWORD_ID_PATTERN = re.compile(
+    r"\b(?:pedido|orden|order)\s*(?P<marker>(?:(?:nro|numero|n[o°]?)\.?|#)?)\s*#?(?P<id>[a-z0-9-]*\d[a-z0-9-]*)\b",
+    re.IGNORECASE,
+)
+# A bare number followed by a word is a quantity ("un pedido 2 lámparas"), not an ID
+QUANTITY_PATTERN = re.compile(r"\s*[^\W\d_]")
+# Something after an order keyword that reads like an ID ("pedido #xyz", "orden ABCDEF", "pedido 3 de la oficina");
+# unless find_order_id recognises it, the message is left to the LLM instead of asking for the ID again
+ID_CANDIDATE_PATTERN = re.compile(r"\b(?i:pedido|orden|order)\s*(?:(?i:nro|numero|n[o°]?\.|n°|#)\s*\S|[A-Z0-9][A-Z0-9-]{2,}\b|\d)")
+
+# Only the customer's own orders ("mi pedido"); "el envío de esta lámpara" or "hacer un pedido" are product questions
+MY_ORDER = r"\b(mi|mis|nuestro|nuestros|nuestra)\s+(pedido|pedidos|orden|ordenes|envio|paquete|compra)\b"
+ORDER_PATTERN = re.compile(
+    MY_ORDER + r".*\b(donde|estado|llega|llegara|cuando|esta|va|rastrear|seguir|seguimiento)\b"
+    r"|\b(donde|estado|cuando|rastrear|seguimiento)\b.*" + MY_ORDER
+)
+EXIT_PATTERN = re.compile(r"^(salir|exit|quit)[\s!.]*$")
+GREETING_PATTERN = re.compile(
+    r"^(?:[\s!.,¡?¿]*(?:hola|buenas|buenos dias|buenas tardes|buenas noches|hey|saludos|muchas gracias|gracias|ok|vale|perfecto|adios|chau|que tal|como estas|como esta))+"
+    r"[\s!.,¡?¿]*$"
+)
+DERIVE_PATTERNS = [
+    (re.compile(r"\b(devol\w*|reembols\w*)"), "El usuario quiere realizar una devolución"),
+    (re.compile(r"\b(reclamo|queja|(llego|llegaron|vino|vinieron|esta|estan) (rot[oa]s?|danad[oa]s?))\b"), "El usuario tiene un reclamo sobre su compra"),
+    (re.compile(r"\b(hablar|comunicarme|contactar)\b.*\b(humano|persona|agente|representante|operador)\b"), "El usuario pide hablar con un representante humano"),
+    (re.compile(r"\bcambiar (la )?direccion\b"), "El usuario quiere modificar la dirección de entrega de su pedido"),
+]
+
+# A fast path is only taken when every clause of the message belongs to the matched intent
+CLAUSE_SEPARATOR = re.compile(r"[¿?¡!.,;]+|\b(?:y|pero|tambien|ademas)\b")
+FILLER_PATTERN = re.compile(r"(?:hola|buenas|buenos dias|buenas tardes|buenas noches|gracias|muchas gracias|por favor|ok|vale|disculpa|perdon|oye)?")
+ORDER_WORDS = re.compile(
+    r"\b(pedidos?|orden(es)?|envio|paquete|compras?|donde|estado|llega\w*|cuando|esta|va|rastrear|seguir|seguimiento)\b"
+)
+
+_lock = threading.Lock()
+_hits: Counter = Counter()
+_misses = 0
+
+
+def strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents so patterns don't need to spell every variant"""
+    return strip_accents(text.lower()).strip()
+
+
+def is_exit_message(text: str) -> bool:
+    """Whether the user asked to end the conversation ("salir", "exit", ...)"""
+    return bool(EXIT_PATTERN.match(normalize(text)))
+
+
+def find_order_id(text: str) -> Optional[str]:
+    match = UUID_PATTERN.search(text)
+    if match:
+        return match.group(0)
+    for match in KEYWORD_ID_PATTERN.finditer(text):
+        order_id = match.group("id")
+        if order_id.isdigit() and not match.group("marker") and QUANTITY_PATTERN.match(text, match.end("id")):
+            continue
+        return order_id
+    return None
+
+
+def _covers(text: str, matches) -> bool:
+    """Whether every clause of `text` is filler or accepted by `matches`; leftovers need the LLM"""
+    clauses = (clause.strip() for clause in CLAUSE_SEPARATOR.split(text))
+    return all(FILLER_PATTERN.fullmatch(clause) or matches(clause) for clause in clauses)
+
+
+def _classify(chat_history: List[dict]) -> Optional[tuple]:
+    user_messages = [m.get("content") or "" for m in chat_history if m.get("role") == "user"]
+    if not user_messages:
+        return None
+    text = normalize(user_messages[-1])
+
+    # IDs keep their original case
+    order_id = find_order_id(strip_accents(user_messages[-1]))
+    if order_id is None and ID_CANDIDATE_PATTERN.search(strip_accents(user_messages[-1])):
+        return None
+    intents = []
+    if order_id or ORDER_PATTERN.search(text):
+        intents.append("order")
+    derive_reason = next((reason for pattern, reason in DERIVE_PATTERNS if pattern.search(text)), None)
+    if derive_reason:
+        intents.append("derive")
+    if GREETING_PATTERN.match(text):
+        intents.append("greeting")
+
+    # Mixed or unknown intents are left to the LLM
+    if len(intents) != 1:
+        return None
+    intent = intents[0]
+
+    if intent == "order":
+        # "mi envío no llega, ¿y tienen lámparas?" also asks for products
+        # IDs are collapsed first so "pedido nro. 4521" isn't split at its period
+        without_ids = KEYWORD_ID_PATTERN.sub("pedido", UUID_PATTERN.sub("pedido", text))
+        if not _covers(without_ids, ORDER_WORDS.search):
+            return None
+        if order_id is None:
+            # "¿Dónde está mi pedido?" after the ID was given in an earlier message
+            order_id = next((found for found in map(find_order_id, map(strip_accents, reversed(user_messages[:-1]))) if found), None)
+        decision = RoutingDecision(
+            tools=["get_order_status"],
+            has_order_id=order_id is not None,
+            order_id=order_id,
+            needs_query=False,
+        )
+        return ("order_with_id" if order_id else "order_without_id"), decision
+
+    if intent == "derive":
+        if not _covers(text, lambda clause: any(pattern.search(clause) for pattern, _ in DERIVE_PATTERNS)):
+            return None
+        return "derive", RoutingDecision(tools=["derive_to_human"], has_order_id=False, needs_query=False, derivation_reason=derive_reason)
+
+    return "greeting", RoutingDecision(tools=[], has_order_id=False, needs_query=False)
+
+
+def fast_route(chat_history: List[dict]) -> Optional[RoutingDecision]:
+    """
+    Route the turn with regex and keyword rules when the intent is unambiguous.
+
+    Returns a RoutingDecision with the tools and their arguments, or None when the
+    LLM router should decide.
+    """
+    global _misses
+    result = _classify(chat_history)
+    with _lock:
+        if result is None:
+            _misses += 1
+            return None
+        _hits[result[0]] += 1
+    logger.info(f"Fast route ({result[0]}): {result[1]}")
+    return result[1]
+
+
+def fast_router_stats() -> dict:
+    """Hit counts per rule and the overall share of turns that skipped the LLM router"""
+    with _lock:
+        hits = sum(_hits.values())
+        total = hits + _misses
+        return {
+            "hits": dict(_hits),
+            "misses": _misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import Field
+from models.schemas import RoutingDecision
+from tools.fast_router import find_order_id, strip_accents
+from utils.embedding_cache import embedding_cache
+from utils.openai_client import client, EMBEDDING_MODEL, generate_query_embedding, agenerate_query_embedding
+from utils.tracing import span
+from utils.transport import call_openai
+
+logger = logging.getLogger(__name__)
+
+# Number of nearest prototypes of each intent averaged into its score
+INTENT_TOP_K = int(os.getenv("INTENT_TOP_K", "3"))
+# Below either threshold the turn goes to the LLM tool executor; ada-002 similarities sit roughly in 0.7-1.0
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", "0.80"))
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.02"))
+
+# Labeled examples per intent; "none" is small talk that needs no tool
+PROTOTYPES: Dict[str, List[str]] = {
+    "get_order_status": [
+        "¿Dónde está mi pedido?",
+        "Quiero saber el estado de mi pedido",
+        "¿Cuándo llega mi compra?",
+        "Estado del pedido ABC123",
+        "¿Ya enviaron mi orden?",
+        "Mi paquete no ha llegado todavía",
+        "¿Cómo va el envío de mi pedido?",
+        "Quiero rastrear mi pedido",
+        "¿En qué estado está la orden que hice la semana pasada?",
+        "¿Me pueden decir si mi pedido ya salió?",
+        "Hice una compra hace días y no sé nada de ella",
+        "¿Cuándo me entregan lo que compré?",
+    ],
+    "search_products": [
+        "Quiero comprar una lámpara",
+        "Busco auriculares inalámbricos",
+        "¿Qué productos tienen?",
+        "Necesito una rueda para mi carro",
+        "¿Tienen sillas de oficina?",
+        "Recomiéndame un regalo para mi madre",
+        "Quiero iluminar mi sala",
+        "¿Venden fundas para móvil?",
+        "Busco algo barato para la cocina",
+        "¿Qué teclados tienen disponibles?",
+        "Necesito una mochila para el portátil",
+        "¿Cuánto cuesta el televisor de 50 pulgadas?",
+    ],
+    "derive_to_human": [
+        "Quiero devolver mi compra",
+        "Mi producto llegó dañado",
+        "Necesito cambiar la dirección de entrega",
+        "Quiero comprar esto ahora",
+        "¿Cómo configuro el firmware?",
+        "¿Cuál es la capital de Francia?",
+        "Quiero hablar con una persona",
+        "Tengo un reclamo por un cobro duplicado",
+        "Quiero cancelar mi pedido y que me devuelvan el dinero",
+        "Necesito una factura a nombre de mi empresa",
+        "El artículo que recibí no funciona",
+        "¿Me ayudas con mi tarea de matemáticas?",
+    ],
+    "none": [
+        "Hola",
+        "Buenas tardes",
+        "Gracias, eso es todo",
+        "Muchas gracias por la ayuda",
+        "Perfecto, vale",
+        "¿Cómo estás?",
+    ],
+}
+
+
+class EmbeddingRoutingDecision(RoutingDecision):
+    """Routing decision that carries the message embedding so product search doesn't embed it again"""
+
+    query_embedding: Optional[List[float]] = Field(default=None, exclude=True, repr=False)
+
+
+class IntentClassifier:
+    """
+    Nearest-prototype intent classifier over message embeddings.
+
+    Every prototype example is embedded once (one batched call, cached like any other embedding).
+    A message's score for an intent is the mean cosine similarity of its INTENT_TOP_K nearest
+    prototypes of that intent; the best intent is used only when its score clears `min_similarity`
+    and beats the runner-up by `margin`.
+    """
+
+    def __init__(self, prototypes: Dict[str, List[str]], top_k: int = INTENT_TOP_K,
+                 min_similarity: float = INTENT_MIN_SIMILARITY, margin: float = INTENT_MIN_MARGIN):
+        self.prototypes = prototypes
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.intents = list(prototypes)
+        self._matrix: Optional[np.ndarray] = None
+        self._labels: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._matrix is not None
+
+    def load(self) -> bool:
+        """Embed the prototypes if not done yet; False when the embeddings are unavailable"""
+        if self._matrix is not None:
+            return True
+        with self._lock:
+            if self._matrix is None:
+                try:
+                    with span("intent.load_prototypes"):
+                        self._matrix, self._labels = self._embed_prototypes()
+                except Exception as e:
+                    logger.error(f"Error embedding intent prototypes: {str(e)}")
+                    return False
+        return True
+
+    def _embed_prototypes(self) -> Tuple[np.ndarray, np.ndarray]:
+        texts = [text for intent in self.intents for text in self.prototypes[intent]]
+        labels = np.array([position for position, intent in enumerate(self.intents) for _ in self.prototypes[intent]])
+        embeddings = {text: embedding_cache.get(text, EMBEDDING_MODEL) for text in texts}
+        missing = [text for text, embedding in embeddings.items() if embedding is None]
+        if missing:
+            response = call_openai("embedding", client.embeddings.create, model=EMBEDDING_MODEL, input=missing)
+            for item in response.data:
+                embeddings[missing[item.index]] = item.embedding
+                embedding_cache.set(missing[item.index], EMBEDDING_MODEL, item.embedding)
+        matrix = np.asarray([embeddings[text] for text in texts], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix, labels
+
+    def scores(self, embedding: List[float]) -> Optional[np.ndarray]:
+        """Score per intent (in `self.intents` order), or None when the message can't be scored"""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or not self.load() or self._matrix.shape[1] != len(query):
+            return None
+        similarities = self._matrix @ (query / norm)
+        scores = np.empty(len(self.intents), dtype=np.float32)
+        for position in range(len(self.intents)):
+            own = similarities[self._labels == position]
+            k = min(self.top_k, len(own))
+            scores[position] = np.partition(own, len(own) - k)[-k:].mean()
+        return scores
+
+    def classify(self, embedding: List[float]) -> Tuple[Optional[str], float, float]:
+        """(intent or None when unsure, best score, margin over the runner-up)"""
+        scores = self.scores(embedding)
+        if scores is None:
+            return None, 0.0, 0.0
+        ranked = np.argsort(-scores)
+        best, margin = float(scores[ranked[0]]), float(scores[ranked[0]] - scores[ranked[1]])
+        if best < self.min_similarity or margin < self.margin:
+            return None, best, margin
+        return self.intents[ranked[0]], best, margin
+
+
+intent_classifier = IntentClassifier(PROTOTYPES)
+
+_stats_lock = threading.Lock()
+_hits: Counter = Counter()
+_fallbacks = 0
+
+
+def _decision(intent: str, chat_history: List[dict], message: str, embedding: List[float]) -> EmbeddingRoutingDecision:
+    if intent == "get_order_status":
+        # The ID may have been given in an earlier message
+        user_messages = [m.get("content") or "" for m in chat_history if m.get("role") == "user"]
+        order_id = next((found for found in map(find_order_id, map(strip_accents, reversed(user_messages))) if found), None)
+        return EmbeddingRoutingDecision(tools=[intent], has_order_id=order_id is not None, order_id=order_id, needs_query=False)
+    if intent == "search_products":
+        # The whole message is the query, so its embedding is exactly what the search needs
+        return EmbeddingRoutingDecision(tools=[intent], has_order_id=False, needs_query=True, query=message, query_embedding=embedding)
+    if intent == "derive_to_human":
+        # derivation_reason stays empty so log_derivation writes one for the human representative
+        return EmbeddingRoutingDecision(tools=[intent], has_order_id=False, needs_query=False)
+    return EmbeddingRoutingDecision(tools=[], has_order_id=False, needs_query=False)
+
+
+def _route(chat_history: List[dict], message: str, embedding: List[float]) -> Optional[EmbeddingRoutingDecision]:
+    global _fallbacks
+    with span("intent.classify") as stage:
+        intent, score, margin = intent_classifier.classify(embedding)
+        stage.set("intent", intent)
+        stage.set("score", round(score, 4))
+        stage.set("margin", round(margin, 4))
+    with _stats_lock:
+        if intent is None:
+            _fallbacks += 1
+        else:
+            _hits[intent] += 1
+    if intent is None:
+        logger.info(f"Intent classifier unsure (score={score:.3f}, margin={margin:.3f}), using the LLM")
+        return None
+    logger.info(f"Intent classifier: {intent} (score={score:.3f}, margin={margin:.3f})")
+    return _decision(intent, chat_history, message, embedding)
+
+
+def _last_user_message(chat_history: List[dict]) -> str:
+    return next((m.get("content") or "" for m in reversed(chat_history) if m.get("role") == "user"), "").strip()
+
+
+def classify_intent(chat_history: List[dict]) -> Optional[EmbeddingRoutingDecision]:
+    """
+    Route the turn from the embedding of the latest user message.
+
+    Returns None when the classifier is unsure (or embeddings are unavailable) and the LLM
+    tool executor should decide.
+    """
+    message = _last_user_message(chat_history)
+    if not message:
+        return None
+    return _route(chat_history, message, generate_query_embedding(message))
+
+
+async def aclassify_intent(chat_history: List[dict]) -> Optional[EmbeddingRoutingDecision]:
+    """Async variant of classify_intent; prototypes are embedded off the event loop on first use"""
+    message = _last_user_message(chat_history)
+    if not message:
+        return None
+    if not intent_classifier.loaded:
+        await asyncio.to_thread(intent_classifier.load)
+    return _route(chat_history, message, await agenerate_query_embedding(message))
+
+
+def intent_classifier_stats() -> dict:
+    with _stats_lock:
+        hits = sum(_hits.values())
+        total = hits + _fallbacks
+        return {"hits": dict(_hits), "fallbacks": _fallbacks, "hit_rate": hits / total if total else 0.0}
@@ -1,29 +1,61 @@
 import logging
-from utils.openai_client import client
 from models.schemas import OrderExtraction
 from typing import List
+from tools.fast_router import find_order_id, strip_accents
+from utils.stage_models import parse_structured, aparse_structured
 
 logger = logging.getLogger(__name__)
 
-def extract_order_id(chat_history: List[dict]) -> OrderExtraction:
-    try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": """
+ORDER_EXTRACTOR_PROMPT = """
                     You are the order id extractor. Your task is to extract the order ID based on the conversation. 
                  
                     If there is not an order ID in the conversation, you should set the 'has_order_id' field to False and leave the 'order_id' field as None.
                  
                     If there is an order ID in the conversation, you should set the 'has_order_id' field to True and assign the order ID to the 'order_id' field.
-                """},
-            ] + chat_history,
-            response_format=OrderExtraction,
+                """
+
+def order_id_mentioned(order_id: str, chat_history: List[dict]) -> bool:
+    """Whether the ID appears in what the user wrote, to catch IDs the model made up"""
+    needle = order_id.strip().lower()
+    return bool(needle) and any(
+        needle in (message.get("content") or "").lower() for message in chat_history if message.get("role") == "user"
+    )
+
+def _is_plausible(result: OrderExtraction, chat_history: List[dict]) -> bool:
+    if result.has_order_id:
+        return bool(result.order_id) and order_id_mentioned(result.order_id, chat_history)
+    # An ID-shaped token the model missed also sends the conversation to the fallback model
+    user_messages = [message.get("content") or "" for message in chat_history if message.get("role") == "user"]
+    return not user_messages or find_order_id(strip_accents(user_messages[-1])) is None
+
+def extract_order_id(chat_history: List[dict]) -> OrderExtraction:
+    try:
+        result = parse_structured(
+            "order_extractor",
+            "llm.extract_order_id",
+            [{"role": "system", "content": ORDER_EXTRACTOR_PROMPT}] + chat_history,
+            OrderExtraction,
+            is_confident=lambda result: _is_plausible(result, chat_history),
         )
-        result = completion.choices[0].message.parsed
         logger.info(f"Order Extraction: has_order_id={result.has_order_id}, order_id={result.order_id}")
         return result
     except Exception as e:
         logger.error(f"Error extracting order ID: {str(e)}")
         # Return a default extraction to prevent crashes
+        return OrderExtraction(has_order_id=False, order_id=None)
+
+async def aextract_order_id(chat_history: List[dict]) -> OrderExtraction:
+    """Async variant of extract_order_id for the concurrent chat server"""
+    try:
+        result = await aparse_structured(
+            "order_extractor",
+            "llm.extract_order_id",
+            [{"role": "system", "content": ORDER_EXTRACTOR_PROMPT}] + chat_history,
+            OrderExtraction,
+            is_confident=lambda result: _is_plausible(result, chat_history),
+        )
+        logger.info(f"Order Extraction: has_order_id={result.has_order_id}, order_id={result.order_id}")
+        return result
+    except Exception as e:
+        logger.error(f"Error extracting order ID: {str(e)}")
         return OrderExtraction(has_order_id=False, order_id=None)
\ No newline at end of file
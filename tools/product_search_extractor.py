@@ -1,16 +1,11 @@
 import logging
-from utils.openai_client import client
 from models.schemas import ProductSearchExtraction
 from typing import List
+from utils.stage_models import parse_structured, aparse_structured
 
 logger = logging.getLogger(__name__)
 
-def extract_product_query(chat_history: List[dict]) -> ProductSearchExtraction:
-    try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": """
+PRODUCT_QUERY_PROMPT = """
                     You are the search query generator. Your task is to generate a product search query based on the conversation. 
                  
                     If the conversation does not need a search query, you should set the 'needs_search' field to False and leave the 'query' field as None.
@@ -22,14 +17,39 @@ def extract_product_query(chat_history: List[dict]) -> ProductSearchExtraction:
                     If the user says "Quiero iluminar mi sala", the search query should be "iluminar sala".
                  
                     Your query will be used in a similarity search to find the most relevant products so only include the essential keywords.
-                """},
-            ] + chat_history,
-            response_format=ProductSearchExtraction,
+                """
+
+def _is_plausible(result: ProductSearchExtraction) -> bool:
+    return not result.needs_query or bool((result.query or "").strip())
+
+def extract_product_query(chat_history: List[dict]) -> ProductSearchExtraction:
+    try:
+        result = parse_structured(
+            "product_search_extractor",
+            "llm.extract_product_query",
+            [{"role": "system", "content": PRODUCT_QUERY_PROMPT}] + chat_history,
+            ProductSearchExtraction,
+            is_confident=_is_plausible,
         )
-        result = completion.choices[0].message.parsed
         logger.info(f"Product Search Extraction: needs_query={result.needs_query}, query={result.query}")
         return result
     except Exception as e:
         logger.error(f"Error extracting product query: {str(e)}")
         # Return a default extraction to prevent crashes
+        return ProductSearchExtraction(needs_query=False, query=None)
+
+async def aextract_product_query(chat_history: List[dict]) -> ProductSearchExtraction:
+    """Async variant of extract_product_query for the concurrent chat server"""
+    try:
+        result = await aparse_structured(
+            "product_search_extractor",
+            "llm.extract_product_query",
+            [{"role": "system", "content": PRODUCT_QUERY_PROMPT}] + chat_history,
+            ProductSearchExtraction,
+            is_confident=_is_plausible,
+        )
+        logger.info(f"Product Search Extraction: needs_query={result.needs_query}, query={result.query}")
+        return result
+    except Exception as e:
+        logger.error(f"Error extracting product query: {str(e)}")
         return ProductSearchExtraction(needs_query=False, query=None)
\ No newline at end of file
@@ -0,0 +1,58 @@
+import logging
+from models.schemas import RoutingDecision
+from tools.order_extractor import order_id_mentioned
+from tools.tool_executor import TOOL_EXECUTOR_PROMPT
+from typing import List
+from utils.stage_models import KNOWN_TOOLS, parse_structured, aparse_structured
+
+logger = logging.getLogger(__name__)
+
+ROUTER_PROMPT = TOOL_EXECUTOR_PROMPT + """
+                    ADEMÁS DE ELEGIR LAS HERRAMIENTAS, EXTRAE SUS ARGUMENTOS EN LA MISMA RESPUESTA:
+
+                    - has_order_id / order_id: Si hay un ID de pedido en la conversación, pon 'has_order_id' en True y asigna el ID a 'order_id'. Si no lo hay, 'has_order_id' es False y 'order_id' es None.
+                    - needs_query / query: Si se usa search_products, pon 'needs_query' en True y asigna a 'query' solo las palabras clave esenciales para una búsqueda por similitud (por ejemplo "Quiero comprar una lampara" -> "lampara", "Quiero iluminar mi sala" -> "iluminar sala"). Si no hace falta, 'needs_query' es False y 'query' es None.
+                    - derivation_reason: Si se usa derive_to_human, escribe en español un motivo conciso y claro para el representante humano (por ejemplo "El usuario quiere realizar una compra"). Si no, déjalo en None.
+                """
+
+def _is_plausible(decision: RoutingDecision, chat_history: List[dict]) -> bool:
+    if not set(decision.tools) <= KNOWN_TOOLS:
+        return False
+    if decision.has_order_id and not (decision.order_id and order_id_mentioned(decision.order_id, chat_history)):
+        return False
+    if decision.needs_query and not (decision.query or "").strip():
+        return False
+    return "derive_to_human" not in decision.tools or bool((decision.derivation_reason or "").strip())
+
+def route_turn(chat_history: List[dict]) -> RoutingDecision:
+    """Select the tools and extract all of their arguments in a single structured call"""
+    try:
+        result = parse_structured(
+            "router",
+            "llm.route_turn",
+            [{"role": "system", "content": ROUTER_PROMPT}] + chat_history,
+            RoutingDecision,
+            is_confident=lambda result: _is_plausible(result, chat_history),
+        )
+        logger.info(f"Routing decision: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error routing conversation turn: {str(e)}")
+        # Return an empty decision to prevent crashes
+        return RoutingDecision(tools=[], has_order_id=False, needs_query=False)
+
+async def aroute_turn(chat_history: List[dict]) -> RoutingDecision:
+    """Async variant of route_turn for the concurrent chat server"""
+    try:
+        result = await aparse_structured(
+            "router",
+            "llm.route_turn",
+            [{"role": "system", "content": ROUTER_PROMPT}] + chat_history,
+            RoutingDecision,
+            is_confident=lambda result: _is_plausible(result, chat_history),
+        )
+        logger.info(f"Routing decision: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error routing conversation turn: {str(e)}")
+        return RoutingDecision(tools=[], has_order_id=False, needs_query=False)
\ No newline at end of file
@@ -1,16 +1,11 @@
 import logging
-from utils.openai_client import client
 from models.schemas import ToolExecutor
 from typing import List
+from utils.stage_models import KNOWN_TOOLS, parse_structured, aparse_structured
 
 logger = logging.getLogger(__name__)
 
-def tool_executor(chat_history: List[dict]) -> list[str]:
-    try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": """
+TOOL_EXECUTOR_PROMPT = """
                     Eres el "Ejecutor de Herramientas" para VolantiBot. Tu función es analizar la conversación del usuario y determinar qué herramientas debe activar el sistema.
 
                     HERRAMIENTAS DISPONIBLES:
@@ -43,14 +38,41 @@ def tool_executor(chat_history: List[dict]) -> list[str]:
                          * Preguntas ambiguas (intentar usar search_products primero)
 
                     IMPORTANTE: Puedes ejecutar múltiples herramientas si es necesario, pero deriva a un humano SOLO cuando estés seguro que la consulta está fuera del alcance del sistema.
-                """}
-            ] + chat_history,
-            response_format=ToolExecutor,
+                """
+
+def _is_plausible(result: ToolExecutor) -> bool:
+    return set(result.tools) <= KNOWN_TOOLS
+
+def tool_executor(chat_history: List[dict]) -> list[str]:
+    try:
+        result = parse_structured(
+            "tool_executor",
+            "llm.tool_executor",
+            [{"role": "system", "content": TOOL_EXECUTOR_PROMPT}] + chat_history,
+            ToolExecutor,
+            is_confident=_is_plausible,
         )
-        tools = completion.choices[0].message.parsed.tools
+        tools = result.tools
         logger.info(f"Tools to execute: {tools}")
         return tools
     except Exception as e:
         logger.error(f"Error determining tools to execute: {str(e)}")
         # Return an empty list to prevent crashes
+        return []
+
+async def atool_executor(chat_history: List[dict]) -> list[str]:
+    """Async variant of tool_executor for the concurrent chat server"""
+    try:
+        result = await aparse_structured(
+            "tool_executor",
+            "llm.tool_executor",
+            [{"role": "system", "content": TOOL_EXECUTOR_PROMPT}] + chat_history,
+            ToolExecutor,
+            is_confident=_is_plausible,
+        )
+        tools = result.tools
+        logger.info(f"Tools to execute: {tools}")
+        return tools
+    except Exception as e:
+        logger.error(f"Error determining tools to execute: {str(e)}")
         return []
\ No newline at end of file
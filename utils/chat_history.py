@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+from utils.openai_client import client, async_client
+from utils.transport import call_openai, acall_openai
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Load the tiktoken encoding on first use; it reads a large BPE file"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+# Token budget and maximum number of verbatim messages for each LLM stage
+STAGE_BUDGETS: Dict[str, dict] = {
+    "tool_executor": {"tokens": 1500, "messages": 8},
+    "router": {"tokens": 2000, "messages": 8},
+    "order_extractor": {"tokens": 600, "messages": 4},
+    "product_query": {"tokens": 600, "messages": 4},
+    "derivation": {"tokens": 1200, "messages": 6},
+    "response": {"tokens": 3000, "messages": 12},
+}
+
+SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+SUMMARY_PROMPT = """
+    Eres el encargado de resumir conversaciones entre un cliente y VolantiBot, un asistente de comercio electrónico.
+
+    Recibirás el resumen anterior (puede estar vacío) y los mensajes nuevos que deben incorporarse.
+    Devuelve un único resumen actualizado, en español y en pocas frases, que conserve los datos necesarios para continuar
+    la conversación: IDs de pedido, productos buscados o recomendados, problemas planteados y peticiones pendientes.
+"""
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when available, otherwise estimate ~4 characters per token"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages: List[dict]) -> int:
+    # Every chat message carries a few tokens of role/formatting overhead
+    return sum(count_tokens(message.get("content") or "") + 4 for message in messages)
+
+
+class HistoryManager:
+    """
+    Keeps LLM prompts within a per-stage token budget.
+
+    The caller still owns the full `chat_history` list. `compact` folds old messages into a rolling
+    summary (updated incrementally, one LLM call per fold) whenever the messages not summarized yet
+    no longer fit the smallest stage budget, keeping at most `keep_messages` of them. `window` then
+    returns the summary plus as many recent messages as the stage budget allows; since every budget
+    holds the unsummarized tail, no stage loses a message that the summary doesn't cover. Larger
+    stages also get recent messages that are already summarized, verbatim.
+    """
+
+    def __init__(self, keep_messages: int = 2, budgets: Optional[Dict[str, dict]] = None):
+        self.keep_messages = keep_messages
+        self.budgets = budgets or STAGE_BUDGETS
+        # The unsummarized tail must fit every stage, so it is held to the tightest limits
+        self.min_tokens = min(budget["tokens"] for budget in self.budgets.values())
+        self.min_messages = min(budget["messages"] for budget in self.budgets.values())
+        self.summary = ""
+        self.summarized_count = 0
+        self.last_window_tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def compact(self, chat_history: List[dict]):
+        """Fold old messages into the summary when the unsummarized tail outgrows the smallest stage budget"""
+        to_fold = self._messages_to_fold(chat_history)
+        if not to_fold:
+            return
+        try:
+            completion = call_openai(
+                "summary",
+                client.chat.completions.create,
+                model=SUMMARY_MODEL,
+                messages=self._summary_messages(to_fold),
+            )
+            self._apply_summary(completion.choices[0].message.content, len(to_fold))
+        except Exception as e:
+            logger.error(f"Error summarizing chat history: {str(e)}")
+
+    async def acompact(self, chat_history: List[dict]):
+        """Async variant of compact"""
+        to_fold = self._messages_to_fold(chat_history)
+        if not to_fold:
+            return
+        try:
+            completion = await acall_openai(
+                "summary",
+                async_client.chat.completions.create,
+                model=SUMMARY_MODEL,
+                messages=self._summary_messages(to_fold),
+            )
+            self._apply_summary(completion.choices[0].message.content, len(to_fold))
+        except Exception as e:
+            logger.error(f"Error summarizing chat history: {str(e)}")
+
+    def window(self, chat_history: List[dict], stage: str) -> List[dict]:
+        """Return the summary and the recent messages that fit the budget of `stage`"""
+        budget = self.budgets.get(stage, self.budgets["response"])
+        with self._lock:
+            summary = self.summary
+            summarized_count = self.summarized_count
+
+        if len(chat_history) <= summarized_count:
+            return []
+
+        prefix = [self._summary_message(summary)] if summary else []
+        used = count_message_tokens(prefix)
+        # The latest message is always kept, even if it alone exceeds the budget
+        selected = [chat_history[-1]]
+        used += count_message_tokens(selected)
+        if used > budget["tokens"]:
+            logger.warning(f"Last message alone uses {used} tokens, over the {stage} budget of {budget['tokens']}")
+
+        for message in reversed(chat_history[:-1]):
+            if len(selected) >= budget["messages"]:
+                break
+            cost = count_message_tokens([message])
+            if used + cost > budget["tokens"]:
+                break
+            selected.insert(0, message)
+            used += cost
+
+        unsummarized = len(chat_history) - summarized_count
+        if len(selected) < unsummarized:
+            # Only when folding failed: the summary doesn't cover the trimmed messages, so dropping
+            # them would lose e.g. an order ID given a few turns ago
+            logger.warning(f"{stage} window is over budget: {unsummarized} messages are not summarized yet")
+            selected = chat_history[summarized_count:]
+            used = count_message_tokens(prefix + selected)
+
+        self.last_window_tokens[stage] = used
+        logger.info(f"History window for {stage}: {len(prefix) + len(selected)} messages, {used}/{budget['tokens']} tokens")
+        return prefix + selected
+
+    def _fits(self, tail: List[dict], summary: str) -> bool:
+        """Whether the summary and `tail` fit the smallest stage budget"""
+        if len(tail) > self.min_messages:
+            return False
+        summary_tokens = count_message_tokens([self._summary_message(summary)]) if summary else 0
+        return summary_tokens + count_message_tokens(tail) <= self.min_tokens
+
+    def _messages_to_fold(self, chat_history: List[dict]) -> List[dict]:
+        with self._lock:
+            tail = chat_history[self.summarized_count:]
+            if self._fits(tail, self.summary):
+                return []
+            # Keep up to keep_messages verbatim, fewer when they alone don't fit; the latest message always stays
+            keep = max(1, min(self.keep_messages, self.min_messages, len(tail) - 1))
+            while keep > 1 and not self._fits(tail[-keep:], self.summary):
+                keep -= 1
+            return tail[:len(tail) - keep]
+
+    @staticmethod
+    def _summary_message(summary: str) -> dict:
+        return {"role": "system", "content": f"Resumen de la conversación anterior: {summary}"}
+
+    def _summary_messages(self, to_fold: List[dict]) -> List[dict]:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in to_fold)
+        return [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Resumen anterior:\n{self.summary or '(vacío)'}\n\nMensajes nuevos:\n{transcript}"},
+        ]
+
+    def _apply_summary(self, summary: str, folded: int):
+        with self._lock:
+            self.summary = summary.strip()
+            self.summarized_count += folded
+        logger.info(f"Folded {folded} messages into the summary ({count_tokens(self.summary)} tokens)")
+
+
+def stage_history(chat_history: List[dict], history: Optional[HistoryManager], stage: str) -> List[dict]:
+    """Window `chat_history` for `stage` when a HistoryManager is in use, otherwise pass it through"""
+    return history.window(chat_history, stage) if history else chat_history
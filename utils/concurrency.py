@@ -0,0 +1,61 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "20"))
+MAX_TOOL_WORKERS = int(os.getenv("MAX_TOOL_WORKERS", "8"))
+
+# Shared across turns so each turn doesn't pay for spawning new threads
+_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool")
+
+
+def run_concurrently(
+    calls: Sequence[Callable[[], Any]],
+    timeout: float = TOOL_TIMEOUT,
+    fallback: Optional[Callable[[int], Any]] = None,
+) -> List[Any]:
+    """
+    Run independent calls in the shared thread pool and return their results in input order.
+
+    Every call gets `timeout` seconds from the moment a worker starts it, so time spent queued
+    behind other turns (or behind timed-out calls still holding a worker) isn't counted against
+    it; a call still queued `timeout` seconds after submission is cancelled instead. When a call
+    times out, is cancelled or raises, `fallback(i)` is used as its result (None by default);
+    timed-out calls are left to finish in the background.
+    """
+    started = [threading.Event() for _ in calls]
+    start_times = [0.0] * len(calls)
+
+    def timed(i: int, call: Callable[[], Any]) -> Any:
+        start_times[i] = time.monotonic()
+        started[i].set()
+        return call()
+
+    submitted = time.monotonic()
+    # Copy the caller's context so tracing spans opened in workers nest under the caller's span
+    futures = [_executor.submit(contextvars.copy_context().run, timed, i, call) for i, call in enumerate(calls)]
+    results = []
+    for i, future in enumerate(futures):
+        try:
+            if not started[i].wait(max(0.0, submitted + timeout - time.monotonic())):
+                if future.cancel():
+                    logger.error(f"Concurrent call {i} was still queued after {timeout}s")
+                    results.append(fallback(i) if fallback else None)
+                    continue
+                # A worker picked it up just now
+                started[i].wait()
+            results.append(future.result(timeout=max(0.0, start_times[i] + timeout - time.monotonic())))
+        except FutureTimeoutError:
+            logger.error(f"Concurrent call {i} timed out after {timeout}s")
+            future.cancel()
+            results.append(fallback(i) if fallback else None)
+        except Exception as e:
+            logger.error(f"Concurrent call {i} failed: {str(e)}")
+            results.append(fallback(i) if fallback else None)
+    return results
@@ -0,0 +1,145 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings.
+
+    A bounded in-process LRU sits in front of an optional SQLite store on disk,
+    so repeated queries survive restarts. Entries are keyed by normalized query
+    text and model name and expire after `ttl` seconds in both tiers.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 7 * 24 * 3600, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._memory: "OrderedDict[tuple, tuple[float, list[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT NOT NULL, query TEXT NOT NULL, created_at REAL NOT NULL, embedding BLOB NOT NULL, "
+                    "PRIMARY KEY (model, query))"
+                )
+                self._db.commit()
+            except Exception as e:
+                logger.error(f"Error opening embedding cache at {path}: {str(e)}")
+                self._db = None
+
+    def get(self, query: str, model: str) -> Optional[list[float]]:
+        key = (model, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, embedding = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return embedding
+                del self._memory[key]
+
+            embedding = self._disk_get(key, now)
+            if embedding is not None:
+                self.disk_hits += 1
+                return embedding
+
+            self.misses += 1
+            return None
+
+    def set(self, query: str, model: str, embedding: list[float]):
+        key = (model, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            self._memory_set(key, now, embedding)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (model, query, created_at, embedding) VALUES (?, ?, ?, ?)",
+                        (key[0], key[1], now, array("d", embedding).tobytes()),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.error(f"Error writing embedding cache entry: {str(e)}")
+
+    def close(self):
+        """Stop using the disk tier; later entries only live in memory"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _memory_set(self, key: tuple, created_at: float, embedding: list[float]):
+        self._memory[key] = (created_at, embedding)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: tuple, now: float) -> Optional[list[float]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT created_at, embedding FROM embeddings WHERE model = ? AND query = ?", key
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Error reading embedding cache entry: {str(e)}")
+            return None
+        if row is None:
+            return None
+        created_at, blob = row
+        if now - created_at > self.ttl:
+            return None
+        embedding = array("d", blob).tolist()
+        # Promote to the in-process tier, keeping the original creation time for TTL purposes
+        self._memory_set(key, created_at, embedding)
+        return embedding
+
+
+embedding_cache = EmbeddingCache(
+    max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600))),
+    path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3") or None,
+)
@@ -1,10 +1,61 @@
-from openai import OpenAI
 import os
 import logging
+import threading
+from utils.embedding_cache import embedding_cache
+from utils.single_flight import SingleFlight
+from utils.tracing import span
+from utils.transport import call_openai, acall_openai, create_http_client, create_async_http_client
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+class LazyClient:
+    """
+    Stand-in that creates the real client on first attribute access.
+
+    Importing the openai package and building its HTTP pool takes about a second, so modules
+    can import `client` freely and only the first API call (or warm_up) pays for it.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _create_client():
+    from openai import OpenAI
+    # Retries are done by utils.transport, which also hedges; the SDK's own would multiply them
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=create_http_client(), max_retries=0)
+
+def _create_async_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=create_async_http_client(), max_retries=0)
+
+client = LazyClient(_create_client)
+async_client = LazyClient(_create_async_client)
+
+def warm_up():
+    """Create the client and open a pooled connection with a free request, so the first turn skips the TLS handshake"""
+    try:
+        with span("warmup.openai"):
+            client.models.list()
+    except Exception as e:
+        logger.warning(f"OpenAI warm-up failed: {str(e)}")
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+embedding_flights = SingleFlight("embedding")
 
 def generate_query_embedding(query: str) -> list[float]:
     """
@@ -13,14 +64,61 @@ def generate_query_embedding(query: str) -> list[float]:
     :param query: La consulta de búsqueda del usuario.
     :return: Lista de floats que representan el embedding.
     """
+    cached = embedding_cache.get(query, EMBEDDING_MODEL)
+    if cached is not None:
+        logger.info(f"Embedding cache hit for query: {query[:30]}...")
+        return cached
+
+    # Sessions asking the same thing at once share one request
+    return embedding_flights.do((EMBEDDING_MODEL, query), lambda: _create_embedding(query))
+
+async def agenerate_query_embedding(query: str) -> list[float]:
+    """
+    Variante asíncrona de generate_query_embedding, comparte la misma caché.
+    
+    :param query: La consulta de búsqueda del usuario.
+    :return: Lista de floats que representan el embedding.
+    """
+    cached = embedding_cache.get(query, EMBEDDING_MODEL)
+    if cached is not None:
+        logger.info(f"Embedding cache hit for query: {query[:30]}...")
+        return cached
+
+    return await embedding_flights.ado((EMBEDDING_MODEL, query), lambda: _acreate_embedding(query))
+
+def _create_embedding(query: str) -> list[float]:
+    try:
+        with span("llm.embedding", model=EMBEDDING_MODEL) as stage:
+            response = call_openai(
+                "embedding",
+                client.embeddings.create,
+                model=EMBEDDING_MODEL,
+                input=query
+            )
+            stage.record_usage(response)
+        logger.info(f"Successfully generated embedding for query: {query[:30]}...")
+        embedding = response.data[0].embedding
+        embedding_cache.set(query, EMBEDDING_MODEL, embedding)
+        return embedding
+    except Exception as e:
+        logger.error(f"Error generating embedding: {str(e)}")
+        # Return a zero vector of appropriate length as fallback (never cached)
+        return [0.0] * 1536  # Default dimension for text-embedding-ada-002
+
+async def _acreate_embedding(query: str) -> list[float]:
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=query
-        )
+        with span("llm.embedding", model=EMBEDDING_MODEL) as stage:
+            response = await acall_openai(
+                "embedding",
+                async_client.embeddings.create,
+                model=EMBEDDING_MODEL,
+                input=query
+            )
+            stage.record_usage(response)
         logger.info(f"Successfully generated embedding for query: {query[:30]}...")
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        embedding_cache.set(query, EMBEDDING_MODEL, embedding)
+        return embedding
     except Exception as e:
         logger.error(f"Error generating embedding: {str(e)}")
-        # Return a zero vector of appropriate length as fallback
-        return [0.0] * 1536  # Default dimension for text-embedding-ada-002
\ No newline at end of file
+        return [0.0] * 1536
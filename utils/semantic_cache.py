@@ -0,0 +1,186 @@
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, strip accents, punctuation and repeated whitespace so near-identical messages embed identically"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    text = re.sub(r"[¿?¡!.,;:]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+# Words that don't change what is being asked; everything else (products, colours, sizes, "sin", "mas") does
+STOPWORDS = frozenset("""
+    a al algo algun alguna algunas alguno algunos buenas buenos busco buscando comprar como cual cuales de del dia
+    donde el ella en es esa ese esta estan este estos estas favor gracias gustaria hay hola la las le les lo los me
+    mi mis necesito o para podria podrian por porfa puede puedes que quiero quisiera se su sus tardes te tendran
+    tendrias tenes tiene tienen tu tus un una unas uno unos venden ver y ya
+""".split())
+
+
+def query_terms(text: str) -> tuple:
+    """
+    Content words of a message, singularized and sorted, for keying cached answers.
+
+    Embeddings of "auriculares rojos" and "auriculares negros" can be closer than a paraphrase of either,
+    so the cache requires the same terms on a hit and leaves the embedding threshold to absorb word order,
+    filler words and typos.
+    """
+    terms = set()
+    for word in normalize_message(text).split():
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("es") and word[-3] in "lnrdzj":
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        terms.add(word)
+    return tuple(sorted(terms))
+
+
+class SemanticCache:
+    """
+    Cache of final answers keyed by message embedding and tool context.
+
+    A lookup hits when an unexpired entry has exactly the same context (e.g. the earlier turns of
+    the conversation, the order ID and the query terms of the message) and its embedding's cosine similarity
+    to the query is at least `threshold`. Entries remember the tools that produced them, so catalog
+    or order changes can drop the affected answers.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_key = 0
+        # Stacked embeddings for vectorized lookups, rebuilt lazily after the entries change
+        self._keys: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, embedding: Sequence[float], context: Hashable = None) -> Optional[dict]:
+        """Return the best matching entry ({'response', 'tool_results', 'similarity', ...}) or None"""
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+        now = time.time()
+        with self._lock:
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key]["embedding"] for key in self._keys]) if self._keys else None
+
+            if self._matrix is not None and self._matrix.shape[1] == len(query):
+                similarities = self._matrix @ query
+                for position in np.argsort(-similarities):
+                    if similarities[position] < self.threshold:
+                        break
+                    key = self._keys[position]
+                    entry = self._entries.get(key)
+                    if entry is None or entry["context"] != context:
+                        continue
+                    if now > entry["expires_at"]:
+                        self._remove(key)
+                        continue
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return {**entry, "similarity": float(similarities[position])}
+
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        embedding: Sequence[float],
+        context: Hashable,
+        tools: List[str],
+        response: str,
+        tool_results: List[dict],
+        order_id: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ):
+        """Cache an answer; `ttl` shortens the cache-wide TTL for answers that go stale sooner"""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            if self._entries and len(next(iter(self._entries.values()))["embedding"]) != len(vector):
+                # A different embedding model; old entries can no longer be compared
+                self._entries.clear()
+            self._entries[self._next_key] = {
+                "embedding": vector,
+                "context": context,
+                "tools": list(tools),
+                "order_id": order_id,
+                "response": response,
+                "tool_results": tool_results,
+                "created_at": time.time(),
+                "expires_at": time.time() + (self.ttl if ttl is None else min(ttl, self.ttl)),
+            }
+            self._next_key += 1
+            self._matrix = None
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tool: Optional[str] = None, order_id: Optional[str] = None) -> int:
+        """Drop entries produced by `tool` and/or about `order_id`; with no arguments, drop everything"""
+        with self._lock:
+            if tool is None and order_id is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._matrix = None
+                return dropped
+            stale = [
+                key for key, entry in self._entries.items()
+                if (tool is None or tool in entry["tools"]) and (order_id is None or entry["order_id"] == order_id)
+            ]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _remove(self, key: int):
+        del self._entries[key]
+        self._matrix = None
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        # The embedding fallback is a zero vector; it must never match anything
+        if norm == 0:
+            return None
+        return vector / norm
+
+
+semantic_cache = SemanticCache(
+    max_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+logger = logging.getLogger(__name__)
+
+_groups: List["SingleFlight"] = []
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one.
+
+    While a call for `key` is in flight, further callers with the same key wait for it and get its
+    result (or exception) instead of issuing their own. Nothing is kept once the call finishes, so
+    this complements caches rather than replacing them. Callers share the returned object and must
+    not mutate it. Threads and coroutines are tracked separately: `do` for blocking callers,
+    `ado` for callers on an event loop.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[tuple, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        _groups.append(self)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        task = self._tasks.get(flight_key)
+        if task is None:
+            # The call runs as its own task, so cancelling the caller that started it doesn't fail the others
+            task = self._tasks[flight_key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finished(flight_key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, flight_key: tuple, task: asyncio.Future):
+        self._tasks.pop(flight_key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so an error nobody awaited anymore isn't reported as never retrieved
+            logger.debug(f"{self.name} call failed: {task.exception()}")
+
+    def stats(self) -> dict:
+        total = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+            "in_flight": len(self._calls) + len(self._tasks),
+        }
+
+
+def single_flight_stats() -> dict:
+    return {group.name: group.stats() for group in _groups}
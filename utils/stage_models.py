@@ -0,0 +1,149 @@
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, List, Optional, Type, TypeVar
+from pydantic import BaseModel
+from utils.openai_client import client, async_client
+from utils.tracing import span
+from utils.transport import call_openai, acall_openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+# Model used by each LLM stage; simple extractions default to the small model and escalate when needed
+STAGE_MODELS = {
+    "tool_executor": os.getenv("MODEL_TOOL_EXECUTOR", "gpt-4o"),
+    "router": os.getenv("MODEL_ROUTER", "gpt-4o"),
+    "order_extractor": os.getenv("MODEL_ORDER_EXTRACTOR", "gpt-4o-mini"),
+    "product_search_extractor": os.getenv("MODEL_PRODUCT_SEARCH_EXTRACTOR", "gpt-4o-mini"),
+    "derivation_logger": os.getenv("MODEL_DERIVATION_LOGGER", "gpt-4o-mini"),
+    "response": os.getenv("MODEL_RESPONSE", "gpt-4o"),
+}
+# Stronger model retried when a structured stage fails to parse, refuses or returns an implausible result
+FALLBACK_MODEL = os.getenv("MODEL_FALLBACK", "gpt-4o")
+# Minimum mean token probability of a structured answer; 0 disables the check (and the logprobs request)
+MIN_CONFIDENCE = float(os.getenv("MODEL_MIN_CONFIDENCE", "0"))
+
+KNOWN_TOOLS = {"get_order_status", "search_products", "derive_to_human"}
+
+_stats = defaultdict(lambda: {"calls": 0, "fallbacks": 0})
+_stats_lock = threading.Lock()
+
+
+def model_for(stage: str) -> str:
+    return STAGE_MODELS.get(stage, STAGE_MODELS["response"])
+
+
+def model_stats() -> dict:
+    with _stats_lock:
+        return {stage: {**counts, "model": model_for(stage)} for stage, counts in _stats.items()}
+
+
+def _count(stage: str, fallback: bool):
+    with _stats_lock:
+        _stats[stage]["calls"] += 1
+        _stats[stage]["fallbacks"] += 1 if fallback else 0
+
+
+def confidence(completion) -> Optional[float]:
+    """Mean token probability of the answer, or None when the response carries no logprobs"""
+    tokens = getattr(getattr(completion.choices[0], "logprobs", None), "content", None)
+    if not tokens:
+        return None
+    return math.exp(sum(token.logprob for token in tokens) / len(tokens))
+
+
+def _request(model: str, messages: List[dict], response_format: Type[T]) -> dict:
+    request = {"model": model, "messages": messages, "response_format": response_format}
+    if MIN_CONFIDENCE > 0:
+        request["logprobs"] = True
+    return request
+
+
+def _accept(stage: str, model: str, completion, is_confident: Optional[Callable[[T], bool]]) -> Optional[T]:
+    """The parsed result when it can be used as is, None when the stage should escalate"""
+    parsed = completion.choices[0].message.parsed
+    if parsed is None:
+        logger.warning(f"{stage} on {model} returned no parsed result")
+        return None
+    score = confidence(completion) if MIN_CONFIDENCE > 0 else None
+    if score is not None and score < MIN_CONFIDENCE:
+        logger.warning(f"{stage} on {model} has low confidence ({score:.2f})")
+        return None
+    if is_confident is not None and not is_confident(parsed):
+        logger.warning(f"{stage} on {model} returned an implausible result: {parsed}")
+        return None
+    return parsed
+
+
+def parse_structured(
+    stage: str,
+    span_name: str,
+    messages: List[dict],
+    response_format: Type[T],
+    is_confident: Optional[Callable[[T], bool]] = None,
+) -> T:
+    """
+    Structured-output call on the stage's model, escalating once to FALLBACK_MODEL.
+
+    The fallback runs when the first call raises, refuses, is below MIN_CONFIDENCE or fails the
+    stage's `is_confident` check. If the fallback is no better, the first usable result is returned;
+    with none at all the last error is raised.
+    """
+    models = [model_for(stage)]
+    if FALLBACK_MODEL and FALLBACK_MODEL != models[0]:
+        models.append(FALLBACK_MODEL)
+
+    candidate, error = None, None
+    for attempt, model in enumerate(models):
+        try:
+            with span(span_name, model=model, fallback=attempt > 0) as stage_span:
+                completion = call_openai("extraction", client.beta.chat.completions.parse, **_request(model, messages, response_format))
+                stage_span.record_usage(completion)
+            result = _accept(stage, model, completion, is_confident)
+            if result is not None:
+                _count(stage, attempt > 0)
+                return result
+            candidate = candidate or completion.choices[0].message.parsed
+        except Exception as e:
+            logger.warning(f"{stage} on {model} failed: {str(e)}")
+            error = e
+    _count(stage, len(models) > 1)
+    if candidate is not None:
+        return candidate
+    raise error or ValueError(f"{stage} returned no result")
+
+
+async def aparse_structured(
+    stage: str,
+    span_name: str,
+    messages: List[dict],
+    response_format: Type[T],
+    is_confident: Optional[Callable[[T], bool]] = None,
+) -> T:
+    """Async variant of parse_structured"""
+    models = [model_for(stage)]
+    if FALLBACK_MODEL and FALLBACK_MODEL != models[0]:
+        models.append(FALLBACK_MODEL)
+
+    candidate, error = None, None
+    for attempt, model in enumerate(models):
+        try:
+            with span(span_name, model=model, fallback=attempt > 0) as stage_span:
+                completion = await acall_openai("extraction", async_client.beta.chat.completions.parse, **_request(model, messages, response_format))
+                stage_span.record_usage(completion)
+            result = _accept(stage, model, completion, is_confident)
+            if result is not None:
+                _count(stage, attempt > 0)
+                return result
+            candidate = candidate or completion.choices[0].message.parsed
+        except Exception as e:
+            logger.warning(f"{stage} on {model} failed: {str(e)}")
+            error = e
+    _count(stage, len(models) > 1)
+    if candidate is not None:
+        return candidate
+    raise error or ValueError(f"{stage} returned no result")
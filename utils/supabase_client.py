@@ -0,0 +1,25 @@
+import os
+import threading
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_supabase_client():
+    """Create a Supabase client from the SUPABASE_URL and SUPABASE_KEY environment variables"""
+    # Imported here: the supabase package takes ~0.5s to import and most entry points need it only later
+    from supabase import ClientOptions, create_client
+    from utils.transport import create_http_client
+    # One pooled keep-alive client with the database timeout; reads are retried by utils.transport
+    options = ClientOptions(httpx_client=create_http_client("db"))
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"), options=options)
+
+
+def get_supabase_client():
+    """Return the process-wide Supabase client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_supabase_client()
+    return _client
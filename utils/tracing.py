@@ -0,0 +1,187 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+# JSON lines file that receives one record per finished span; empty to keep spans in memory only
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# Numeric attributes summed per span name for the metrics endpoint
+_AGGREGATED = ("prompt_tokens", "completion_tokens", "rows", "bytes")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_file = None
+_stats: Dict[str, dict] = defaultdict(lambda: {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, **{k: 0 for k in _AGGREGATED}})
+_listeners = []
+
+
+class Span:
+    """
+    A timed stage of a turn.
+
+    Spans nest through a context variable, so a span opened inside another (including in
+    worker threads started with a copied context) shares its trace id and records its parent.
+    """
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _export(self, duration_ms)
+        return False
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def record_usage(self, completion):
+        """Copy token usage from an OpenAI response, if it reports any"""
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            self.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+            self.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+    def record_rows(self, data):
+        """Record how many rows a database response returned and their approximate JSON size"""
+        rows = data if isinstance(data, list) else [data]
+        self.add("rows", len(rows))
+        self.add("bytes", _approximate_json_size(rows))
+
+
+def _approximate_json_size(value: Any) -> int:
+    """Estimate the JSON length of a response without serializing it; vectors are sized from their length"""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return sum(len(key) + 4 + _approximate_json_size(item) for key, item in value.items()) + 2
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], float):
+            # An embedding: about 20 characters per serialized float
+            return len(value) * 20 + 2
+        return sum(_approximate_json_size(item) + 1 for item in value) + 1
+    return 8 if isinstance(value, (int, float)) else 4
+
+
+class _NoopSpan:
+    """Shared stand-in returned while tracing is disabled, so instrumentation costs one call"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def record_usage(self, completion):
+        pass
+
+    def record_rows(self, data):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """Context manager timing a stage; a no-op when tracing is disabled"""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def set_tracing(enabled: bool, trace_file: Optional[str] = None):
+    """Enable or disable tracing at runtime (e.g. from a CLI flag or a benchmark)"""
+    global TRACING_ENABLED, TRACE_FILE, _file
+    with _lock:
+        TRACING_ENABLED = enabled
+        if trace_file is not None and trace_file != TRACE_FILE:
+            if _file is not None:
+                _file.close()
+                _file = None
+            TRACE_FILE = trace_file
+
+
+def add_listener(callback):
+    """Register `callback(record)` to receive every finished span record"""
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def span_stats() -> Dict[str, dict]:
+    """Aggregated metrics per span name since start-up"""
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def _export(finished: Span, duration_ms: float):
+    global _file
+    record = {
+        "trace_id": finished.trace_id,
+        "span_id": finished.span_id,
+        "parent_id": finished.parent_id,
+        "name": finished.name,
+        "start": finished.start_time,
+        "duration_ms": round(duration_ms, 3),
+        **finished.attributes,
+    }
+    with _lock:
+        stats = _stats[finished.name]
+        stats["count"] += 1
+        stats["errors"] += 1 if "error" in finished.attributes else 0
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        for key in _AGGREGATED:
+            value = finished.attributes.get(key)
+            if isinstance(value, (int, float)):
+                stats[key] += value
+
+        if TRACE_FILE:
+            try:
+                if _file is None:
+                    _file = open(TRACE_FILE, "a", encoding="utf-8")
+                _file.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+                _file.flush()
+            except Exception as e:
+                logger.error(f"Error writing trace record: {str(e)}")
+
+    for listener in list(_listeners):
+        try:
+            listener(record)
+        except Exception as e:
+            logger.error(f"Error in trace listener: {str(e)}")
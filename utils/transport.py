@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by every request of a client; keep-alive avoids a TLS handshake per call
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+# Seconds one attempt of each call type may take; a stuck call is retried instead of holding up the turn
+CALL_TIMEOUTS = {
+    "embedding": float(os.getenv("TIMEOUT_EMBEDDING", "10")),
+    "extraction": float(os.getenv("TIMEOUT_EXTRACTION", "20")),
+    "summary": float(os.getenv("TIMEOUT_SUMMARY", "30")),
+    "response": float(os.getenv("TIMEOUT_RESPONSE", "60")),
+    "db": float(os.getenv("TIMEOUT_DB", "15")),
+}
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))  # retries after the first attempt
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+
+# Hedging: when an idempotent call is slower than the recent p95 for its type, send a duplicate and take the first answer
+HEDGED_REQUESTS = os.getenv("HEDGED_REQUESTS", "false").lower() in ("1", "true", "yes")
+HEDGE_KINDS = frozenset(kind.strip() for kind in os.getenv("HEDGE_KINDS", "embedding,extraction").split(",") if kind.strip())
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2.0"))  # until enough latencies have been observed
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.1"))
+HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_STATUS = {408, 409, 429}
+# Connection-level failures, by class name so neither openai nor httpx has to be imported here
+RETRYABLE_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ConnectError", "ConnectTimeout", "ReadError", "ReadTimeout", "WriteError", "WriteTimeout",
+    "PoolTimeout", "RemoteProtocolError", "TimeoutError",
+}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_WORKERS", "32")), thread_name_prefix="hedge")
+
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def http_timeout(kind: str):
+    import httpx
+    return httpx.Timeout(CALL_TIMEOUTS.get(kind, CALL_TIMEOUTS["response"]), connect=HTTP_CONNECT_TIMEOUT)
+
+
+def create_http_client(kind: str = "response", **kwargs):
+    """httpx client with the shared pool limits; `kind` sets its default timeout"""
+    import httpx
+    return httpx.Client(limits=_http_limits(), timeout=http_timeout(kind), **kwargs)
+
+
+def create_async_http_client(kind: str = "response", **kwargs):
+    import httpx
+    return httpx.AsyncClient(limits=_http_limits(), timeout=http_timeout(kind), **kwargs)
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        # postgrest's APIError carries the HTTP status as a string code when the body isn't a PostgREST error
+        code = getattr(error, "code", None)
+        status = int(code) if isinstance(code, str) and code.isdigit() else None
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Throttling, server errors, timeouts and dropped connections; client errors are not retried"""
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff, honouring a Retry-After header when the server sends one"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+        if 0 <= retry_after <= RETRY_MAX_DELAY:
+            return retry_after
+    except (TypeError, ValueError):
+        pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+class TransportStats:
+    """Recent latencies per call type (for hedge delays) plus retry and hedge counters"""
+
+    def __init__(self, window: int = 200):
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self.retries = defaultdict(int)
+        self.hedges = defaultdict(int)
+        self.hedge_wins = defaultdict(int)
+
+    def record(self, kind: str, seconds: float):
+        with self._lock:
+            self._latencies[kind].append(seconds)
+
+    def p95(self, kind: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies[kind])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def hedge_delay(self, kind: str) -> float:
+        p95 = self.p95(kind)
+        return max(HEDGE_MIN_DELAY, p95 if p95 is not None else HEDGE_DEFAULT_DELAY)
+
+    def snapshot(self) -> dict:
+        kinds = sorted(set(self._latencies) | set(self.retries) | set(self.hedges))
+        return {
+            kind: {
+                "retries": self.retries[kind],
+                "hedges": self.hedges[kind],
+                "hedge_wins": self.hedge_wins[kind],
+                "p95_ms": (self.p95(kind) or 0.0) * 1000,
+            }
+            for kind in kinds
+        }
+
+
+stats = TransportStats()
+
+
+def transport_stats() -> dict:
+    return stats.snapshot()
+
+
+def _should_hedge(kind: str, hedge: Optional[bool]) -> bool:
+    return HEDGED_REQUESTS and kind in HEDGE_KINDS if hedge is None else hedge
+
+
+def _timed(kind: str, fn: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    result = fn()
+    stats.record(kind, time.perf_counter() - start)
+    return result
+
+
+def _hedged(kind: str, fn: Callable[[], Any]) -> Any:
+    """Run fn; if it hasn't answered after the hedge delay, run a duplicate and return whichever succeeds first"""
+    # Each copy runs in a copy of the caller's context so tracing spans nest under the caller's span
+    primary = _hedge_executor.submit(contextvars.copy_context().run, _timed, kind, fn)
+    done, _ = wait([primary], timeout=stats.hedge_delay(kind))
+    if done:
+        return primary.result()
+
+    stats.hedges[kind] += 1
+    backup = _hedge_executor.submit(contextvars.copy_context().run, _timed, kind, fn)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    stats.hedge_wins[kind] += 1
+                # The slower copy is left to finish in the background; its answer is discarded
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_retry(kind: str, fn: Callable[[], Any], hedge: Optional[bool] = None) -> Any:
+    """
+    Call fn() with jittered exponential backoff on throttling, 5xx and connection errors.
+
+    Only pass idempotent calls when hedging: with `hedge` (default: HEDGED_REQUESTS for the
+    kinds in HEDGE_KINDS) a slow attempt gets a duplicate and the first answer wins.
+    """
+    hedged = _should_hedge(kind, hedge)
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        try:
+            return _hedged(kind, fn) if hedged else _timed(kind, fn)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+            stats.retries[kind] += 1
+            logger.warning(f"{kind} call failed ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+async def _atimed(kind: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    start = time.perf_counter()
+    result = await fn()
+    stats.record(kind, time.perf_counter() - start)
+    return result
+
+
+async def _ahedged(kind: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    primary = asyncio.ensure_future(_atimed(kind, fn))
+    done, _ = await asyncio.wait({primary}, timeout=stats.hedge_delay(kind))
+    if done:
+        return primary.result()
+
+    stats.hedges[kind] += 1
+    backup = asyncio.ensure_future(_atimed(kind, fn))
+    pending = {primary, backup}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        stats.hedge_wins[kind] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def acall_with_retry(kind: str, fn: Callable[[], Awaitable[Any]], hedge: Optional[bool] = None) -> Any:
+    """Async variant of call_with_retry; `fn` returns a new awaitable on every call"""
+    hedged = _should_hedge(kind, hedge)
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        try:
+            return await (_ahedged(kind, fn) if hedged else _atimed(kind, fn))
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+            stats.retries[kind] += 1
+            logger.warning(f"{kind} call failed ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+def call_openai(kind: str, method: Callable[..., Any], hedge: Optional[bool] = None, **kwargs) -> Any:
+    """Call an OpenAI client method with the per-call-type timeout, retries and optional hedging"""
+    kwargs.setdefault("timeout", CALL_TIMEOUTS.get(kind, CALL_TIMEOUTS["response"]))
+    return call_with_retry(kind, lambda: method(**kwargs), hedge=hedge)
+
+
+async def acall_openai(kind: str, method: Callable[..., Awaitable[Any]], hedge: Optional[bool] = None, **kwargs) -> Any:
+    kwargs.setdefault("timeout", CALL_TIMEOUTS.get(kind, CALL_TIMEOUTS["response"]))
+    return await acall_with_retry(kind, lambda: method(**kwargs), hedge=hedge)
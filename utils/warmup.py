@@ -0,0 +1,51 @@
+import logging
+import os
+import threading
+from typing import Optional
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+def warm_up(supabase):
+    """
+    Pay the first turn's one-off costs ahead of time.
+
+    Opens the pooled OpenAI and Supabase connections with cheap requests, loads the product
+    index, the tokenizer and, with ROUTER_MODE=embedding, the intent prototype embeddings.
+    Every step is best effort; a failure only means the first turn pays for it as it would
+    without warm-up.
+    """
+    from utils import openai_client
+    from utils.chat_history import _get_encoding
+
+    with span("warmup"):
+        openai_client.warm_up()
+        try:
+            with span("warmup.supabase"):
+                supabase.table("orders").select("id").limit(1).execute()
+        except Exception as e:
+            logger.warning(f"Supabase warm-up failed: {str(e)}")
+        try:
+            with span("warmup.product_index"):
+                from services.product_index import get_product_index
+                get_product_index(supabase)
+        except Exception as e:
+            logger.warning(f"Product index warm-up failed: {str(e)}")
+        with span("warmup.tokenizer"):
+            _get_encoding()
+        from services.chat_service import ROUTER_MODE
+        if ROUTER_MODE == "embedding":
+            from tools.intent_classifier import intent_classifier
+            intent_classifier.load()
+
+
+def start_warmup(supabase) -> Optional[threading.Thread]:
+    """Run warm_up in a daemon thread, e.g. while the CLI prints its banner; None when STARTUP_WARMUP is off"""
+    if not STARTUP_WARMUP:
+        return None
+    thread = threading.Thread(target=warm_up, args=(supabase,), name="warmup", daemon=True)
+    thread.start()
+    return thread